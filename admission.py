@@ -0,0 +1,139 @@
+"""
+Контроль нагрузки: при перегрузке откладываем и отбрасываем второстепенную работу
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Уровни нагрузки
+NORMAL = 0
+# Уборка сообщений откладывается, меню редактируется на месте вместо отправки нового
+DEGRADED = 1
+# Вдобавок не показываем статистику и рейтинги
+SHEDDING = 2
+
+LEVEL_NAMES = {NORMAL: "норма", DEGRADED: "откладываем уборку", SHEDDING: "отказываем в статистике"}
+
+# Экраны, без которых можно обойтись под нагрузкой: кнопки и команды
+SHEDDABLE_CALLBACKS = ("show_stats", "show_top")
+SHEDDABLE_COMMANDS = ("/top",)
+
+
+def is_sheddable(update: Any) -> bool:
+    """Второстепенное ли обновление: статистика и рейтинги, а не ответы и вопросы"""
+    query = update.callback_query
+    if query is not None:
+        return query.data in SHEDDABLE_CALLBACKS
+    message = update.message
+    if message is None or not message.text:
+        return False
+    command = message.text.split(maxsplit=1)[0].split("@", 1)[0]
+    return command in SHEDDABLE_COMMANDS
+
+
+class AdmissionController:
+    """Оценивает, сколько обновление простоит в очереди, и решает, что можно не делать
+
+    Ожидание оценивается как (обновлений в очереди + в обработке) x среднее
+    время обработчика. Проверка ответа и следующий вопрос выполняются всегда:
+    режутся только экраны статистики, удаление старых сообщений и повторная
+    отправка меню.
+    """
+
+    def __init__(self, degrade_wait: float = 1.0, shed_wait: float = 3.0,
+                 max_deferred: int = 10000, smoothing: float = 0.2):
+        self.degrade_wait = degrade_wait
+        self.shed_wait = shed_wait
+        self.smoothing = smoothing
+        # Очередь обновлений приложения; задается при старте (в шардированном воркере ее нет)
+        self.queue_depth: Callable[[], int] = lambda: 0
+        self.in_flight = 0
+        self.avg_latency = 0.0
+        self.level = NORMAL
+        self._deferred: Deque[Callable[[], Awaitable]] = deque(maxlen=max_deferred)
+        self.counts: Dict[str, int] = {'shed': 0, 'deferred': 0, 'deferred_done': 0, 'deferred_lost': 0}
+
+    def estimated_wait(self) -> float:
+        return (self.queue_depth() + self.in_flight) * self.avg_latency
+
+    def _update_level(self) -> None:
+        wait = self.estimated_wait()
+        if wait >= self.shed_wait:
+            level = SHEDDING
+        elif wait >= self.degrade_wait:
+            level = DEGRADED
+        elif wait < self.degrade_wait / 2:
+            # Возвращаемся к норме с запасом, чтобы уровень не дергался на границе
+            level = NORMAL
+        else:
+            level = min(self.level, DEGRADED)
+        if level != self.level:
+            logger.warning(
+                "Нагрузка: %s (ожидание ~%.2f с, в очереди %s, в обработке %s, обработчик ~%.0f мс)",
+                LEVEL_NAMES[level], wait, self.queue_depth(), self.in_flight, self.avg_latency * 1000
+            )
+            self.level = level
+
+    @property
+    def overloaded(self) -> bool:
+        return self.level >= DEGRADED
+
+    @property
+    def shedding(self) -> bool:
+        return self.level >= SHEDDING
+
+    def started(self) -> float:
+        """Отмечает начало обработки обновления"""
+        self.in_flight += 1
+        self._update_level()
+        return time.perf_counter()
+
+    def finished(self, started_at: float) -> None:
+        """Отмечает конец обработки и учитывает ее длительность в среднем"""
+        self.in_flight -= 1
+        latency = time.perf_counter() - started_at
+        self.avg_latency += self.smoothing * (latency - self.avg_latency)
+        self._update_level()
+
+    def shed(self) -> None:
+        self.counts['shed'] += 1
+
+    def defer(self, work: Callable[[], Awaitable]) -> None:
+        """Откладывает работу до спада нагрузки; при переполнении теряются самые старые задания"""
+        if len(self._deferred) == self._deferred.maxlen:
+            self.counts['deferred_lost'] += 1
+        self._deferred.append(work)
+        self.counts['deferred'] += 1
+
+    async def run_deferred(self, interval: float = 1.0, batch: int = 20) -> None:
+        """Фоновая задача: выполняет отложенную работу небольшими порциями, пока нагрузка в норме"""
+        while True:
+            await asyncio.sleep(interval)
+            self._update_level()
+            done = 0
+            while self._deferred and done < batch and self.level == NORMAL:
+                work = self._deferred.popleft()
+                try:
+                    await work()
+                except Exception as e:
+                    # Отложенная уборка - необязательная работа: ошибки только в лог
+                    logger.debug("Отложенная задача не выполнена: %s", e)
+                done += 1
+            self.counts['deferred_done'] += done
+
+    def pending_deferred(self) -> int:
+        return len(self._deferred)
+
+    def report(self) -> Dict[str, Optional[float]]:
+        return {
+            'level': self.level,
+            'estimated_wait': self.estimated_wait(),
+            'avg_latency': self.avg_latency,
+            'pending_deferred': len(self._deferred),
+            **self.counts,
+        }
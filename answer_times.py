@@ -0,0 +1,118 @@
+"""
+Время ответа пользователя по символам: последние ответы в кольцевом буфере фиксированного размера
+"""
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Сколько последних ответов помнить: память на пользователя не растет с размером наборов
+ANSWER_TIMES_SIZE = 256
+# Миллисекунды в uint16: до 65 секунд
+TIME_DTYPE = np.uint16
+# Ответы дольше минуты не учитываем: пользователь, скорее всего, отвлекся
+MAX_ANSWER_MS = 60000
+# С какого числа ответов время начинает влиять на выбор вопросов
+MIN_TIMED_ANSWERS = 20
+# Во сколько раз самое большее медленный символ чаще попадается в вопросах
+SLOWNESS_LIMIT = 3.0
+
+
+class AnswerTimes:
+    """Кольцевой буфер (ключ статистики, время ответа) последних ответов
+
+    Два массива numpy вместо списка: ответ записывается на место самого
+    старого, а медианы по символам считаются одной сортировкой буфера.
+    """
+
+    __slots__ = ('keys', 'times', 'position', 'count')
+
+    def __init__(self, size: int = ANSWER_TIMES_SIZE):
+        self.keys = np.full(size, -1, dtype=np.int32)
+        self.times = np.zeros(size, dtype=TIME_DTYPE)
+        self.position = 0
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def record(self, key: int, seconds: float) -> bool:
+        """Записывает время ответа; False, если ответ слишком долгий, чтобы что-то значить"""
+        ms = round(seconds * 1000)
+        if ms < 0 or ms > MAX_ANSWER_MS:
+            return False
+        self.keys[self.position] = key
+        self.times[self.position] = ms
+        self.position = (self.position + 1) % len(self.keys)
+        self.count = min(self.count + 1, len(self.keys))
+        return True
+
+    def _filled(self) -> Tuple[np.ndarray, np.ndarray]:
+        # Для медиан порядок не важен: берем заполненную часть как есть
+        return self.keys[:self.count], self.times[:self.count]
+
+    def median(self, key: Optional[int] = None) -> Optional[float]:
+        """Медиана времени ответа в секундах: по всем ответам или по одному ключу"""
+        keys, times = self._filled()
+        if key is not None:
+            times = times[keys == key]
+        return float(np.median(times)) / 1000 if len(times) else None
+
+    def key_medians(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Ключи по возрастанию, медианы их времени ответа в секундах и число ответов"""
+        keys, times = self._filled()
+        order = np.lexsort((times, keys))
+        keys, times = keys[order], times[order].astype(float)
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype=int)
+        counts = np.diff(np.r_[starts, len(keys)])
+        medians = (times[starts + (counts - 1) // 2] + times[starts + counts // 2]) / 2000
+        return keys[starts], medians, counts
+
+    def to_json(self) -> List[List[int]]:
+        """[[ключи], [миллисекунды]] от старых ответов к новым"""
+        if self.count < len(self.keys):
+            keys, times = self._filled()
+        else:
+            keys = np.roll(self.keys, -self.position)
+            times = np.roll(self.times, -self.position)
+        return [keys.tolist(), times.tolist()]
+
+    @classmethod
+    def from_json(cls, stored: List[List[int]]) -> 'AnswerTimes':
+        answer_times = cls()
+        keys, times = stored
+        # Если буфер стал меньше, остаются самые новые ответы
+        keys, times = keys[-len(answer_times.keys):], times[-len(answer_times.keys):]
+        answer_times.keys[:len(keys)] = keys
+        answer_times.times[:len(times)] = times
+        answer_times.count = len(keys)
+        answer_times.position = len(keys) % len(answer_times.keys)
+        return answer_times
+
+
+def slowness_factors(answer_times: Optional[AnswerTimes], keys: np.ndarray,
+                     min_answers: int = MIN_TIMED_ANSWERS, limit: float = SLOWNESS_LIMIT) -> Optional[np.ndarray]:
+    """Множители весов для ключей keys: во сколько раз над символом думают дольше обычного
+
+    Обычное время - медиана по всем ответам пользователя, множитель не
+    меньше 1 и не больше limit. None, если данных мало или медленных
+    символов в keys нет: тогда выборка идет как раньше.
+    """
+    if answer_times is None or len(answer_times) < min_answers:
+        return None
+    overall = answer_times.median()
+    if not overall:
+        return None
+    slow_keys, medians, _ = answer_times.key_medians()
+    factors = np.minimum(medians / overall, limit)
+    slow = factors > 1.0
+    if not slow.any():
+        return None
+    slow_keys, factors = slow_keys[slow], factors[slow]
+    positions = np.minimum(np.searchsorted(slow_keys, keys), len(slow_keys) - 1)
+    matched = slow_keys[positions] == keys
+    if not matched.any():
+        return None
+    result = np.ones(len(keys))
+    result[matched] = factors[positions[matched]]
+    return result
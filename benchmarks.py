@@ -0,0 +1,252 @@
+"""
+Микробенчмарки горячих функций бота с проверкой регрессий по сохраненной базе
+
+Каждая функция замеряется на текущих наборах и на синтетических наборах
+из 2000 и 10000 символов: так видно не только время сегодня, но и как оно
+растет с размером набора. Результат сравнивается с базой (data/benchmark_baseline.json),
+и если какая-то функция стала медленнее больше чем на заданный процент,
+скрипт завершается с кодом 1.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import timeit
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from answer_times import ANSWER_TIMES_SIZE, AnswerTimes
+from deck_registry import DeckCatalog
+from symbol_stats import DIRECTIONS, STATS_DTYPE, sync_session
+
+BASELINE_PATH = "data/benchmark_baseline.json"
+# Насколько (в процентах) функция может замедлиться относительно базы
+DEFAULT_THRESHOLD = 25.0
+# Размеры синтетических наборов
+SYNTHETIC_SIZES = (2000, 10000)
+# Сколько серий замеров делать: берется лучшая, она меньше всего зависит от шума
+REPEAT = 5
+# Синтетические символы - подряд идущие иероглифы CJK
+SYNTHETIC_FIRST_SYMBOL = 0x4E00
+
+
+def synthetic_catalog(size: int) -> DeckCatalog:
+    """Каталог из size иероглифов с викториной на значение и викториной с кнопками"""
+    symbols = {
+        chr(SYNTHETIC_FIRST_SYMBOL + i): {
+            'meaning': f"значение {i}",
+            'reading': f"よみ{i}",
+            'romaji': f"yomi{i}",
+            'sound': f"ёми{i}",
+        }
+        for i in range(size)
+    }
+    quiz_types = {
+        'kanji': {
+            'name': f"Синтетические кандзи ({size})",
+            'folder': 'data/synthetic_kanji',
+            'question': "Что означает этот иероглиф?",
+            'answer_type': 'meaning',
+            'show_symbol': True,
+            'data': symbols,
+        },
+        'romaji_to_kanji': {
+            'name': f"Romaji → синтетические кандзи ({size})",
+            'folder': 'data/synthetic_kanji',
+            'question': "Какой иероглиф так читается?",
+            'answer_type': 'symbol',
+            'show_symbol': False,
+            'data': symbols,
+        },
+    }
+    return DeckCatalog(quiz_types, symbols)
+
+
+def current_scenario() -> Tuple[DeckCatalog, str, str]:
+    """Текущий каталог, викторина с вводом значения и самая большая викторина с кнопками"""
+    import bot
+
+    catalog = bot.decks.current
+    choice_types = [quiz_type for quiz_type in catalog.distractor_pools]
+    choice_type = max(choice_types, key=lambda quiz_type: catalog.deck_sizes[quiz_type])
+    return catalog, 'kanji', choice_type
+
+
+@contextlib.contextmanager
+def using_catalog(catalog: DeckCatalog) -> Iterator[None]:
+    """Подменяет текущую версию наборов на время замеров"""
+    import bot
+
+    previous = bot.decks.current
+    bot.decks.current = catalog
+    try:
+        yield
+    finally:
+        bot.decks.current = previous
+
+
+def benchmark_session(catalog: DeckCatalog, rng: np.random.Generator) -> Dict[str, object]:
+    """Сессия активного пользователя: статистика по всему каталогу и полный буфер времени ответов"""
+    import bot
+
+    session = bot.new_session()
+    sync_session(session, bot.decks)
+    stats = rng.integers(-5, 10, size=len(catalog.index) * DIRECTIONS).astype(STATS_DTYPE)
+    session['symbols_stats'] = stats
+    session['total_questions'] = 500
+    session['score'] = 400
+    answer_times = AnswerTimes()
+    keys = rng.integers(0, len(stats), size=ANSWER_TIMES_SIZE)
+    for key, seconds in zip(keys, rng.uniform(1.0, 10.0, size=ANSWER_TIMES_SIZE)):
+        answer_times.record(int(key), float(seconds))
+    session['answer_times'] = answer_times
+    return session
+
+
+def benchmarks_for(catalog: DeckCatalog, text_type: str, choice_type: str,
+                   folder: str) -> Dict[str, Callable[[], object]]:
+    """Замеряемые вызовы: имя -> функция без аргументов"""
+    import bot
+
+    rng = np.random.default_rng(0)
+    session = benchmark_session(catalog, rng)
+    stats = session['symbols_stats']
+    keys = catalog.deck_keys(choice_type)
+    deltas = stats[keys].astype(float)
+    symbols = catalog.symbol_lists[choice_type]
+    text_info = catalog.quiz_types[text_type]
+    text_symbol = catalog.symbol_lists[text_type][0]
+    state = bot.JapaneseBotState()
+    # Файлы пишутся во временный каталог, а не в data/
+    generator_types = {
+        quiz_type: {**quiz_info, 'folder': os.path.join(folder, quiz_type)}
+        for quiz_type, quiz_info in catalog.quiz_types.items()
+    }
+
+    def get_user_session() -> None:
+        # Первое обновление нового пользователя: сессия создается и приводится к каталогу
+        state.user_sessions.pop(1, None)
+        sync_session(state.get_user_session(1), bot.decks)
+
+    def generate_all_files() -> None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            state.symbol_generator.generate_all_files(generator_types)
+
+    return {
+        'sample_symbol': lambda: bot.sample_symbol(stats, keys),
+        'get_weights': lambda: bot.get_weights(deltas),
+        'generate_wrong_answers': lambda: bot.generate_wrong_answers(random.choice(symbols), choice_type, 3, catalog),
+        'get_user_session': get_user_session,
+        'question_text': lambda: bot.build_question(session, text_type),
+        'question_buttons': lambda: bot.build_question(session, choice_type),
+        'result_text': lambda: (bot.answer_result_text(session, text_info, text_symbol, False, "ответ"),
+                                bot.result_markup(text_type)),
+        'generate_all_files': generate_all_files,
+    }
+
+
+def measure(func: Callable[[], object], repeat: int = REPEAT) -> float:
+    """Секунды на вызов: лучшая из repeat серий, длина серии подбирается автоматически"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def run(sizes: List[int], only: Optional[List[str]] = None, repeat: int = REPEAT,
+        names: Optional[List[str]] = None) -> Dict[str, float]:
+    """Прогоняет замеры (все или только функции only / ключи names); ключ результата - 'набор/функция'"""
+    random.seed(0)
+    np.random.seed(0)
+    scenarios = [('current', *current_scenario())]
+    scenarios += [(f"synthetic_{size}", synthetic_catalog(size), 'kanji', 'romaji_to_kanji') for size in sizes]
+    results = {}
+    for name, catalog, text_type, choice_type in scenarios:
+        with using_catalog(catalog), tempfile.TemporaryDirectory() as folder:
+            for function, func in benchmarks_for(catalog, text_type, choice_type, folder).items():
+                if only and function not in only or names and f"{name}/{function}" not in names:
+                    continue
+                results[f"{name}/{function}"] = measure(func, repeat)
+    return results
+
+
+def load_baseline(path: str) -> Dict[str, float]:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['results']
+
+
+def save_baseline(path: str, results: Dict[str, float]) -> None:
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            # Сравнивать есть смысл только замеры на той же машине и версиях
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'results': results,
+        }, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+
+def format_time(seconds: float) -> str:
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} мс"
+    return f"{seconds * 1e6:.2f} мкс"
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], threshold: float) -> List[str]:
+    """Печатает таблицу и возвращает замеры, которые замедлились больше чем на threshold процентов"""
+    regressions = []
+    print(f"{'замер':<44} {'база':>12} {'сейчас':>12} {'изменение':>10}")
+    for name, seconds in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<44} {'-':>12} {format_time(seconds):>12} {'новый':>10}")
+            continue
+        change = (seconds / base - 1) * 100
+        mark = ""
+        if change > threshold:
+            regressions.append(name)
+            mark = "  <- регрессия"
+        print(f"{name:<44} {format_time(base):>12} {format_time(seconds):>12} {change:>+9.1f}%{mark}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Микробенчмарки горячих функций бота")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="Записать результаты как новую базу")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Допустимое замедление относительно базы, в процентах")
+    parser.add_argument("--sizes", type=int, nargs='*', default=list(SYNTHETIC_SIZES))
+    parser.add_argument("--only", nargs='+', help="Замерять только эти функции")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.only, args.repeat)
+    if args.save:
+        save_baseline(args.baseline, results)
+        for name, seconds in results.items():
+            print(f"{name:<44} {format_time(seconds):>12}")
+        print(f"База записана в {args.baseline}")
+    elif not os.path.exists(args.baseline):
+        for name, seconds in results.items():
+            print(f"{name:<44} {format_time(seconds):>12}")
+        print(f"Базы {args.baseline} нет: запустите с --save, чтобы ее записать")
+    else:
+        baseline = load_baseline(args.baseline)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            # Разовый всплеск нагрузки на машине не должен ронять проверку: замеряем еще раз
+            print("Повторный замер регрессий...")
+            remeasured = run(args.sizes, args.only, args.repeat, regressions)
+            results = {name: min(seconds, remeasured.get(name, seconds)) for name, seconds in results.items()}
+            regressions = compare({name: results[name] for name in regressions}, baseline, args.threshold)
+        if regressions:
+            print(f"Замедлились больше чем на {args.threshold:.0f}%: {', '.join(regressions)}")
+            sys.exit(1)
@@ -2,88 +2,451 @@
 Телеграм-бот для изучения японских иероглифов
 """
 
-from collections import defaultdict
+import asyncio
+from collections import defaultdict, OrderedDict
+import contextvars
+import functools
+import glob
+import json
 from math import log, atan
 import numpy as np
 import os
 import random
 import logging
-from typing import Dict, Any
+import signal
+import time
+from typing import Dict, Any, List, Optional, Tuple
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, Message
+from telegram.request import BaseRequest
 from telegram.ext import (
     Application, 
     CommandHandler, 
     MessageHandler, 
     CallbackQueryHandler,
     ContextTypes,
+    TypeHandler,
     filters
 )
 from dotenv import load_dotenv
 
-from japanese_data import QUIZ_TYPES
+from deck_registry import DeckRegistry, DeckCatalog
+from custom_decks import (
+    CustomDeckError, active_deck_mask, create_deck, deck_covers, delete_deck, describe_decks, edit_deck,
+    matching_quiz_types, quiz_keys, sync_decks
+)
+from ingress import CallbackGate, QUESTION_CALLBACK_PREFIXES
+from admission import AdmissionController, is_sheddable
+from loop_watchdog import LoopWatchdog
+from traffic_replay import UpdateRecorder
+from reminders import RateLimitedSender, ReminderSchedule
+from group_quiz import GroupGames, draw_round_symbol
+from daily_challenge import DailyChallenges
+from answer_times import AnswerTimes, slowness_factors
+from symbol_rankings import SymbolRankings
+from symbol_stats import DIRECTIONS, RECOGNITION, RECALL, add_delta, empty_stats, stats_key, sync_session, weak_count
 from image_generator import JapaneseSymbolGenerator
+from glyph_renderer import GlyphRenderer
+from global_stats import GlobalSymbolStats
+from leaderboard import Leaderboards, MIN_QUESTIONS_FOR_ACCURACY
+from progress_io import export_progress, import_progress
+from session_store import SessionStore, InMemorySessionStore, create_session_store, new_session
+from log_pipeline import dropped_records, setup_logging_from_env, update_fields
+from sharding import shard_for
 
 load_dotenv()
 
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Запись в лог уходит в очередь, форматирует и выводит ее отдельный поток
+setup_logging_from_env()
 logger = logging.getLogger(__name__)
+# Строка на каждое обновление: прореживается (LOG_SAMPLE), медленные пишутся всегда
+update_logger = logging.getLogger('updates')
+SLOW_UPDATE_MS = float(os.getenv('SLOW_UPDATE_MS', '1000'))
+
+
+# Сколько подготовленных заранее вопросов держать в памяти
+PREFETCH_CACHE_SIZE = 10000
 
 
 class JapaneseBotState:
-    def __init__(self):
-        self.user_sessions: Dict[int, Dict[str, Any]] = {}
+    def __init__(self, store: Optional[SessionStore] = None):
+        self.store = store or InMemorySessionStore()
+        # Для локального хранилища это сам словарь сессий, для удаленного - сессии текущих обработчиков
+        self.user_sessions: Dict[int, Dict[str, Any]] = self._initial_sessions()
         self.symbol_generator = JapaneseSymbolGenerator()
+        # Заранее подготовленные вопросы живут только в памяти процесса: потерять их не страшно
+        self.prefetched_questions: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        
+    def _initial_sessions(self) -> Dict[int, Dict[str, Any]]:
+        if isinstance(self.store, InMemorySessionStore):
+            return self.store.sessions
+        return {}
+    
+    def use_store(self, store: SessionStore) -> None:
+        """Переключает бота на другое хранилище сессий"""
+        self.store = store
+        self.user_sessions = self._initial_sessions()
         
     def get_user_session(self, user_id: int) -> Dict[str, Any]:
         if user_id not in self.user_sessions:
-            self.user_sessions[user_id] = {
-                'current_symbol': None,
-                'current_quiz_type': None,
-                'score': 0,
-                'total_questions': 0,
-                'waiting_for_answer': False,
-                'quiz_started': False,
-                'current_question_message_id': None,
-                'user_answer_message_id': None,
-                'stats_message_id': None,
-                'main_menu_message_id': None,
-                'submenu_message_id': None,
-                # Списки для хранения всех ID сообщений
-                'all_question_message_ids': [],
-                'all_user_answer_message_ids': [],
-                'all_stats_message_ids': [],
-                'all_main_menu_message_ids': [],
-                'all_submenu_message_ids': [],
-                # История ответов пользователя по иероглифам
-                'symbols_stats': defaultdict(int)
-            }
+            self.user_sessions[user_id] = new_session()
         return self.user_sessions[user_id]
+    
+    def store_prefetched_question(self, user_id: int, question: Dict[str, Any]) -> None:
+        """Запоминает подготовленный вопрос, вытесняя самые старые"""
+        self.prefetched_questions[user_id] = question
+        self.prefetched_questions.move_to_end(user_id)
+        while len(self.prefetched_questions) > PREFETCH_CACHE_SIZE:
+            self.prefetched_questions.popitem(last=False)
+    
+    def take_prefetched_question(self, user_id: int, session: Dict[str, Any], quiz_type: str) -> Optional[Dict[str, Any]]:
+        """Отдает подготовленный вопрос, если с тех пор не менялись ни веса, ни тип викторины, ни наборы"""
+        question = self.prefetched_questions.pop(user_id, None)
+        if question is None:
+            return None
+        if question['quiz_type'] != quiz_type or question['stats_version'] != session['stats_version']:
+            return None
+        # После перезагрузки наборов вопрос по старой версии не показываем
+        if question['deck_version'] != decks.current.version:
+            return None
+        return question
+    
+    async def load_session(self, user_id: int) -> None:
+        """Подтягивает сессию из хранилища перед обработкой обновления"""
+        if self.store.is_local:
+            return
+        session = await self.store.load(user_id)
+        if session is None:
+            self.user_sessions.pop(user_id, None)
+        else:
+            self.user_sessions[user_id] = session
+    
+    def save_session(self, user_id: int) -> None:
+        """Отправляет сессию в хранилище после обработки, не дожидаясь ответа"""
+        if self.store.is_local:
+            return
+        session = self.user_sessions.pop(user_id, None)
+        if session is not None:
+            self.store.save(user_id, session)
+
+
+# Версии наборов символов: новые вопросы берутся из текущей, ответы проверяются по той, из которой задан вопрос
+DECK_SYMBOLS_PATH = os.getenv('DECK_SYMBOLS_PATH', 'data/deck_symbols.json')
+decks = DeckRegistry(symbols_path=DECK_SYMBOLS_PATH)
+DATASET_WATCH_INTERVAL = float(os.getenv('DATASET_WATCH_INTERVAL', '0'))
+# Пользователи, которым доступна команда /reload
+ADMIN_IDS = {int(user_id) for user_id in os.getenv('ADMIN_IDS', '').split(',') if user_id.strip()}
+
+# Общая статистика по символам: априорные веса для новых пользователей
+GLOBAL_STATS_PATH = os.getenv('GLOBAL_STATS_PATH', 'data/global_stats.json')
+global_stats = GlobalSymbolStats(GLOBAL_STATS_PATH)
+GLOBAL_STATS_FLUSH_INTERVAL = float(os.getenv('GLOBAL_STATS_FLUSH_INTERVAL', '60'))
+
+LEADERBOARD_SIZE = 10
+STATS_SYMBOLS_SHOWN = 5
+
+# Файл, из которого прогресс загружается при старте и в который сохраняется при остановке
+PROGRESS_SNAPSHOT = os.getenv('PROGRESS_SNAPSHOT')
+
+# Картинки символов вместо текста: одинаково выглядят во всех клиентах
+GLYPH_IMAGES = os.getenv('GLYPH_IMAGES') == '1'
+glyph_renderer = GlyphRenderer(os.getenv('GLYPH_CACHE_DIR', 'data/glyphs'), font_path=os.getenv('GLYPH_FONT'))
+
+
+def glyph_images_enabled() -> bool:
+    return GLYPH_IMAGES and glyph_renderer.enabled
+
+# Сколько вопросов показывать в одном сообщении в пакетном режиме
+BATCH_SIZE = int(os.getenv('BATCH_SIZE', '10'))
+
+
+REMINDERS_PATH = os.getenv('REMINDERS_PATH', 'data/reminders.json')
+REMINDER_RESOLUTION = float(os.getenv('REMINDER_RESOLUTION', '60'))
+REMINDER_SEND_RATE = float(os.getenv('REMINDER_SEND_RATE', '25'))
+# Сколько сессий загружать за раз при рассылке
+REMINDER_BATCH = 100
+MAX_REMINDER_HOURS = 24 * 7
+
+
+def reschedule_reminder(user_id: int, session: Dict[str, Any]) -> None:
+    """Переносит напоминание: отсчет идет от последнего действия пользователя"""
+    if session.get('reminder_interval'):
+        reminders.schedule(user_id, time.time() + session['reminder_interval'])
+    elif user_id in reminders:
+        reminders.cancel(user_id)
+
+
+DEFAULT_GROUP_QUIZ_TYPE = 'hiragana_to_romaji'
+
+CALLBACK_DEDUP_WINDOW = float(os.getenv('CALLBACK_DEDUP_WINDOW', '1.0'))
+CALLBACK_REPORT_INTERVAL = float(os.getenv('CALLBACK_REPORT_INTERVAL', '60'))
+
+
+# Под нагрузкой второстепенная работа откладывается или отбрасывается, ответы проверяются всегда
+admission = AdmissionController(
+    degrade_wait=float(os.getenv('ADMISSION_DEGRADE_WAIT', '1.0')),
+    shed_wait=float(os.getenv('ADMISSION_SHED_WAIT', '3.0'))
+)
+OVERLOAD_TEXT = "Бот сейчас перегружен, попробуй чуть позже"
+
+# Синхронная работа в обработчике задерживает всех пользователей: меряем задержку цикла событий
+# и снимаем стек, если цикл занят дольше LOOP_STALL_MS
+loop_watchdog = LoopWatchdog(stall_threshold=float(os.getenv('LOOP_STALL_MS', '100')) / 1000)
+# Раз во сколько секунд писать в лог метрики процесса
+METRICS_INTERVAL = float(os.getenv('METRICS_INTERVAL', '60'))
+metrics_logger = logging.getLogger('metrics')
+# Запись входящих обновлений для офлайн-прогона (traffic_replay.py); включается RECORD_UPDATES=путь
+update_recorder = UpdateRecorder.from_env()
+# Приложения, запущенные в процессе: нагрузку оцениваем по их очередям вместе
+running_applications: List[Application] = []
+# Бесконечные фоновые задачи процесса: приложение их не отслеживает, останавливаем сами
+background_tasks: List[asyncio.Task] = []
+
+
+def bot_file_path(path: str, name: str) -> str:
+    """Файл данных бота: у основного путь как есть, у остальных - с именем бота перед расширением"""
+    if not name:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{name}{ext}"
+
+
+class BotInstance:
+    """Все, что у каждого бота (токена) свое
+
+    Несколько ботов с одинаковыми наборами могут работать в одном процессе:
+    каталог символов, общая статистика, картинки и контроль нагрузки у них
+    общие, а сессии, рейтинги, напоминания и игры в группах - у каждого свои
+    (один и тот же пользователь в двух ботах - два разных ученика).
+    """
+
+    def __init__(self, name: str = ""):
+        # Пустое имя - основной бот: его файлы и ключи сессий называются как раньше
+        self.name = name
+        self.state = JapaneseBotState()
+        # Рейтинги обновляются на каждом ответе, а не пересчитываются по всем сессиям
+        self.leaderboards = Leaderboards()
+        # Самые трудные и самые выученные символы для статистики, тоже обновляются на каждом ответе
+        self.symbol_rankings = SymbolRankings()
+        # Напоминания о повторении: расписание по корзинам времени вместо задачи на каждого пользователя
+        self.reminders = ReminderSchedule(resolution=REMINDER_RESOLUTION)
+        # Лимит Telegram на рассылку - у каждого токена свой
+        self.reminder_sender = RateLimitedSender(rate=REMINDER_SEND_RATE)
+        self.reminders_path = bot_file_path(REMINDERS_PATH, name)
+        self.progress_snapshot = bot_file_path(PROGRESS_SNAPSHOT, name) if PROGRESS_SNAPSHOT else None
+        # Викторины в групповых чатах: состояние по chat_id, сессии участников не загружаются
+        self.group_games = GroupGames()
+        # Вызов дня: вопросы собираются раз в сутки, у пользователя только позиция в общем наборе
+        self.daily_challenges = DailyChallenges(decks)
+        # Повторные и устаревшие нажатия кнопок отбрасываются до обработчиков
+        self.callback_gate = CallbackGate(window=CALLBACK_DEDUP_WINDOW)
+        # (номер воркера, число воркеров) в шардированном режиме: процесс отвечает только за своих пользователей
+        self.shard: Optional[Tuple[int, int]] = None
+        # Загружать ли при старте сохраненный прогресс и напоминания (воркер, добавленный
+        # ребалансировкой, получает своих пользователей от других воркеров)
+        self.restore_saved = True
+
+    @property
+    def session_prefix(self) -> str:
+        """Префикс ключей сессий в общем хранилище"""
+        return f"jpbot:{self.name}:session:" if self.name else "jpbot:session:"
+
+    def owns(self, user_id: int) -> bool:
+        """Обслуживает ли этот процесс пользователя"""
+        return self.shard is None or shard_for(user_id, self.shard[1]) == self.shard[0]
+
+    def write_path(self, path: str) -> str:
+        """Файл, в который процесс сохраняет свою часть данных: у каждого воркера свой"""
+        return path if self.shard is None else bot_file_path(path, f"shard{self.shard[0]}")
+
+    def read_paths(self, path: str) -> List[str]:
+        """Файлы, из которых загружаться: общий и части воркеров, от старых к новым
+
+        Число воркеров между запусками могло поменяться, поэтому читаются все
+        части, а свои пользователи отбираются по owns(); более новый файл
+        перекрывает данные из более старого.
+        """
+        root, ext = os.path.splitext(path)
+        paths = [path] + glob.glob(f"{glob.escape(root)}.shard*{ext}")
+        return sorted((p for p in paths if os.path.exists(p)), key=os.path.getmtime)
+
+
+default_bot = BotInstance()
+# Бот, который обрабатывает текущее обновление: выставляется в admit() и в фоновых задачах бота
+current_bot: contextvars.ContextVar[BotInstance] = contextvars.ContextVar('current_bot', default=default_bot)
+
+
+class CurrentBotAttribute:
+    """Часть состояния бота, который обрабатывает текущее обновление
+
+    Обработчики обращаются к bot_state, leaderboards и остальным как к
+    обычным объектам модуля, а к какому боту они относятся, решает current_bot.
+    """
+
+    __slots__ = ('attribute',)
+
+    def __init__(self, attribute: str):
+        self.attribute = attribute
+
+    def target(self) -> Any:
+        return getattr(current_bot.get(), self.attribute)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.target(), name)
+
+    def __len__(self) -> int:
+        return len(self.target())
+
+    def __contains__(self, item: Any) -> bool:
+        return item in self.target()
+
+
+bot_state = CurrentBotAttribute('state')
+leaderboards = CurrentBotAttribute('leaderboards')
+symbol_rankings = CurrentBotAttribute('symbol_rankings')
+reminders = CurrentBotAttribute('reminders')
+reminder_sender = CurrentBotAttribute('reminder_sender')
+group_games = CurrentBotAttribute('group_games')
+daily_challenges = CurrentBotAttribute('daily_challenges')
+callback_gate = CurrentBotAttribute('callback_gate')
+
+
+def update_route(update: Update) -> str:
+    """Короткое имя маршрута обновления для логов (без ответов пользователя)"""
+    query = update.callback_query
+    if query is not None:
+        data = query.data or ""
+        # У кнопок вопросов после префикса - ответ или тип викторины
+        if data.startswith(QUESTION_CALLBACK_PREFIXES + ("quiz_", "continue_", "daily_")):
+            return data.split("_", 1)[0]
+        return data
+    message = update.effective_message
+    if message is not None and message.text and message.text.startswith("/"):
+        return message.text.split(maxsplit=1)[0].split("@", 1)[0]
+    if update.effective_chat is not None and update.effective_chat.type in ("group", "supergroup"):
+        return "group_text"
+    return "text"
+
+
+def admit(handler):
+    """Учитывает обработку в оценке нагрузки; при перегрузке не показывает статистику и рейтинги"""
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        user = update.effective_user
+        instance = context.bot_data.get('instance', default_bot)
+        bot_token = current_bot.set(instance)
+        # Поля обновления попадают во все записи лога, сделанные при его обработке
+        fields_token = update_fields.set({
+            'bot': instance.name or None, 'user': user.id if user else None, 'route': update_route(update)
+        })
+        try:
+            if admission.shedding and is_sheddable(update):
+                admission.shed()
+                if update.callback_query:
+                    await update.callback_query.answer(OVERLOAD_TEXT)
+                elif update.effective_message:
+                    await update.effective_message.reply_text(OVERLOAD_TEXT)
+                return
+            started_at = admission.started()
+            try:
+                return await handler(update, context)
+            finally:
+                admission.finished(started_at)
+                latency_ms = round((time.perf_counter() - started_at) * 1000, 1)
+                if latency_ms >= SLOW_UPDATE_MS:
+                    update_logger.warning("Медленная обработка обновления", extra={'latency_ms': latency_ms})
+                else:
+                    update_logger.info("Обновление обработано", extra={'latency_ms': latency_ms})
+        finally:
+            update_fields.reset(fields_token)
+            current_bot.reset(bot_token)
+    return wrapper
+
+
+def question_generation(session: Dict[str, Any]) -> Tuple[int, int]:
+    """Поколение вопроса в сообщении: меняется с каждым новым вопросом и с каждым ответом"""
+    return session['question_serial'], session['stats_version']
+
+
+def drop_duplicate_callbacks(handler):
+    """Отбрасывает повторное нажатие той же кнопки того же вопроса (нужна загруженная сессия)
 
+    Сообщение с вопросом правится на месте, поэтому номера сообщения мало:
+    второе "следующий вопрос" на том же сообщении - уже новое нажатие.
+    """
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        query = update.callback_query
+        session = bot_state.get_user_session(query.from_user.id)
+        message_id = query.message.message_id if query.message else None
+        if callback_gate.is_duplicate(query.from_user.id, message_id, query.data or "", question_generation(session)):
+            # Без ответа у пользователя крутится индикатор на кнопке, пока клиент не сдастся
+            await query.answer()
+            return
+        return await handler(update, context)
+    return wrapper
+
+
+def drop_stale_callbacks(handler):
+    """Отбрасывает нажатия на кнопки вопросов, которые уже сменились (нужна загруженная сессия)"""
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        query = update.callback_query
+        session = bot_state.get_user_session(query.from_user.id)
+        message_id = query.message.message_id if query.message else None
+        if callback_gate.is_stale(session, message_id, query.data or ""):
+            await query.answer("Этот вопрос уже закрыт")
+            return
+        return await handler(update, context)
+    return wrapper
 
-bot_state = JapaneseBotState()
+
+def with_session(handler):
+    """Оборачивает обработчик загрузкой сессии до него и сохранением после"""
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        user = update.effective_user
+        if user is None:
+            return await handler(update, context)
+        await bot_state.load_session(user.id)
+        # Номера символов в статистике должны совпадать с текущей версией каталога
+        sync_session(bot_state.get_user_session(user.id), decks)
+        try:
+            return await handler(update, context)
+        finally:
+            reschedule_reminder(user.id, bot_state.get_user_session(user.id))
+            bot_state.save_session(user.id)
+    return wrapper
 
 
-def generate_wrong_answers(correct_symbol: str, quiz_type: str, count: int = 3) -> list:
+def generate_wrong_answers(correct_symbol: str, quiz_type: str, count: int = 3,
+                           catalog: Optional[DeckCatalog] = None) -> list:
     """Генерирует неправильные варианты ответов для викторины с кнопками"""
-    if quiz_type == "romaji_to_hiragana":
-        data = QUIZ_TYPES["hiragana_to_romaji"]["data"]
-    elif quiz_type == "romaji_to_katakana":
-        data = QUIZ_TYPES["katakana_to_romaji"]["data"]
-    else:
+    catalog = catalog or decks.current
+    pool = catalog.distractor_pools.get(quiz_type)
+    if not pool:
         return []
     
-    # Получаем все символы кроме правильного
-    all_symbols = [symbol for symbol in data.keys() if symbol != correct_symbol]
-    
-    # Выбираем случайные неправильные варианты
-    import random
-    wrong_answers = random.sample(all_symbols, min(count, len(all_symbols)))
+    # Выбираем с запасом на один элемент и выкидываем правильный, не копируя весь набор
+    wrong_answers = [symbol for symbol in random.sample(pool, min(count + 1, len(pool))) if symbol != correct_symbol]
     
-    return wrong_answers
+    return wrong_answers[:count]
+
+
+def symbols_count_text(count: int) -> str:
+    """Число символов с правильным окончанием: 1 символ, 2 символа, 5 символов"""
+    if count % 10 == 1 and count % 100 != 11:
+        word = "символ"
+    elif 2 <= count % 10 <= 4 and not 12 <= count % 100 <= 14:
+        word = "символа"
+    else:
+        word = "символов"
+    return f"{count} {word}"
+
+
+def deck_size_text(quiz_type: str) -> str:
+    """Размер набора из текущей версии для текстов меню"""
+    return symbols_count_text(decks.current.deck_sizes.get(quiz_type, 0))
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -96,6 +459,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     session['total_questions'] = 0
     session['waiting_for_answer'] = False
     session['quiz_started'] = False
+    session['batch_symbols'] = None
     session['current_question_message_id'] = None
     session['user_answer_message_id'] = None
     session['stats_message_id'] = None
@@ -108,15 +472,20 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     session['all_main_menu_message_ids'] = []
     session['all_submenu_message_ids'] = []
     # Очищаем статистику по иероглифам
-    session['symbols_stats'] = defaultdict(int)
+    session['symbols_stats'] = empty_stats(len(decks.current.index))
+    session['catalog_version'] = decks.current.version
+    session['quiz_type_scores'] = {}
+    bump_stats_version(session)
+    leaderboards.reset_user(user_id)
+    symbol_rankings.drop(user_id)
     
     welcome_message = (
         f"Привет, {user.first_name}! 👋\n\n"
         "Добро пожаловать в бот для изучения японского языка! 🇯🇵\n\n"
         "Выбери тип викторины:\n\n"
-        "🈳 **Кандзи** - иероглифы и их значения (12 символов)\n"
-        "🈶 **Хирагана** - основная слоговая азбука (46 символов)\n"
-        "🈯 **Катакана** - азбука для заимствованных слов (46 символов)\n\n"
+        f"🈳 **Кандзи** - иероглифы и их значения ({deck_size_text('kanji')})\n"
+        f"🈶 **Хирагана** - основная слоговая азбука ({deck_size_text('hiragana_to_romaji')})\n"
+        f"🈯 **Катакана** - азбука для заимствованных слов ({deck_size_text('katakana_to_romaji')})\n\n"
         "Для каждой азбуки доступны два режима:\n"
         "• Символ → Romaji\n"
         "• Romaji → Символ"
@@ -125,7 +494,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     keyboard = [
         [InlineKeyboardButton("🈳 Кандзи", callback_data="quiz_kanji")],
         [InlineKeyboardButton("🈶 Хирагана", callback_data="menu_hiragana")],
-        [InlineKeyboardButton("🈯 Катакана", callback_data="menu_katakana")]
+        [InlineKeyboardButton("🈯 Катакана", callback_data="menu_katakana")],
+        [InlineKeyboardButton("📅 Вызов дня", callback_data="daily")]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -142,9 +512,9 @@ async def show_quiz_selection(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     selection_message = (
         "Выбери тип викторины:\n\n"
-        "🈳 **Кандзи** - иероглифы и их значения (12 символов)\n"
-        "🈶 **Хирагана** - основная слоговая азбука (46 символов)\n"
-        "🈯 **Катакана** - азбука для заимствованных слов (46 символов)\n\n"
+        f"🈳 **Кандзи** - иероглифы и их значения ({deck_size_text('kanji')})\n"
+        f"🈶 **Хирагана** - основная слоговая азбука ({deck_size_text('hiragana_to_romaji')})\n"
+        f"🈯 **Катакана** - азбука для заимствованных слов ({deck_size_text('katakana_to_romaji')})\n\n"
         "Для каждой азбуки доступны два режима:\n"
         "• Символ → Romaji\n"
         "• Romaji → Символ"
@@ -153,7 +523,8 @@ async def show_quiz_selection(update: Update, context: ContextTypes.DEFAULT_TYPE
     keyboard = [
         [InlineKeyboardButton("🈳 Кандзи", callback_data="quiz_kanji")],
         [InlineKeyboardButton("🈶 Хирагана", callback_data="menu_hiragana")],
-        [InlineKeyboardButton("🈯 Катакана", callback_data="menu_katakana")]
+        [InlineKeyboardButton("🈯 Катакана", callback_data="menu_katakana")],
+        [InlineKeyboardButton("📅 Вызов дня", callback_data="daily")]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -173,9 +544,9 @@ async def show_hiragana_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
     menu_message = (
         "🈶 **Хирагана**\n\n"
         "Выбери набор символов:\n\n"
-        "**Базовая хирагана** (46 символов) - основные символы\n"
-        "**Тэнтэн и мару** (25 символов) - символы с ゛ и ゜\n"
-        "**Полная хирагана** (71 символ) - все символы вместе"
+        f"**Базовая хирагана** ({deck_size_text('hiragana_to_romaji')}) - основные символы\n"
+        f"**Тэнтэн и мару** ({deck_size_text('hiragana_dakuten_to_romaji')}) - символы с ゛ и ゜\n"
+        f"**Полная хирагана** ({deck_size_text('hiragana_full_to_romaji')}) - все символы вместе"
     )
     
     keyboard = [
@@ -199,7 +570,7 @@ async def show_hiragana_basic_menu(update: Update, context: ContextTypes.DEFAULT
     await query.answer()
     
     menu_message = (
-        "🈶 **Базовая хирагана** (46 символов)\n\n"
+        f"🈶 **Базовая хирагана** ({deck_size_text('hiragana_to_romaji')})\n\n"
         "Выбери режим викторины:\n\n"
         "**Символ → Romaji**: Видишь символ хираганы, пишешь его чтение латиницей\n"
         "**Romaji → Символ**: Видишь чтение латиницей, выбираешь правильный символ из кнопок"
@@ -225,7 +596,7 @@ async def show_hiragana_dakuten_menu(update: Update, context: ContextTypes.DEFAU
     await query.answer()
     
     menu_message = (
-        "🈶゛゜ **Тэнтэн и мару** (25 символов)\n\n"
+        f"🈶゛゜ **Тэнтэн и мару** ({deck_size_text('hiragana_dakuten_to_romaji')})\n\n"
         "Символы хираганы с диакритическими знаками:\n"
         "• **Тэнтэн** (゛) - озвончение: が, ざ, だ\n"
         "• **Мару** (゜) - придыхание: ぱ, ぴ, ぷ, ぺ, ぽ\n\n"
@@ -252,11 +623,10 @@ async def show_hiragana_full_menu(update: Update, context: ContextTypes.DEFAULT_
     await query.answer()
     
     menu_message = (
-        "🈶📖 **Полная хирагана** (71 символ)\n\n"
+        f"🈶📖 **Полная хирагана** ({deck_size_text('hiragana_full_to_romaji')})\n\n"
         "Все символы хираганы:\n"
-        "• Базовые символы (46)\n"
-        "• Символы с тэнтэн (20)\n"
-        "• Символы с мару (5)\n\n"
+        f"• Базовые символы ({decks.current.deck_sizes.get('hiragana_to_romaji', 0)})\n"
+        f"• Символы с тэнтэн и мару ({decks.current.deck_sizes.get('hiragana_dakuten_to_romaji', 0)})\n\n"
         "Выбери режим викторины:"
     )
     
@@ -280,7 +650,7 @@ async def show_katakana_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.answer()
     
     menu_message = (
-        "🈯 **Катакана** (46 символов)\n\n"
+        f"🈯 **Катакана** ({deck_size_text('katakana_to_romaji')})\n\n"
         "Выбери режим викторины:\n\n"
         "**Символ → Romaji**: Видишь символ катаканы, пишешь его чтение латиницей\n"
         "**Romaji → Символ**: Видишь чтение латиницей, выбираешь правильный символ из кнопок"
@@ -302,46 +672,103 @@ def get_weight(delta: float) -> float:
         return 1.0 / (log(delta + 1)**2 + 1)
     return atan(-delta) + 1
 
-def sample_symbol(stats: dict, symbols: list[str]) -> str:
-    deltas = [float(stats[symbol]) for symbol in symbols]
-    weights = [get_weight(delta) for delta in deltas]
-    sum_weights = sum(weights)
-    probas = [weight / sum_weights for weight in weights]
-    return np.random.choice(symbols, p=probas)
+def get_weights(deltas: np.ndarray) -> np.ndarray:
+    """get_weight сразу для массива delta"""
+    return np.where(deltas >= 0, 1.0 / (np.log1p(np.maximum(deltas, 0)) ** 2 + 1), np.arctan(-deltas) + 1)
 
+def get_probas(stats: np.ndarray, keys: np.ndarray, priors: Optional[np.ndarray] = None,
+               slowness: Optional[np.ndarray] = None) -> np.ndarray:
+    # Символы без перевеса в ответах пользователя (в том числе новые) берут delta из общей статистики
+    deltas = stats[keys].astype(float)
+    if priors is not None:
+        deltas = np.where(deltas == 0, priors[keys], deltas)
+    weights = get_weights(deltas)
+    # Символ, на который отвечают правильно, но долго, выучен хуже, чем говорит delta
+    if slowness is not None:
+        weights = weights * np.where(deltas > 0, slowness, 1.0)
+    return weights / weights.sum()
 
-async def start_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE, quiz_type: str = None) -> None:
-    """Начинает новый вопрос викторины"""
-    query = update.callback_query
-    if query:
-        await query.answer()
-        user_id = query.from_user.id
-    else:
-        user_id = update.effective_user.id
-    
-    session = bot_state.get_user_session(user_id)
-    
-    # Если передан тип викторины, устанавливаем его
-    if quiz_type:
-        session['current_quiz_type'] = quiz_type
-        session['quiz_started'] = True
-    
-    # Проверяем, что тип викторины установлен
-    if not session.get('current_quiz_type'):
-        await show_quiz_selection(update, context)
-        return
-    
-    current_quiz_type = session['current_quiz_type']
-    quiz_info = QUIZ_TYPES[current_quiz_type]
+def sample_symbol(stats: np.ndarray, keys: np.ndarray, priors: Optional[np.ndarray] = None,
+                  slowness: Optional[np.ndarray] = None) -> int:
+    """Выбирает ключ (символ, направление): чем хуже пользователь знает символ, тем чаще"""
+    return int(keys[np.random.choice(len(keys), p=get_probas(stats, keys, priors, slowness))])
+
+def sample_symbols(stats: np.ndarray, keys: np.ndarray, count: int, priors: Optional[np.ndarray] = None,
+                   slowness: Optional[np.ndarray] = None) -> list[int]:
+    """Выбирает несколько разных ключей с теми же весами, что и sample_symbol"""
+    count = min(count, len(keys))
+    indices = np.random.choice(len(keys), size=count, replace=False, p=get_probas(stats, keys, priors, slowness))
+    return [int(keys[index]) for index in indices]
+
+
+# Априорные delta общей статистики, разложенные по ключам каталога: (версия, тип) -> (словарь, массив)
+_prior_vectors: Dict[Any, Any] = {}
+
+
+def prior_vector(catalog: DeckCatalog, quiz_type: str) -> Optional[np.ndarray]:
+    """Априорные delta в виде массива по ключам статистики; пересчитывается, когда меняются сами priors"""
+    priors = global_stats.prior_deltas(quiz_type)
+    if not priors:
+        return None
+    cached = _prior_vectors.get((catalog.version, quiz_type))
+    if cached is not None and cached[0] is priors:
+        return cached[1]
+    vector = np.zeros(len(catalog.index) * DIRECTIONS)
+    direction = catalog.directions[quiz_type]
+    for symbol, delta in priors.items():
+        symbol_id = catalog.index.ids.get(symbol)
+        if symbol_id is not None:
+            vector[stats_key(symbol_id, direction)] = delta
+    _prior_vectors[(catalog.version, quiz_type)] = (priors, vector)
+    return vector
+
+
+def question_key(session: Dict[str, Any], quiz_type: str, symbol: str, key: Optional[int]) -> Optional[int]:
+    """Ключ статистики заданного вопроса; если с тех пор сменился каталог, ищем символ заново"""
+    if key is not None and session.get('question_version') == session['catalog_version']:
+        return key
+    catalog = decks.current
+    symbol_id = catalog.index.ids.get(symbol)
+    if symbol_id is None or quiz_type not in catalog.directions:
+        return None
+    return stats_key(symbol_id, catalog.directions[quiz_type])
+
+
+def deck_fallback_note(session: Dict[str, Any], catalog: DeckCatalog, quiz_type: str) -> str:
+    """Предупреждение, если в выбранном наборе нет символов викторины и вопросы идут по полному"""
+    if deck_covers(catalog, quiz_type, active_deck_mask(session, decks)):
+        return ""
+    # Название набора не вставляем: текст вопроса идет с разметкой Markdown
+    return "ℹ️ В выбранном наборе нет символов этой викторины, вопросы идут по полному набору (/deck off)\n\n"
+
+
+def build_question(session: Dict[str, Any], quiz_type: str) -> Dict[str, Any]:
+    """Выбирает символ и готовит текст вопроса с клавиатурой"""
+    catalog = decks.current
+    quiz_info = catalog.quiz_types[quiz_type]
     data = quiz_info['data']
     
-    # Выбираем случайный символ
-    symbol = sample_symbol(session['symbols_stats'], list(data.keys()))
-    session['current_symbol'] = symbol
-    session['waiting_for_answer'] = True
+    # Выбираем случайный символ (из своего набора пользователя, если он выбран)
+    keys = quiz_keys(catalog, quiz_type, active_deck_mask(session, decks))
+    key = sample_symbol(session['symbols_stats'], keys, prior_vector(catalog, quiz_type),
+                        slowness_factors(session['answer_times'], keys))
+    symbol = catalog.index.symbols[key // DIRECTIONS]
     
     # Формируем текст вопроса в зависимости от типа викторины
-    if quiz_info['show_symbol']:
+    photo_symbol = symbol if quiz_info['show_symbol'] and glyph_images_enabled() else None
+    if photo_symbol:
+        # Сам символ будет на картинке
+        question_text = (
+            f"❓ Вопрос {session['total_questions'] + 1} ({quiz_info['name']})\n"
+            f"📊 Счет: {session['score']}/{session['total_questions']}\n\n"
+            f"{quiz_info['question']}"
+        )
+        
+        if quiz_type == "kanji":
+            question_text += " Напиши значение на русском языке:"
+        else:
+            question_text += " Напиши в латинице (romaji):"
+    elif quiz_info['show_symbol']:
         question_text = (
             f"❓ Вопрос {session['total_questions'] + 1} ({quiz_info['name']})\n"
             f"📊 Счет: {session['score']}/{session['total_questions']}\n\n"
@@ -349,7 +776,7 @@ async def start_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE, quiz_ty
             f"{quiz_info['question']}"
         )
         
-        if current_quiz_type == "kanji":
+        if quiz_type == "kanji":
             question_text += " Напиши значение на русском языке:"
         else:
             question_text += " Напиши в латинице (romaji):"
@@ -363,10 +790,12 @@ async def start_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE, quiz_ty
             f"{quiz_info['question']} Напиши символ:"
         )
     
+    question_text = deck_fallback_note(session, catalog, quiz_type) + question_text
+    
     # Создаем клавиатуру в зависимости от типа викторины
     if quiz_info['answer_type'] == "symbol":
         # Для режимов Romaji→Символ создаем кнопки с вариантами ответов
-        wrong_answers = generate_wrong_answers(symbol, current_quiz_type, 3)
+        wrong_answers = generate_wrong_answers(symbol, quiz_type, 3, catalog)
         all_answers = [symbol] + wrong_answers
         random.shuffle(all_answers)
         
@@ -385,11 +814,150 @@ async def start_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE, quiz_ty
     else:
         # Для остальных режимов обычные кнопки
         keyboard = [
-            [InlineKeyboardButton("🔄 Следующий вопрос", callback_data=f"next_{current_quiz_type}")],
+            [InlineKeyboardButton("🔄 Следующий вопрос", callback_data=f"next_{quiz_type}")],
             [InlineKeyboardButton("🔙 Выбрать другой тип", callback_data="back_to_menu")]
         ]
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    return {
+        'quiz_type': quiz_type,
+        'stats_version': session['stats_version'],
+        'deck_version': catalog.version,
+        'symbol': symbol,
+        'key': key,
+        'photo_symbol': photo_symbol,
+        'text': question_text,
+        'markup': InlineKeyboardMarkup(keyboard)
+    }
+
+
+def prefetch_question(user_id: int, session: Dict[str, Any]) -> None:
+    """Готовит следующий вопрос, пока пользователь читает результат"""
+    quiz_type = session.get('current_quiz_type')
+    if quiz_type and session.get('quiz_started'):
+        bot_state.store_prefetched_question(user_id, build_question(session, quiz_type))
+
+
+def bump_stats_version(session: Dict[str, Any]) -> None:
+    """Отмечает изменение весов выборки: заранее подготовленный вопрос устаревает"""
+    session['stats_version'] += 1
+
+
+def record_symbol_changes(user_id: int, session: Dict[str, Any], keys) -> None:
+    """Отмечает изменение счетчиков keys: заготовка вопроса устаревает, рейтинги символов обновляются"""
+    previous_version = session['stats_version']
+    bump_stats_version(session)
+    symbol_rankings.update(user_id, session, decks.current, keys, previous_version)
+
+
+def record_answer_time(session: Dict[str, Any], key: int) -> None:
+    """Записывает, сколько прошло с показа вопроса до ответа"""
+    shown_at = session['question_shown_at']
+    if shown_at is None:
+        return
+    session['question_shown_at'] = None
+    if session['answer_times'] is None:
+        session['answer_times'] = AnswerTimes()
+    session['answer_times'].record(key, time.time() - shown_at)
+
+
+def record_symbol_result(user_id: int, session: Dict[str, Any], quiz_type: str, symbol: str, is_correct: bool) -> None:
+    """Учитывает ответ по символу в статистике пользователя и в общей статистике"""
+    key = question_key(session, quiz_type, symbol, session.get('current_key'))
+    if key is not None:
+        add_delta(session['symbols_stats'], key, 1 if is_correct else -1)
+        record_answer_time(session, key)
+    quiz_type_score = session['quiz_type_scores'].setdefault(quiz_type, [0, 0])
+    quiz_type_score[0] += 1 if is_correct else 0
+    quiz_type_score[1] += 1
+    global_stats.record(quiz_type, symbol, is_correct)
+    record_symbol_changes(user_id, session, () if key is None else (key,))
+
+
+async def send_photo_question(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                              session: Dict[str, Any], user_id: int, question: Dict[str, Any]) -> None:
+    """Показывает вопрос картинкой символа, загружая каждую картинку в Telegram только один раз"""
+    query = update.callback_query
+    symbol = question['photo_symbol']
+    photo = await glyph_renderer.photo_for(symbol, context.bot.id)
+    
+    message = None
+    if query and session.get('question_is_photo') and session.get('current_question_message_id'):
+        try:
+            message = await query.edit_message_media(
+                media=InputMediaPhoto(media=photo, caption=question['text'], parse_mode='Markdown'),
+                reply_markup=question['markup']
+            )
+        except Exception:
+            message = None
+    
+    if not isinstance(message, Message):
+        # Текстовое сообщение нельзя превратить в картинку, поэтому заменяем его новым
+        if query and session.get('current_question_message_id') and not session.get('question_is_photo'):
+            try:
+                await query.message.delete()
+            except Exception:
+                pass
+        message = await context.bot.send_photo(
+            chat_id=user_id,
+            photo=photo,
+            caption=question['text'],
+            reply_markup=question['markup'],
+            parse_mode='Markdown'
+        )
+        session['current_question_message_id'] = message.message_id
+        session['all_question_message_ids'].append(message.message_id)
+    
+    session['question_is_photo'] = True
+    if message.photo and not isinstance(photo, str):
+        glyph_renderer.remember_file_id(symbol, context.bot.id, message.photo[-1].file_id)
+
+
+async def start_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE, quiz_type: str = None) -> None:
+    """Начинает новый вопрос викторины"""
+    query = update.callback_query
+    if query:
+        await query.answer()
+        user_id = query.from_user.id
+    else:
+        user_id = update.effective_user.id
+    
+    session = bot_state.get_user_session(user_id)
+    
+    # Если передан тип викторины, устанавливаем его
+    if quiz_type:
+        session['current_quiz_type'] = quiz_type
+        session['quiz_started'] = True
+    
+    # Проверяем, что тип викторины установлен и не пропал после перезагрузки наборов
+    if session.get('current_quiz_type') not in decks.current.quiz_types:
+        session['quiz_started'] = False
+        await show_quiz_selection(update, context)
+        return
+    
+    current_quiz_type = session['current_quiz_type']
+    
+    # Берем заранее подготовленный вопрос, если он еще актуален
+    question = bot_state.take_prefetched_question(user_id, session, current_quiz_type)
+    if question is None:
+        question = build_question(session, current_quiz_type)
+    
+    symbol = question['symbol']
+    question_text = question['text']
+    reply_markup = question['markup']
+    session['current_symbol'] = symbol
+    session['current_key'] = question['key']
+    session['question_version'] = question['deck_version']
+    session['waiting_for_answer'] = True
+    session['batch_symbols'] = None
+    session['question_serial'] += 1
+    # Время показа по часам системы, а не монотонным: ответ может обработать другой процесс
+    session['question_shown_at'] = time.time()
+    
+    # Символ показываем картинкой, если включен рендер
+    if question.get('photo_symbol'):
+        await send_photo_question(update, context, session, user_id, question)
+        return
+    session['question_is_photo'] = False
     
     # Если есть предыдущее сообщение с вопросом, редактируем его
     if session.get('current_question_message_id') and query:
@@ -427,6 +995,65 @@ async def start_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE, quiz_ty
         session['all_question_message_ids'].append(message.message_id)
 
 
+def check_answer(quiz_info: dict, symbol: str, user_answer: str) -> bool:
+    """Проверяет ответ пользователя на вопрос по символу"""
+    symbol_data = quiz_info['data'][symbol]
+    if quiz_info['answer_type'] == "meaning":
+        correct_answer = symbol_data['meaning'].lower()
+        return user_answer in correct_answer or correct_answer in user_answer
+    elif quiz_info['answer_type'] == "romaji":
+        return user_answer == symbol_data['romaji'].lower()
+    else:  # answer_type == "symbol"
+        return user_answer == symbol
+
+
+def get_correct_answer(quiz_info: dict, symbol: str) -> str:
+    """Возвращает правильный ответ для показа пользователю"""
+    if quiz_info['answer_type'] == "meaning":
+        return quiz_info['data'][symbol]['meaning']
+    elif quiz_info['answer_type'] == "romaji":
+        return quiz_info['data'][symbol]['romaji']
+    return symbol
+
+
+def answer_result_text(session: Dict[str, Any], quiz_info: dict, symbol: str, is_correct: bool, user_answer: str) -> str:
+    """Текст результата ответа: подробности о символе и счет"""
+    symbol_data = quiz_info['data'][symbol]
+    response = "✅ Правильно!\n\n" if is_correct else "❌ Неправильно!\n\n"
+    
+    # Формируем детальную информацию о символе
+    response += f"Символ: {symbol}\n"
+    
+    if quiz_info['answer_type'] == "meaning":
+        response += (
+            f"Значение: {symbol_data['meaning']}\n"
+            f"Чтение: {symbol_data['reading']} ({symbol_data['romaji']})\n"
+        )
+    else:
+        response += (
+            f"Romaji: {symbol_data['romaji']}\n"
+            f"Звук: {symbol_data['sound']}\n"
+        )
+    
+    if not is_correct:
+        response += f"Правильный ответ: {get_correct_answer(quiz_info, symbol)}\n"
+        response += f"Твой ответ: {user_answer}\n"
+    
+    response += f"\n📊 Твой счет: {session['score']}/{session['total_questions']}"
+    return response
+
+
+def result_markup(quiz_type: str) -> InlineKeyboardMarkup:
+    """Кнопки под результатом ответа"""
+    keyboard = [
+        [InlineKeyboardButton("🎯 Следующий вопрос", callback_data=f"next_{quiz_type}")],
+        [InlineKeyboardButton(f"📦 Пакет из {BATCH_SIZE} вопросов", callback_data=f"batch_{quiz_type}")],
+        [InlineKeyboardButton("📊 Показать статистику", callback_data="show_stats")],
+        [InlineKeyboardButton("🔙 Выбрать другой тип", callback_data="back_to_menu")]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+
 async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обрабатывает ответ пользователя"""
     user_id = update.effective_user.id
@@ -442,9 +1069,16 @@ async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     session['user_answer_message_id'] = update.message.message_id
     session['all_user_answer_message_ids'].append(update.message.message_id)
     
+    # В пакетном режиме один ответ закрывает сразу все вопросы
+    if session.get('batch_symbols'):
+        await handle_batch_answer(update, context)
+        return
+    
+    # Вопрос проверяем по той версии наборов, из которой он был задан
+    quiz_types = decks.get(session.get('question_version')).quiz_types
     current_quiz_type = session.get('current_quiz_type')
-    if current_quiz_type:
-        quiz_info = QUIZ_TYPES[current_quiz_type]
+    if current_quiz_type in quiz_types:
+        quiz_info = quiz_types[current_quiz_type]
         # Если это режим с кнопками, игнорируем текстовые сообщения
         if quiz_info['answer_type'] == "symbol":
             await update.message.reply_text(
@@ -456,76 +1090,42 @@ async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     current_symbol = session['current_symbol']
     current_quiz_type = session['current_quiz_type']
     
-    if not current_symbol or not current_quiz_type:
+    if not current_symbol or current_symbol not in quiz_types.get(current_quiz_type, {}).get('data', {}):
         await update.message.reply_text("Произошла ошибка. Начни заново с /start")
         return
     
-    quiz_info = QUIZ_TYPES[current_quiz_type]
-    symbol_data = quiz_info['data'][current_symbol]
+    quiz_info = quiz_types[current_quiz_type]
     
-    # Определяем правильный ответ в зависимости от типа викторины
-    if quiz_info['answer_type'] == "meaning":
-        correct_answer = symbol_data['meaning'].lower()
-        is_correct = user_answer in correct_answer or correct_answer in user_answer
-    elif quiz_info['answer_type'] == "romaji":
-        correct_answer = symbol_data['romaji'].lower()
-        is_correct = user_answer == correct_answer
-    else:  # answer_type == "symbol"
-        correct_answer = current_symbol
-        is_correct = user_answer == correct_answer
+    is_correct = check_answer(quiz_info, current_symbol, user_answer)
     
     session['total_questions'] += 1
     session['waiting_for_answer'] = False
     
+    record_symbol_result(user_id, session, current_quiz_type, current_symbol, is_correct)
     if is_correct:
         session['score'] += 1
-        session['symbols_stats'][current_symbol] += 1
-        response = f"✅ Правильно!\n\n"
-    else:
-        session['symbols_stats'][current_symbol] -= 1
-        response = f"❌ Неправильно!\n\n"
-    
-    # Формируем детальную информацию о символе
-    response += f"Символ: {current_symbol}\n"
-    
-    if quiz_info['answer_type'] == "meaning":
-        response += (
-            f"Значение: {symbol_data['meaning']}\n"
-            f"Чтение: {symbol_data['reading']} ({symbol_data['romaji']})\n"
-        )
-    else:
-        response += (
-            f"Romaji: {symbol_data['romaji']}\n"
-            f"Звук: {symbol_data['sound']}\n"
-        )
-    
-    if not is_correct:
-        if quiz_info['answer_type'] == "meaning":
-            response += f"Правильный ответ: {symbol_data['meaning']}\n"
-        elif quiz_info['answer_type'] == "romaji":
-            response += f"Правильный ответ: {symbol_data['romaji']}\n"
-        else:  # answer_type == "symbol"
-            response += f"Правильный ответ: {current_symbol}\n"
-        response += f"Твой ответ: {update.message.text}\n"
-    
-    response += f"\n📊 Твой счет: {session['score']}/{session['total_questions']}"
+    leaderboards.update_user(user_id, update.effective_user.first_name, session, current_quiz_type)
     
-    keyboard = [
-        [InlineKeyboardButton("🎯 Следующий вопрос", callback_data=f"next_{current_quiz_type}")],
-        [InlineKeyboardButton("📊 Показать статистику", callback_data="show_stats")],
-        [InlineKeyboardButton("🔙 Выбрать другой тип", callback_data="back_to_menu")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    response = answer_result_text(session, quiz_info, current_symbol, is_correct, update.message.text)
+    reply_markup = result_markup(current_quiz_type)
     
     # Редактируем сообщение с вопросом, показывая результат
     if session.get('current_question_message_id'):
         try:
-            await context.bot.edit_message_text(
-                chat_id=user_id,
-                message_id=session['current_question_message_id'],
-                text=response,
-                reply_markup=reply_markup
-            )
+            if session.get('question_is_photo'):
+                await context.bot.edit_message_caption(
+                    chat_id=user_id,
+                    message_id=session['current_question_message_id'],
+                    caption=response,
+                    reply_markup=reply_markup
+                )
+            else:
+                await context.bot.edit_message_text(
+                    chat_id=user_id,
+                    message_id=session['current_question_message_id'],
+                    text=response,
+                    reply_markup=reply_markup
+                )
         except Exception:
             # Если не удалось отредактировать, отправляем новое
             message = await update.message.reply_text(response, reply_markup=reply_markup)
@@ -535,6 +1135,8 @@ async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         message = await update.message.reply_text(response, reply_markup=reply_markup)
         session['current_question_message_id'] = message.message_id
         session['all_question_message_ids'].append(message.message_id)
+    
+    prefetch_question(user_id, session)
 
 
 async def handle_button_answer(update: Update, context: ContextTypes.DEFAULT_TYPE, selected_answer: str) -> None:
@@ -552,45 +1154,25 @@ async def handle_button_answer(update: Update, context: ContextTypes.DEFAULT_TYP
     current_symbol = session['current_symbol']
     current_quiz_type = session['current_quiz_type']
     
-    if not current_symbol or not current_quiz_type:
+    quiz_types = decks.get(session.get('question_version')).quiz_types
+    if not current_symbol or current_symbol not in quiz_types.get(current_quiz_type, {}).get('data', {}):
         await query.message.reply_text("Произошла ошибка. Начни заново с /start")
         return
     
-    quiz_info = QUIZ_TYPES[current_quiz_type]
-    symbol_data = quiz_info['data'][current_symbol]
+    quiz_info = quiz_types[current_quiz_type]
     
     session['total_questions'] += 1
     session['waiting_for_answer'] = False
     
     is_correct = selected_answer == current_symbol
     
+    record_symbol_result(user_id, session, current_quiz_type, current_symbol, is_correct)
     if is_correct:
         session['score'] += 1
-        session['symbols_stats'][current_symbol] += 1
-        response = f"✅ Правильно!\n\n"
-    else:
-        session['symbols_stats'][current_symbol] -= 1
-        response = f"❌ Неправильно!\n\n"
-    
-    # Формируем детальную информацию о символе
-    response += f"Символ: {current_symbol}\n"
-    response += (
-        f"Romaji: {symbol_data['romaji']}\n"
-        f"Звук: {symbol_data['sound']}\n"
-    )
-    
-    if not is_correct:
-        response += f"Правильный ответ: {current_symbol}\n"
-        response += f"Твой ответ: {selected_answer}\n"
-    
-    response += f"\n📊 Твой счет: {session['score']}/{session['total_questions']}"
+    leaderboards.update_user(user_id, update.effective_user.first_name, session, current_quiz_type)
     
-    keyboard = [
-        [InlineKeyboardButton("🎯 Следующий вопрос", callback_data=f"next_{current_quiz_type}")],
-        [InlineKeyboardButton("📊 Показать статистику", callback_data="show_stats")],
-        [InlineKeyboardButton("🔙 Выбрать другой тип", callback_data="back_to_menu")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    response = answer_result_text(session, quiz_info, current_symbol, is_correct, selected_answer)
+    reply_markup = result_markup(current_quiz_type)
     
     # Редактируем сообщение с вопросом, показывая результат
     try:
@@ -603,6 +1185,197 @@ async def handle_button_answer(update: Update, context: ContextTypes.DEFAULT_TYP
         message = await query.message.reply_text(response, reply_markup=reply_markup)
         session['current_question_message_id'] = message.message_id
         session['all_question_message_ids'].append(message.message_id)
+    
+    prefetch_question(user_id, session)
+
+
+def split_batch_answers(text: str, quiz_info: dict, count: int) -> list[str]:
+    """Разбивает один ответ пользователя на ответы по каждому вопросу пакета"""
+    if '\n' in text:
+        parts = text.split('\n')
+    elif ';' in text:
+        parts = text.split(';')
+    else:
+        parts = text.split()
+        # Символы кана можно написать слитно: "あかさ"
+        if quiz_info['answer_type'] == "symbol" and len(parts) == 1 and len(parts[0]) == count:
+            parts = list(parts[0])
+    return [part.lower().strip() for part in parts if part.strip()]
+
+
+async def start_batch_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE, quiz_type: str) -> None:
+    """Показывает пакет вопросов одним сообщением"""
+    query = update.callback_query
+    await query.answer()
+    user_id = query.from_user.id
+    session = bot_state.get_user_session(user_id)
+    
+    catalog = decks.current
+    if quiz_type not in catalog.quiz_types:
+        await show_quiz_selection(update, context)
+        return
+    quiz_info = catalog.quiz_types[quiz_type]
+    deck_keys = quiz_keys(catalog, quiz_type, active_deck_mask(session, decks))
+    keys = sample_symbols(
+        session['symbols_stats'], deck_keys, BATCH_SIZE, prior_vector(catalog, quiz_type),
+        slowness_factors(session['answer_times'], deck_keys)
+    )
+    symbols = [catalog.index.symbols[key // DIRECTIONS] for key in keys]
+    
+    session['current_quiz_type'] = quiz_type
+    session['question_version'] = catalog.version
+    session['quiz_started'] = True
+    session['waiting_for_answer'] = True
+    session['current_symbol'] = None
+    session['batch_symbols'] = symbols
+    session['batch_keys'] = keys
+    session['question_serial'] += 1
+    
+    if quiz_info['show_symbol']:
+        items = symbols
+        if quiz_info['answer_type'] == "meaning":
+            hint = "Напиши значения на русском языке по порядку, каждое с новой строки или через пробел:"
+        else:
+            hint = "Напиши чтения латиницей (romaji) по порядку через пробел:"
+    else:
+        items = [quiz_info['data'][symbol]['romaji'] for symbol in symbols]
+        hint = "Напиши символы по порядку через пробел или слитно:"
+    
+    question_text = deck_fallback_note(session, catalog, quiz_type) + (
+        f"📦 Пакет из {len(symbols)} вопросов ({quiz_info['name']})\n"
+        f"📊 Счет: {session['score']}/{session['total_questions']}\n\n"
+        + "\n".join(f"{index}. **{item}**" for index, item in enumerate(items, 1))
+        + f"\n\n{hint}"
+    )
+    keyboard = [[InlineKeyboardButton("🔙 Выбрать другой тип", callback_data="back_to_menu")]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    try:
+        await query.edit_message_text(text=question_text, reply_markup=reply_markup, parse_mode='Markdown')
+        session['current_question_message_id'] = query.message.message_id
+    except Exception:
+        message = await query.message.reply_text(question_text, reply_markup=reply_markup, parse_mode='Markdown')
+        session['current_question_message_id'] = message.message_id
+        session['all_question_message_ids'].append(message.message_id)
+
+
+async def handle_batch_answer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Проверяет весь пакет за один проход и отвечает одной сводкой"""
+    user_id = update.effective_user.id
+    session = bot_state.get_user_session(user_id)
+    
+    symbols = session['batch_symbols']
+    current_quiz_type = session['current_quiz_type']
+    quiz_info = decks.get(session.get('question_version')).quiz_types[current_quiz_type]
+    answers = split_batch_answers(update.message.text, quiz_info, len(symbols))
+    
+    # Недостающие ответы считаются неправильными
+    answers += [""] * (len(symbols) - len(answers))
+    
+    batch_keys = session.get('batch_keys') or [None] * len(symbols)
+    stats_delta = defaultdict(int)
+    results = []
+    lines = []
+    correct_count = 0
+    for index, (symbol, key, user_answer) in enumerate(zip(symbols, batch_keys, answers), 1):
+        correct_answer = get_correct_answer(quiz_info, symbol)
+        is_correct = bool(user_answer) and check_answer(quiz_info, symbol, user_answer)
+        results.append((symbol, is_correct))
+        key = question_key(session, current_quiz_type, symbol, key)
+        if is_correct:
+            correct_count += 1
+            lines.append(f"{index}. ✅ {symbol} — {correct_answer}")
+        else:
+            lines.append(f"{index}. ❌ {symbol} — {correct_answer} (твой ответ: {user_answer or '—'})")
+        if key is not None:
+            stats_delta[key] += 1 if is_correct else -1
+    
+    # Обновляем статистику одним проходом по накопленным изменениям
+    symbols_stats = session['symbols_stats']
+    for key, delta in stats_delta.items():
+        add_delta(symbols_stats, key, delta)
+    global_stats.record_many(current_quiz_type, results)
+    session['score'] += correct_count
+    session['total_questions'] += len(symbols)
+    quiz_type_score = session['quiz_type_scores'].setdefault(current_quiz_type, [0, 0])
+    quiz_type_score[0] += correct_count
+    quiz_type_score[1] += len(symbols)
+    leaderboards.update_user(user_id, update.effective_user.first_name, session, current_quiz_type)
+    session['waiting_for_answer'] = False
+    session['batch_symbols'] = None
+    session['batch_keys'] = None
+    record_symbol_changes(user_id, session, stats_delta)
+    
+    response = (
+        f"📦 Результат пакета: {correct_count}/{len(symbols)}\n\n"
+        + "\n".join(lines)
+        + f"\n\n📊 Твой счет: {session['score']}/{session['total_questions']}"
+    )
+    keyboard = [
+        [InlineKeyboardButton(f"📦 Еще пакет из {BATCH_SIZE}", callback_data=f"batch_{current_quiz_type}")],
+        [InlineKeyboardButton("🎯 По одному вопросу", callback_data=f"next_{current_quiz_type}")],
+        [InlineKeyboardButton("📊 Показать статистику", callback_data="show_stats")],
+        [InlineKeyboardButton("🔙 Выбрать другой тип", callback_data="back_to_menu")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    if session.get('current_question_message_id'):
+        try:
+            await context.bot.edit_message_text(
+                chat_id=user_id,
+                message_id=session['current_question_message_id'],
+                text=response,
+                reply_markup=reply_markup
+            )
+        except Exception:
+            message = await update.message.reply_text(response, reply_markup=reply_markup)
+            session['current_question_message_id'] = message.message_id
+            session['all_question_message_ids'].append(message.message_id)
+    else:
+        message = await update.message.reply_text(response, reply_markup=reply_markup)
+        session['current_question_message_id'] = message.message_id
+        session['all_question_message_ids'].append(message.message_id)
+    
+    prefetch_question(user_id, session)
+
+
+def answer_time_text(session: Dict[str, Any], k: int = 3) -> str:
+    """Медиана времени ответа и символы, над которыми пользователь думает дольше всего"""
+    answer_times = session['answer_times']
+    if not answer_times:
+        return ""
+    overall = answer_times.median()
+    text = f"\n\n⏱ Время ответа (медиана): {overall:.1f} с"
+    keys, medians, counts = answer_times.key_medians()
+    # Медленный символ - дольше обычного хотя бы в двух ответах
+    slow = np.flatnonzero((counts > 1) & (medians > overall))
+    slowest = slow[np.argsort(-medians[slow], kind='stable')[:k]]
+    if len(slowest):
+        symbols = decks.current.index.symbols
+        text += "\n🐢 Дольше всего: " + ", ".join(
+            f"{symbols[keys[index] // DIRECTIONS]} ({medians[index]:.1f} с)" for index in slowest
+        )
+    return text
+
+
+def symbol_rankings_text(user_id: int, session: Dict[str, Any], k: int = STATS_SYMBOLS_SHOWN) -> str:
+    """Самые трудные и самые выученные символы по каждой викторине, в которой пользователь отвечал"""
+    catalog = decks.current
+    symbols = catalog.index.symbols
+    lines = []
+    for quiz_type in session['quiz_type_scores']:
+        if quiz_type not in catalog.quiz_types:
+            continue
+        ranking = symbol_rankings.ranking(user_id, session, catalog, quiz_type)
+        weakest, strongest = ranking.weakest(k), ranking.strongest(k)
+        if not weakest and not strongest:
+            continue
+        lines += ["", f"{catalog.quiz_types[quiz_type]['name']}:"]
+        if weakest:
+            lines.append("❗ Трудные: " + ", ".join(f"{symbols[key // DIRECTIONS]} ({delta})" for key, delta in weakest))
+        if strongest:
+            lines.append("⭐ Выученные: " + ", ".join(f"{symbols[key // DIRECTIONS]} (+{delta})" for key, delta in strongest))
+    return "\n".join([""] + lines) if lines else ""
 
 
 async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -624,6 +1397,15 @@ async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
             f"📝 Всего вопросов: {session['total_questions']}\n"
             f"🎯 Точность: {accuracy:.1f}%"
         )
+        # Узнавание и вспоминание символа - разные навыки, показываем их отдельно
+        symbols_stats = session['symbols_stats']
+        for direction, title in ((RECOGNITION, "👁 Узнавание (символ → чтение)"), (RECALL, "✍️ Вспоминание (чтение → символ)")):
+            deltas = symbols_stats[direction::DIRECTIONS]
+            learned, weak = int((deltas > 0).sum()), int((deltas < 0).sum())
+            if learned or weak:
+                stats_text += f"\n\n{title}:\nосвоено символов: {learned}, трудных: {weak}"
+        stats_text += answer_time_text(session)
+        stats_text += symbol_rankings_text(user_id, session)
     
     # Определяем кнопку для продолжения викторины
     current_quiz_type = session.get('current_quiz_type')
@@ -634,7 +1416,10 @@ async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         continue_button_text = "🔙 Выбрать викторину"
         continue_callback = "back_to_menu"
     
-    keyboard = [[InlineKeyboardButton(continue_button_text, callback_data=continue_callback)]]
+    keyboard = [
+        [InlineKeyboardButton(continue_button_text, callback_data=continue_callback)],
+        [InlineKeyboardButton("🏆 Рейтинг", callback_data="show_top")]
+    ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     message = await query.message.reply_text(stats_text, reply_markup=reply_markup)
@@ -642,6 +1427,442 @@ async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     session['all_stats_message_ids'].append(message.message_id)
 
 
+def format_leaderboard(user_id: int, quiz_type: Optional[str], k: int = LEADERBOARD_SIZE) -> str:
+    """Собирает текст рейтинга: первые k мест и место пользователя"""
+    quiz_types = decks.current.quiz_types
+    title = quiz_types[quiz_type]['name'] if quiz_type in quiz_types else (quiz_type or "все викторины")
+    lines = [f"🏆 Рейтинг: {title}", ""]
+    
+    score_board = leaderboards.board(quiz_type, 'score')
+    lines.append("По правильным ответам:")
+    for place, (neg_score, wrong, top_user_id) in enumerate(score_board.top(k), 1):
+        total = -neg_score + wrong
+        name = leaderboards.names.get(top_user_id, str(top_user_id))
+        lines.append(f"{place}. {name} — {-neg_score} ({-neg_score / total * 100:.1f}%)")
+    rank = score_board.rank(user_id)
+    if rank:
+        lines.append(f"Твое место: {rank} из {len(score_board)}")
+    elif not len(score_board):
+        lines.append("Пока никого нет")
+    
+    accuracy_board = leaderboards.board(quiz_type, 'accuracy')
+    lines += ["", f"По точности (от {MIN_QUESTIONS_FOR_ACCURACY} ответов):"]
+    for place, (neg_accuracy, neg_total, top_user_id) in enumerate(accuracy_board.top(k), 1):
+        name = leaderboards.names.get(top_user_id, str(top_user_id))
+        lines.append(f"{place}. {name} — {-neg_accuracy * 100:.1f}% из {-neg_total}")
+    rank = accuracy_board.rank(user_id)
+    if rank:
+        lines.append(f"Твое место: {rank} из {len(accuracy_board)}")
+    elif not len(accuracy_board):
+        lines.append("Пока никого нет")
+    
+    return "\n".join(lines)
+
+
+def leaderboard_scope_note() -> str:
+    """Оговорка под рейтингом в шардированном режиме: воркер знает только своих пользователей"""
+    shard = current_bot.get().shard
+    if shard is None or shard[1] < 2:
+        return ""
+    return "\n\nℹ️ Бот работает в нескольких процессах: в рейтинге только участники, которых обслуживает этот процесс"
+
+
+async def top_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /top [тип викторины]"""
+    quiz_type = context.args[0] if context.args else None
+    quiz_types = decks.current.quiz_types
+    if quiz_type and quiz_type not in quiz_types:
+        await update.message.reply_text(
+            "Неизвестный тип викторины. Доступны: " + ", ".join(quiz_types.keys())
+        )
+        return
+    await update.message.reply_text(format_leaderboard(update.effective_user.id, quiz_type) + leaderboard_scope_note())
+
+
+async def show_top(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показывает рейтинг по текущему типу викторины и общий"""
+    query = update.callback_query
+    await query.answer()
+    
+    user_id = query.from_user.id
+    session = bot_state.get_user_session(user_id)
+    quiz_type = session.get('current_quiz_type')
+    
+    top_text = format_leaderboard(user_id, None)
+    if quiz_type:
+        top_text += "\n\n" + format_leaderboard(user_id, quiz_type)
+    top_text += leaderboard_scope_note()
+    
+    message = await query.message.reply_text(top_text)
+    session['stats_message_id'] = message.message_id
+    session['all_stats_message_ids'].append(message.message_id)
+
+
+DECK_HELP = (
+    "🗂 Свои наборы символов:\n\n"
+    "/deck new <название> <символы> - создать набор, например: /deck new трудные ぬめねれわ\n"
+    "/deck new <название> weak - символы, на которых ты чаще ошибаешься\n"
+    "/deck new <название> query <запрос> - по запросу, например: query script:katakana voicing:dakuten\n"
+    "/deck add <название> <символы> - добавить символы\n"
+    "/deck remove <название> <символы> - убрать символы\n"
+    "/deck delete <название> - удалить набор\n"
+    "/deck use <название> - задавать вопросы только из набора\n"
+    "/deck off - вернуться к полным наборам"
+)
+
+
+async def deck_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /deck: создание, правка и выбор своих наборов"""
+    user_id = update.effective_user.id
+    session = bot_state.get_user_session(user_id)
+    args = context.args or []
+    action = args[0] if args else ""
+    name = args[1] if len(args) > 1 else ""
+    text = " ".join(args[2:])
+    reply_markup = None
+    active_before = (session.get('active_deck'), active_deck_mask(session, decks))
+    
+    try:
+        if action == "new":
+            mask = create_deck(session, decks, name, text)
+            reply = f"✅ Набор {name} создан: {bin(mask).count('1')} символов"
+        elif action in ("add", "remove"):
+            mask = edit_deck(session, decks, name, text, add=action == "add")
+            reply = f"✅ В наборе {name} теперь {bin(mask).count('1')} символов"
+        elif action == "delete":
+            delete_deck(session, decks, name)
+            reply = f"🗑 Набор {name} удален"
+        elif action == "use":
+            mask = sync_decks(session, decks).get(name)
+            if mask is None:
+                raise CustomDeckError(f"Нет набора {name}")
+            session['active_deck'] = name
+            reply = f"▶️ Вопросы будут только из набора {name}. Выбери викторину:"
+            catalog = decks.current
+            reply_markup = InlineKeyboardMarkup([
+                [InlineKeyboardButton(catalog.quiz_types[quiz_type]['name'], callback_data=f"quiz_{quiz_type}")]
+                for quiz_type in matching_quiz_types(catalog, mask)
+            ])
+        elif action == "off":
+            session['active_deck'] = None
+            reply = "Вопросы снова идут по полным наборам"
+        else:
+            reply = describe_decks(session, decks) + "\n\n" + DECK_HELP
+    except CustomDeckError as e:
+        reply = f"❌ {e}"
+    
+    # Выбранный набор влияет на выбор символов: если он сменился или изменился, заготовка вопроса устаревает
+    if (session.get('active_deck'), active_deck_mask(session, decks)) != active_before:
+        bump_stats_version(session)
+    await update.message.reply_text(reply, reply_markup=reply_markup)
+
+
+def group_quiz_types() -> list:
+    """Типы викторин для групп: с ответом текстом (кнопки с вариантами - только в личном чате)"""
+    return [quiz_type for quiz_type, quiz_info in decks.current.quiz_types.items() if quiz_info['answer_type'] != "symbol"]
+
+
+def build_group_question(game) -> str:
+    """Начинает новый раунд групповой викторины и возвращает текст вопроса"""
+    catalog = decks.current
+    quiz_info = catalog.quiz_types[game.quiz_type]
+    # Общий вопрос для всех: без весов отдельных участников
+    symbol = draw_round_symbol(catalog.symbol_lists[game.quiz_type], game.symbol)
+    game.new_round(quiz_info, symbol, catalog.version)
+    hint = "значение на русском языке" if quiz_info['answer_type'] == "meaning" else "чтение латиницей (romaji)"
+    return (
+        f"❓ Вопрос {game.round} ({quiz_info['name']})\n\n"
+        f"Символ: {symbol}\n\n"
+        f"Кто первым напишет {hint}?"
+    )
+
+
+def format_group_scores(game) -> str:
+    lines = [f"{place}. {name} — {score}" for place, (name, score) in enumerate(game.scoreboard(), 1)]
+    return "\n".join(lines) if lines else "Пока никто не ответил"
+
+
+async def send_group_question(context: ContextTypes.DEFAULT_TYPE, chat_id: int, game, prefix: str = "") -> None:
+    message = await context.bot.send_message(chat_id=chat_id, text=prefix + build_group_question(game))
+    game.question_message_id = message.message_id
+
+
+async def group_quiz_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /quiz [тип викторины]: викторина на весь групповой чат"""
+    chat = update.effective_chat
+    if chat.type not in ("group", "supergroup"):
+        await update.message.reply_text("Групповая викторина работает в группах: добавь бота в группу и набери там /quiz")
+        return
+    quiz_type = context.args[0] if context.args else DEFAULT_GROUP_QUIZ_TYPE
+    available = group_quiz_types()
+    if quiz_type not in available:
+        await update.message.reply_text("В группе доступны викторины: " + ", ".join(available))
+        return
+    game = group_games.start(chat.id, quiz_type)
+    await send_group_question(context, chat.id, game, "🎮 Групповая викторина! Засчитывается первый правильный ответ.\n\n")
+
+
+async def group_score_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /score: счет групповой викторины"""
+    game = group_games.get(update.effective_chat.id)
+    if game is None:
+        await update.message.reply_text("Викторина не идет. Начать: /quiz")
+        return
+    await update.message.reply_text("🏆 Счет:\n" + format_group_scores(game))
+
+
+async def group_stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /stop: завершает групповую викторину"""
+    game = group_games.stop(update.effective_chat.id)
+    if game is None:
+        return
+    await update.message.reply_text("🏁 Викторина окончена!\n\n" + format_group_scores(game))
+
+
+async def handle_group_answer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Ответ в групповом чате: первый правильный выигрывает раунд, остальные отбрасываются молча"""
+    message = update.effective_message
+    # Исправленное сообщение - не новый ответ: иначе можно было бы переписывать ответ до правильного
+    if message is None or update.edited_message is not None or message.from_user is None:
+        return
+    game = group_games.get(message.chat_id)
+    if game is None:
+        return
+    reply = message.reply_to_message
+    # Ответ на старый вопрос бота - опоздавший; ответы на сообщения участников не проверяем
+    reply_to_id = reply.message_id if reply is not None and reply.from_user and reply.from_user.id == context.bot.id else None
+    user = message.from_user
+    if not game.try_answer(user.id, user.first_name, message.text, reply_to_id):
+        return
+    quiz_info = decks.get(game.question_version).quiz_types.get(game.quiz_type)
+    answer = get_correct_answer(quiz_info, game.symbol) if quiz_info and game.symbol in quiz_info['data'] else message.text
+    # Итог раунда и следующий вопрос - одним сообщением
+    await send_group_question(
+        context, message.chat_id, game,
+        f"✅ {user.first_name} первым ответил: {game.symbol} — {answer} (очков: {game.scores[user.id]})\n\n"
+    )
+
+
+def daily_result_text(challenge, correct: int) -> str:
+    """Итог вызова дня для пользователя на фоне остальных участников"""
+    results = challenge.results
+    text = (
+        f"🏁 Вызов дня {challenge.day} пройден: {correct}/{len(challenge)}\n\n"
+        f"Лучше, чем у {results.beaten_share(correct) * 100:.0f}% участников\n"
+        f"Средний результат: {results.average():.1f} (закончили {results.finished})"
+    )
+    hardest = results.hardest()
+    if hardest is not None:
+        index, accuracy = hardest
+        question = challenge.questions[index]
+        text += f"\nСамый трудный вопрос: №{index + 1} ({question.symbol} — {question.answer}), правильно у {accuracy * 100:.0f}%"
+    return text + "\n\nНовый вызов - завтра!"
+
+
+async def show_daily(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показывает текущий вопрос вызова дня или итог, если он уже пройден"""
+    query = update.callback_query
+    if query:
+        await query.answer()
+    session = bot_state.get_user_session(update.effective_user.id)
+    challenge = daily_challenges.today()
+    state = session.get('daily')
+    if not state or state['day'] != challenge.day:
+        state = session['daily'] = {'day': challenge.day, 'cursor': 0, 'correct': 0}
+        challenge.results.started += 1
+    # После пересборки вызова (новая версия каталога) продолжаем с того же номера уже по новым вопросам
+    state['version'] = challenge.catalog_version
+    
+    if state['cursor'] >= len(challenge):
+        await update.effective_message.reply_text(daily_result_text(challenge, state['correct']))
+        return
+    question = challenge.questions[state['cursor']]
+    await update.effective_message.reply_text(question.text, reply_markup=question.markup)
+
+
+async def handle_daily_answer(update: Update, context: ContextTypes.DEFAULT_TYPE, index: int, option: int) -> None:
+    """Проверяет ответ на вопрос дня и показывает следующий в том же сообщении"""
+    query = update.callback_query
+    session = bot_state.get_user_session(query.from_user.id)
+    challenge = daily_challenges.today()
+    state = session.get('daily')
+    # Кнопки вопроса, собранного по старой версии каталога, сверялись бы с ответами новых вопросов
+    if (not state or state['day'] != challenge.day or state['cursor'] != index
+            or state.get('version', challenge.catalog_version) != challenge.catalog_version):
+        await query.answer("Этот вопрос уже закрыт")
+        return
+    
+    question = challenge.questions[index]
+    is_correct = option == question.correct_option
+    state['cursor'] += 1
+    state['correct'] += 1 if is_correct else 0
+    challenge.results.record_answer(index, is_correct)
+    
+    # Ответ идет и в личную статистику: символ ищем в текущей версии каталога
+    key = question_key(session, question.quiz_type, question.symbol, None)
+    if key is not None:
+        add_delta(session['symbols_stats'], key, 1 if is_correct else -1)
+        record_symbol_changes(query.from_user.id, session, (key,))
+    global_stats.record(question.quiz_type, question.symbol, is_correct)
+    
+    await query.answer("✅ Правильно!" if is_correct else f"❌ Правильный ответ: {question.answer}")
+    if state['cursor'] < len(challenge):
+        next_question = challenge.questions[state['cursor']]
+        await query.edit_message_text(next_question.text, reply_markup=next_question.markup)
+    else:
+        challenge.results.record_finish(state['correct'])
+        await query.edit_message_text(
+            daily_result_text(challenge, state['correct']),
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Выбрать викторину", callback_data="back_to_menu")]])
+        )
+
+
+REMIND_HELP = (
+    "🔔 Напоминания о повторении:\n\n"
+    "/remind <часы> - напомнить, если ты не занимался столько часов, например: /remind 24\n"
+    "/remind off - больше не напоминать"
+)
+
+
+async def remind_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /remind: подписка на напоминания о повторении"""
+    session = bot_state.get_user_session(update.effective_user.id)
+    args = context.args or []
+    if not args:
+        interval = session.get('reminder_interval')
+        status = f"Напоминания включены: через {interval // 3600} ч без занятий" if interval else "Напоминания выключены"
+        await update.message.reply_text(f"{status}\n\n{REMIND_HELP}")
+        return
+    if args[0] == "off":
+        session['reminder_interval'] = None
+        await update.message.reply_text("🔕 Больше не буду напоминать")
+        return
+    try:
+        hours = int(args[0])
+    except ValueError:
+        hours = 0
+    if not 1 <= hours <= MAX_REMINDER_HOURS:
+        await update.message.reply_text(f"❌ Укажи число часов от 1 до {MAX_REMINDER_HOURS}\n\n{REMIND_HELP}")
+        return
+    # Срок назначит with_session после обработчика
+    session['reminder_interval'] = hours * 3600
+    await update.message.reply_text(f"🔔 Напомню о повторении, если ты не будешь заниматься {hours} ч")
+
+
+def reminder_message(user_id: int, session: Dict[str, Any]) -> Optional[tuple]:
+    """Текст и кнопка напоминания или None, если повторять нечего"""
+    count = weak_count(session['symbols_stats'])
+    if not count:
+        return None
+    quiz_type = session.get('current_quiz_type')
+    if quiz_type in decks.current.quiz_types:
+        button = InlineKeyboardButton("🎯 Повторить", callback_data=f"continue_{quiz_type}")
+    else:
+        button = InlineKeyboardButton("🎯 Выбрать викторину", callback_data="back_to_menu")
+    text = f"🔔 Пора повторить: ждут повторения {symbols_count_text(count)}"
+    return user_id, text, InlineKeyboardMarkup([[button]])
+
+
+async def send_due_reminders(bot, now: float) -> int:
+    """Рассылает напоминания тем, чей срок наступил, пачками через ограничитель скорости"""
+    due = reminders.pop_expired(now)
+    sent = 0
+    for offset in range(0, len(due), REMINDER_BATCH):
+        batch = due[offset:offset + REMINDER_BATCH]
+        sessions = await bot_state.store.load_many(batch)
+        messages = []
+        for user_id in batch:
+            session = sessions.get(user_id)
+            if session is None or not session.get('reminder_interval'):
+                continue
+            # Следующее напоминание - через тот же интервал, если пользователь так и не вернется
+            reminders.schedule(user_id, now + session['reminder_interval'])
+            message = reminder_message(user_id, session)
+            if message is not None:
+                messages.append(message)
+        for user_id in await reminder_sender.send_batch(bot, messages):
+            # Бот заблокирован: напоминать больше некому
+            reminders.cancel(user_id)
+        sent += len(messages)
+    return sent
+
+
+async def run_reminders(bot, interval: float) -> None:
+    """Фоновая задача: раз в interval секунд рассылает наступившие напоминания"""
+    while True:
+        await asyncio.sleep(interval)
+        # Напоминания подождут: под нагрузкой ответы важнее
+        if admission.overloaded:
+            continue
+        try:
+            sent = await send_due_reminders(bot, time.time())
+        except Exception as e:
+            logger.error("Ошибка рассылки напоминаний: %s", e)
+            continue
+        if sent:
+            logger.info("Разослано напоминаний: %s, в расписании %s", sent, len(reminders))
+
+
+def load_imported_session(user_id: int, session: Dict[str, Any]) -> None:
+    """Восстанавливает рейтинги и напоминания пользователя из выгрузки прогресса"""
+    leaderboards.load_session(user_id, session)
+    symbol_rankings.drop(user_id)
+    if session.get('reminder_interval') and user_id not in reminders:
+        reminders.schedule(user_id, time.time() + session['reminder_interval'])
+
+
+async def reload_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /reload: перечитывает наборы символов без перезапуска"""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    try:
+        changed = await reload_decks()
+    except Exception as e:
+        logger.error("Не удалось перезагрузить наборы символов: %s", e)
+        await update.message.reply_text(f"❌ Наборы не перезагружены, осталась версия {decks.current.version}: {e}")
+        return
+    if changed:
+        await update.message.reply_text(f"✅ Наборы обновлены до версии {decks.current.version}")
+    else:
+        await update.message.reply_text(f"Наборы не изменились (версия {decks.current.version})")
+
+
+async def reload_decks() -> bool:
+    """Перезагружает наборы и готовит для новой версии файлы и картинки"""
+    changed = await decks.reload()
+    if changed:
+        catalog = decks.current
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, bot_state.symbol_generator.generate_all_files, catalog.quiz_types)
+        if glyph_images_enabled():
+            await glyph_renderer.render_all(catalog.show_symbols)
+    return changed
+
+
+async def watch_decks(interval: float) -> None:
+    """Фоновая задача: перезагружает наборы, когда меняется файл с ними"""
+    async for _ in decks.changes(interval):
+        try:
+            await reload_decks()
+        except Exception as e:
+            # Ошибка в файле данных не должна ронять бота: остаемся на прежней версии
+            logger.error("Не удалось перезагрузить наборы символов: %s", e)
+
+
+async def delete_messages(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_ids: list) -> None:
+    """Удаляет сообщения; под нагрузкой откладывает удаление до ее спада"""
+    if admission.overloaded:
+        for message_id in message_ids:
+            admission.defer(functools.partial(context.bot.delete_message, chat_id=chat_id, message_id=message_id))
+        return
+    for message_id in message_ids:
+        try:
+            await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
+        except Exception as e:
+            # Если не удалось удалить (например, сообщение уже удалено), игнорируем
+            logger.debug("Не удалось удалить сообщение %s: %s", message_id, e)
+
+
 async def delete_user_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Удаляет сообщение пользователя, если оно есть"""
     query = update.callback_query
@@ -649,16 +1870,10 @@ async def delete_user_message(update: Update, context: ContextTypes.DEFAULT_TYPE
     session = bot_state.get_user_session(user_id)
     
     # Удаляем сообщение пользователя, если оно было сохранено
-    if session.get('user_answer_message_id'):
-        try:
-            await context.bot.delete_message(
-                chat_id=user_id,
-                message_id=session['user_answer_message_id']
-            )
-            session['user_answer_message_id'] = None
-        except Exception:
-            # Если не удалось удалить (например, сообщение уже удалено), игнорируем
-            pass
+    message_id = session.get('user_answer_message_id')
+    if message_id:
+        session['user_answer_message_id'] = None
+        await delete_messages(context, user_id, [message_id])
 
 
 async def delete_stats_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -668,16 +1883,10 @@ async def delete_stats_message(update: Update, context: ContextTypes.DEFAULT_TYP
     session = bot_state.get_user_session(user_id)
     
     # Удаляем сообщение со статистикой, если оно было сохранено
-    if session.get('stats_message_id'):
-        try:
-            await context.bot.delete_message(
-                chat_id=user_id,
-                message_id=session['stats_message_id']
-            )
-            session['stats_message_id'] = None
-        except Exception:
-            # Если не удалось удалить (например, сообщение уже удалено), игнорируем
-            pass
+    message_id = session.get('stats_message_id')
+    if message_id:
+        session['stats_message_id'] = None
+        await delete_messages(context, user_id, [message_id])
 
 
 async def delete_all_messages_and_show_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -707,19 +1916,41 @@ async def delete_all_messages_and_show_menu(update: Update, context: ContextType
     # Удаляем дубликаты
     unique_message_ids = list(set(all_message_ids))
     
-    logger.info(f"Удаляем {len(unique_message_ids)} сообщений: {unique_message_ids}")
+    # Создаем СОВЕРШЕННО НОВОЕ главное меню
+    welcome_message = (
+        f"🇯🇵 **Выбери тип викторины:**\n\n"
+        "🈳 **Кандзи** - изучение иероглифов\n"
+        "🈶 **Хирагана** - основная слоговая азбука\n"
+        "🈯 **Катакана** - слоговая азбука для заимствованных слов\n\n"
+        "Для каждой азбуки доступны два режима:\n"
+        "• Символ → Romaji\n"
+        "• Romaji → Символ"
+    )
     
-    # Удаляем все сообщения
-    for message_id in unique_message_ids:
+    keyboard = [
+        [InlineKeyboardButton("🈳 Кандзи", callback_data="quiz_kanji")],
+        [InlineKeyboardButton("🈶 Хирагана", callback_data="menu_hiragana")],
+        [InlineKeyboardButton("🈯 Катакана", callback_data="menu_katakana")],
+        [InlineKeyboardButton("📅 Вызов дня", callback_data="daily")]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    # Под нагрузкой не отправляем меню заново: превращаем в него сообщение с нажатой кнопкой
+    menu_message_id = None
+    if admission.overloaded and query.message is not None:
         try:
-            await context.bot.delete_message(
-                chat_id=user_id,
-                message_id=message_id
-            )
+            await query.edit_message_text(welcome_message, reply_markup=reply_markup, parse_mode='Markdown')
+            menu_message_id = query.message.message_id
         except Exception as e:
-            logger.debug(f"Не удалось удалить сообщение {message_id}: {e}")
-            # Игнорируем ошибки удаления
-            pass
+            # Сообщение с картинкой в текст не превратить - отправим меню как обычно
+            logger.debug("Не удалось показать меню на месте: %s", e)
+    if menu_message_id is not None:
+        unique_message_ids = [message_id for message_id in unique_message_ids if message_id != menu_message_id]
+    
+    logger.debug("Удаляем %s сообщений: %s", len(unique_message_ids), unique_message_ids)
+    
+    # Удаляем все сообщения
+    await delete_messages(context, user_id, unique_message_ids)
     
     # Полностью очищаем все ID сообщений
     session['main_menu_message_id'] = None
@@ -737,36 +1968,21 @@ async def delete_all_messages_and_show_menu(update: Update, context: ContextType
     # Сбрасываем состояние викторины
     session['waiting_for_answer'] = False
     session['quiz_started'] = False
+    session['batch_symbols'] = None
+    
+    if menu_message_id is None:
+        # Без нагрузки всегда создаем новое сообщение
+        message = await context.bot.send_message(
+            chat_id=user_id,
+            text=welcome_message,
+            reply_markup=reply_markup,
+            parse_mode='Markdown'
+        )
+        menu_message_id = message.message_id
+    session['main_menu_message_id'] = menu_message_id
+    session['all_main_menu_message_ids'].append(menu_message_id)
     
-    # Создаем СОВЕРШЕННО НОВОЕ главное меню
-    welcome_message = (
-        f"🇯🇵 **Выбери тип викторины:**\n\n"
-        "🈳 **Кандзи** - изучение иероглифов\n"
-        "🈶 **Хирагана** - основная слоговая азбука\n"
-        "🈯 **Катакана** - слоговая азбука для заимствованных слов\n\n"
-        "Для каждой азбуки доступны два режима:\n"
-        "• Символ → Romaji\n"
-        "• Romaji → Символ"
-    )
-    
-    keyboard = [
-        [InlineKeyboardButton("🈳 Кандзи", callback_data="quiz_kanji")],
-        [InlineKeyboardButton("🈶 Хирагана", callback_data="menu_hiragana")],
-        [InlineKeyboardButton("🈯 Катакана", callback_data="menu_katakana")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    # ВСЕГДА создаем новое сообщение (никаких попыток редактирования!)
-    message = await context.bot.send_message(
-        chat_id=user_id,
-        text=welcome_message,
-        reply_markup=reply_markup,
-        parse_mode='Markdown'
-    )
-    session['main_menu_message_id'] = message.message_id
-    session['all_main_menu_message_ids'].append(message.message_id)
-    
-    logger.info(f"Создано новое главное меню с ID: {message.message_id}")
+    logger.debug("Создано новое главное меню с ID: %s", menu_message_id)
 
 
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -782,6 +1998,11 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await delete_user_message(update, context)
         await delete_stats_message(update, context)
         await start_quiz(update, context, quiz_type)
+    elif query.data.startswith("batch_"):
+        quiz_type = query.data.replace("batch_", "")
+        await delete_user_message(update, context)
+        await delete_stats_message(update, context)
+        await start_batch_quiz(update, context, quiz_type)
     elif query.data.startswith("continue_"):
         quiz_type = query.data.replace("continue_", "")
         # Удаляем сообщение со статистикой и продолжаем викторину
@@ -790,8 +2011,15 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     elif query.data.startswith("answer_"):
         selected_answer = query.data.replace("answer_", "")
         await handle_button_answer(update, context, selected_answer)
+    elif query.data.startswith("daily_"):
+        _, index, option = query.data.split("_")
+        await handle_daily_answer(update, context, int(index), int(option))
+    elif query.data == "daily":
+        await show_daily(update, context)
     elif query.data == "show_stats":
         await show_stats(update, context)
+    elif query.data == "show_top":
+        await show_top(update, context)
     elif query.data == "back_to_menu":
         await delete_all_messages_and_show_menu(update, context)
     elif query.data == "menu_hiragana":
@@ -806,21 +2034,220 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await show_katakana_menu(update, context)
 
 
+def total_queue_depth() -> int:
+    return sum(application.update_queue.qsize() for application in running_applications)
+
+
+def runtime_metrics() -> Dict[str, Any]:
+    """Метрики процесса: задержка цикла событий, нагрузка, потерянные записи лога"""
+    return {
+        **loop_watchdog.report(),
+        **{f"admission_{name}": value for name, value in admission.report().items()},
+        **{f"log_dropped_{name}": value for name, value in dropped_records().items()},
+        'bots': len(running_applications),
+    }
+
+
+async def run_metrics_report(interval: float) -> None:
+    """Фоновая задача: раз в interval секунд пишет метрики процесса одной записью"""
+    while True:
+        await asyncio.sleep(interval)
+        metrics_logger.info("Метрики: %s", json.dumps(runtime_metrics(), ensure_ascii=False))
+
+
+def start_background_task(application: Application, coroutine) -> None:
+    """Запускает фоновую задачу и запоминает ее, чтобы остановить при завершении"""
+    background_tasks.append(application.create_task(coroutine))
+
+
+async def stop_background_tasks() -> None:
+    """Отменяет фоновые задачи процесса и ждет, пока они завершатся"""
+    tasks = list(background_tasks)
+    background_tasks.clear()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def start_shared_tasks(application: Application) -> None:
+    """Фоновые задачи, общие для всех ботов процесса (запускаются с первым из них)"""
+    start_background_task(application, loop_watchdog.run())
+    if METRICS_INTERVAL > 0:
+        start_background_task(application, run_metrics_report(METRICS_INTERVAL))
+    # Порядок символов текущей версии нужен, чтобы после смены данных перевести маски своих наборов
+    await asyncio.get_running_loop().run_in_executor(None, decks.save_symbol_tables)
+    start_background_task(application, global_stats.run_periodic_flush(GLOBAL_STATS_FLUSH_INTERVAL))
+    if update_recorder is not None:
+        start_background_task(application, update_recorder.run_periodic_flush())
+    # Глубина очередей обновлений - основной сигнал перегрузки
+    admission.queue_depth = total_queue_depth
+    start_background_task(application, admission.run_deferred())
+    if glyph_images_enabled():
+        start_background_task(application, glyph_renderer.run_periodic_save())
+        # Заранее рисуем картинки всех символов
+        start_background_task(application, glyph_renderer.render_all(decks.current.show_symbols))
+    if DATASET_WATCH_INTERVAL > 0:
+        start_background_task(application, watch_decks(DATASET_WATCH_INTERVAL))
+
+
+async def on_startup(application: Application) -> None:
+    """Загружает сохраненный прогресс и запускает фоновые задачи"""
+    instance = application.bot_data['instance']
+    # Задачи, созданные ниже, запоминают бота, для которого запущены
+    bot_token = current_bot.set(instance)
+    try:
+        if instance.progress_snapshot and instance.restore_saved:
+            for path in instance.read_paths(instance.progress_snapshot):
+                imported = await import_progress(bot_state.store, path, on_session=load_imported_session,
+                                                 keep=instance.owns)
+                logger.info("Загружен прогресс %s пользователей из %s", imported, path)
+        for path in instance.read_paths(instance.reminders_path) if instance.restore_saved else []:
+            scheduled = reminders.load(path, keep=instance.owns)
+            if scheduled:
+                logger.info("Загружено напоминаний из %s: %s", path, scheduled)
+        start_background_task(application, run_reminders(application.bot, REMINDER_RESOLUTION))
+        # Вызов дня собираем сразу, а не на первом запросе
+        daily_challenges.today()
+        start_background_task(application, callback_gate.run_periodic_report(CALLBACK_REPORT_INTERVAL))
+        running_applications.append(application)
+        if len(running_applications) == 1:
+            await start_shared_tasks(application)
+    finally:
+        current_bot.reset(bot_token)
+
+
+async def on_shutdown(application: Application) -> None:
+    """Дописывает отложенные данные и закрывает ресурсы при остановке"""
+    instance = application.bot_data['instance']
+    store = instance.state.store
+    await store.flush()
+    if instance.progress_snapshot:
+        path = instance.write_path(instance.progress_snapshot)
+        exported = await export_progress(store, path, keep=instance.owns)
+        logger.info("Прогресс %s пользователей сохранен в %s", exported, path)
+    await store.close()
+    instance.reminders.save(instance.write_path(instance.reminders_path))
+    if application in running_applications:
+        running_applications.remove(application)
+    # Общее закрываем вместе с последним ботом
+    if not running_applications:
+        await stop_background_tasks()
+        await global_stats.flush_async()
+        glyph_renderer.shutdown()
+        loop_watchdog.stop()
+        if update_recorder is not None:
+            update_recorder.close()
+
+
+async def record_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Пишет обновление в запись трафика; у каждого бота свои псевдонимы пользователей"""
+    update_recorder.record(update, context.bot_data.get('instance', default_bot).name)
+
+
+def build_application(token: str, request: Optional[BaseRequest] = None, with_updater: bool = True,
+                      instance: Optional[BotInstance] = None) -> Application:
+    """Создает приложение и регистрирует все обработчики"""
+    builder = Application.builder().token(token)
+    if request is not None:
+        builder = builder.request(request)
+    if not with_updater:
+        builder = builder.updater(None)
+    application = builder.post_init(on_startup).post_shutdown(on_shutdown).build()
+    application.bot_data['instance'] = instance or default_bot
+    
+    if update_recorder is not None:
+        # Группа -1 идет раньше остальных: записываются все обновления, даже отброшенные потом
+        application.add_handler(TypeHandler(Update, record_update), group=-1)
+    
+    application.add_handler(CommandHandler("start", admit(with_session(start))))
+    application.add_handler(CommandHandler("top", admit(with_session(top_command))))
+    application.add_handler(CommandHandler("deck", admit(with_session(deck_command))))
+    application.add_handler(CommandHandler("remind", admit(with_session(remind_command))))
+    application.add_handler(CommandHandler("daily", admit(with_session(show_daily))))
+    application.add_handler(CommandHandler("quiz", admit(group_quiz_command)))
+    application.add_handler(CommandHandler("score", admit(group_score_command), filters.ChatType.GROUPS))
+    application.add_handler(CommandHandler("stop", admit(group_stop_command), filters.ChatType.GROUPS))
+    application.add_handler(CommandHandler("reload", reload_command))
+    application.add_handler(CallbackQueryHandler(
+        admit(with_session(drop_duplicate_callbacks(drop_stale_callbacks(button_handler))))
+    ))
+    # В группах ответы проверяются без сессий участников
+    application.add_handler(MessageHandler(
+        filters.TEXT & ~filters.COMMAND & filters.ChatType.GROUPS, admit(handle_group_answer)
+    ))
+    application.add_handler(MessageHandler(
+        filters.TEXT & ~filters.COMMAND & filters.ChatType.PRIVATE, admit(with_session(handle_answer))
+    ))
+    
+    return application
+
+
+def bot_name(token: str) -> str:
+    """Имя бота для файлов и логов - его id, первая часть токена"""
+    return token.split(':', 1)[0]
+
+
+async def serve_bots(tokens: List[str]) -> None:
+    """Запускает несколько ботов в одном цикле событий и работает до сигнала остановки"""
+    applications = []
+    for index, token in enumerate(tokens):
+        # Первый токен - основной бот: его сессии, напоминания и выгрузки там же, где у одиночного
+        instance = default_bot if index == 0 else BotInstance(bot_name(token))
+        instance.state.use_store(create_session_store(os.getenv('SESSION_STORE_URL'), instance.session_prefix))
+        applications.append(build_application(token, instance=instance))
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    try:
+        for application in applications:
+            await application.initialize()
+            await on_startup(application)
+            await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+            await application.start()
+            logger.info("Бот @%s запущен", application.bot.username)
+        await stop.wait()
+    finally:
+        for application in applications:
+            if application.updater.running:
+                await application.updater.stop()
+            if application.running:
+                await application.stop()
+            await application.shutdown()
+            await on_shutdown(application)
+
+
 def main() -> None:
     """Запуск бота"""
-    token = os.getenv('BOT_TOKEN')
-    if not token:
+    # Несколько ботов с одними наборами: BOT_TOKENS=token1,token2
+    tokens = [token.strip() for token in os.getenv('BOT_TOKENS', os.getenv('BOT_TOKEN', '')).split(',') if token.strip()]
+    if not tokens:
         logger.error("BOT_TOKEN не найден в переменных окружения!")
         return
     
-    bot_state.symbol_generator.generate_all_files()
+    bot_state.symbol_generator.generate_all_files(decks.current.quiz_types)
     logger.info("Файлы символов сгенерированы")
     
-    application = Application.builder().token(token).build()
+    # Воркеры шардированного режима по умолчанию держат сессии у себя в памяти
+    shard_workers = int(os.getenv('SHARD_WORKERS', '0'))
+    if shard_workers > 0:
+        if len(tokens) > 1:
+            logger.error("Шардированный режим поддерживает только один токен")
+            return
+        # Шардированный режим: фронт-процесс принимает вебхуки и раздает обновления воркерам
+        from sharding import run_sharded
+        run_sharded(tokens[0], shard_workers)
+        return
+    
+    if len(tokens) > 1:
+        logger.info("Запускаем ботов в одном процессе: %s", len(tokens))
+        asyncio.run(serve_bots(tokens))
+        return
     
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CallbackQueryHandler(button_handler))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_answer))
+    bot_state.use_store(create_session_store(os.getenv('SESSION_STORE_URL')))
+    application = build_application(tokens[0])
     
     logger.info("Бот запущен...")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
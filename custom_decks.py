@@ -0,0 +1,134 @@
+"""
+Пользовательские наборы символов: битовые маски поверх общего каталога
+"""
+
+import sys
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from deck_registry import DeckCatalog, DeckRegistry
+from symbol_index import DeckQueryError
+from symbol_stats import DIRECTIONS, sync_session
+
+# Ограничения, чтобы сессия оставалась маленькой
+MAX_DECKS = 20
+MAX_DECK_NAME = 32
+
+
+class CustomDeckError(ValueError):
+    """Ошибка в команде работы с набором; текст показывается пользователю"""
+
+
+def sync_decks(session: Dict[str, Any], registry: DeckRegistry) -> Dict[str, int]:
+    """Наборы пользователя в номерах символов текущей версии каталога"""
+    sync_session(session, registry)
+    return session['custom_decks']
+
+
+def parse_symbols(catalog: DeckCatalog, session: Dict[str, Any], text: str) -> int:
+    """Маска по тексту команды: символы подряд, "query <запрос>" или "weak" (символы с ошибками)"""
+    text = text.strip()
+    if not text:
+        raise CustomDeckError("Укажи символы, например: あいう")
+    keyword, _, rest = text.partition(" ")
+    if keyword == "query":
+        try:
+            return catalog.index.query(rest)
+        except DeckQueryError as e:
+            raise CustomDeckError(str(e)) from None
+    if keyword == "weak":
+        # Символы, на которых пользователь ошибался чаще, чем отвечал правильно (в любом направлении)
+        mask = 0
+        for key in np.flatnonzero(session['symbols_stats'] < 0):
+            mask |= 1 << (int(key) // DIRECTIONS)
+        return mask
+    symbols = [char for char in text if not char.isspace() and char != ","]
+    unknown = [symbol for symbol in symbols if symbol not in catalog.index.ids]
+    if unknown:
+        raise CustomDeckError("Нет в каталоге: " + " ".join(unknown))
+    return catalog.index.mask_of(symbols)
+
+
+def check_name(name: str) -> str:
+    if not name or len(name) > MAX_DECK_NAME:
+        raise CustomDeckError(f"Название набора - одно слово до {MAX_DECK_NAME} символов")
+    return name
+
+
+def create_deck(session: Dict[str, Any], registry: DeckRegistry, name: str, text: str) -> int:
+    decks = sync_decks(session, registry)
+    check_name(name)
+    if name not in decks and len(decks) >= MAX_DECKS:
+        raise CustomDeckError(f"Можно создать не больше {MAX_DECKS} наборов")
+    mask = parse_symbols(registry.current, session, text)
+    if not mask:
+        raise CustomDeckError("В наборе не оказалось ни одного символа")
+    decks[name] = mask
+    return mask
+
+
+def edit_deck(session: Dict[str, Any], registry: DeckRegistry, name: str, text: str, add: bool) -> int:
+    decks = sync_decks(session, registry)
+    if name not in decks:
+        raise CustomDeckError(f"Нет набора {name}")
+    mask = parse_symbols(registry.current, session, text)
+    decks[name] = decks[name] | mask if add else decks[name] & ~mask
+    return decks[name]
+
+
+def delete_deck(session: Dict[str, Any], registry: DeckRegistry, name: str) -> None:
+    decks = sync_decks(session, registry)
+    if decks.pop(name, None) is None:
+        raise CustomDeckError(f"Нет набора {name}")
+    if session['active_deck'] == name:
+        session['active_deck'] = None
+
+
+def active_deck_mask(session: Dict[str, Any], registry: DeckRegistry) -> Optional[int]:
+    """Маска выбранного набора или None, если вопросы идут по всему набору викторины"""
+    name = session.get('active_deck')
+    if name is None:
+        return None
+    return sync_decks(session, registry).get(name)
+
+
+def quiz_keys(catalog: DeckCatalog, quiz_type: str, deck_mask: Optional[int]) -> np.ndarray:
+    """Ключи статистики викторины, ограниченные выбранным набором
+
+    Если в наборе нет символов этой викторины, вопросы идут по полному
+    набору: об этом пользователю говорит deck_fallback_note в боте.
+    """
+    if deck_mask is None:
+        return catalog.deck_keys(quiz_type)
+    keys = catalog.deck_keys(quiz_type, deck_mask)
+    return keys if len(keys) else catalog.deck_keys(quiz_type)
+
+
+def deck_covers(catalog: DeckCatalog, quiz_type: str, deck_mask: Optional[int]) -> bool:
+    """Есть ли в выбранном наборе символы викторины (без набора - всегда)"""
+    return deck_mask is None or bool(deck_mask & catalog.deck_masks[quiz_type])
+
+
+def matching_quiz_types(catalog: DeckCatalog, mask: int) -> List[str]:
+    """Типы викторин, в которых есть символы набора"""
+    return [quiz_type for quiz_type, deck_mask in catalog.deck_masks.items() if deck_mask & mask]
+
+
+def deck_size_bytes(mask: int) -> int:
+    """Сколько памяти занимает набор: объект int с маской"""
+    return sys.getsizeof(mask)
+
+
+def describe_decks(session: Dict[str, Any], registry: DeckRegistry) -> str:
+    decks = sync_decks(session, registry)
+    if not decks:
+        return "У тебя пока нет своих наборов."
+    index = registry.current.index
+    lines = ["🗂 Твои наборы:", ""]
+    for name, mask in decks.items():
+        symbols = index.symbols_of(mask)
+        preview = " ".join(symbols[:20]) + (" …" if len(symbols) > 20 else "")
+        marker = "▶️ " if session.get('active_deck') == name else ""
+        lines.append(f"{marker}{name} ({len(symbols)}, {deck_size_bytes(mask)} Б): {preview}")
+    return "\n".join(lines)
@@ -0,0 +1,198 @@
+"""
+Вызов дня: один набор вопросов на всех пользователей, собирается раз в сутки
+"""
+
+import datetime
+import logging
+import random
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from deck_registry import DeckCatalog
+
+logger = logging.getLogger(__name__)
+
+DAILY_SIZE = 20
+DAILY_OPTIONS = 4
+# Викторины, из которых по очереди берутся вопросы дня
+DAILY_QUIZ_TYPES = (
+    'kanji',
+    'hiragana_to_romaji',
+    'romaji_to_hiragana',
+    'katakana_to_romaji',
+    'romaji_to_katakana',
+    'hiragana_dakuten_to_romaji',
+)
+
+
+def today(now: Optional[datetime.datetime] = None) -> str:
+    """Текущий день вызова (по UTC, чтобы у всех процессов он сменялся одновременно)"""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return now.strftime("%Y-%m-%d")
+
+
+def answer_of(quiz_info: Dict[str, Any], symbol: str) -> str:
+    """Вариант ответа, который видит пользователь на кнопке"""
+    if quiz_info['answer_type'] == "meaning":
+        return quiz_info['data'][symbol]['meaning']
+    if quiz_info['answer_type'] == "romaji":
+        return quiz_info['data'][symbol]['romaji']
+    return symbol
+
+
+def prompt_of(quiz_info: Dict[str, Any], symbol: str) -> str:
+    if quiz_info['show_symbol']:
+        return f"Символ: {symbol}\n\n{quiz_info['question']}"
+    return f"Чтение: {quiz_info['data'][symbol]['romaji']}\n\n{quiz_info['question']}"
+
+
+class DailyQuestion:
+    """Готовый вопрос дня: текст и клавиатура общие для всех пользователей"""
+
+    __slots__ = ('quiz_type', 'symbol', 'answer', 'correct_option', 'text', 'markup')
+
+    def __init__(self, quiz_type: str, symbol: str, answer: str, correct_option: int,
+                 text: str, markup: InlineKeyboardMarkup):
+        self.quiz_type = quiz_type
+        self.symbol = symbol
+        self.answer = answer
+        self.correct_option = correct_option
+        self.text = text
+        self.markup = markup
+
+
+class DailyResults:
+    """Итоги дня, обновляемые на каждом ответе: счетчики по вопросам и распределение результатов"""
+
+    def __init__(self, size: int):
+        self.started = 0
+        # [правильных, всего] по номеру вопроса
+        self.answers: List[List[int]] = [[0, 0] for _ in range(size)]
+        # Сколько пользователей закончили с каждым числом правильных ответов
+        self.histogram: List[int] = [0] * (size + 1)
+
+    @property
+    def finished(self) -> int:
+        return sum(self.histogram)
+
+    def record_answer(self, index: int, is_correct: bool) -> None:
+        counts = self.answers[index]
+        counts[0] += 1 if is_correct else 0
+        counts[1] += 1
+
+    def record_finish(self, correct: int) -> None:
+        self.histogram[correct] += 1
+
+    def carry_over(self, previous: 'DailyResults') -> None:
+        """Переносит итоги пользователей из вызова того же дня, собранного по старой версии каталога
+
+        Счетчики по вопросам не переносятся: вопросы с теми же номерами уже другие.
+        """
+        self.started = previous.started
+        self.histogram = list(previous.histogram)
+
+    def beaten_share(self, correct: int) -> float:
+        """Доля закончивших, у которых правильных ответов меньше"""
+        finished = self.finished
+        return sum(self.histogram[:correct]) / finished if finished else 0.0
+
+    def average(self) -> float:
+        finished = self.finished
+        return sum(score * count for score, count in enumerate(self.histogram)) / finished if finished else 0.0
+
+    def hardest(self) -> Optional[Tuple[int, float]]:
+        """Номер вопроса с наименьшей долей правильных ответов и эта доля"""
+        answered = [(correct / total, index) for index, (correct, total) in enumerate(self.answers) if total]
+        if not answered:
+            return None
+        accuracy, index = min(answered)
+        return index, accuracy
+
+
+class DailyChallenge:
+    """Неизменяемый набор вопросов одного дня
+
+    Символы и варианты выбираются генератором, засеянным датой и версией
+    каталога, поэтому каждый процесс (и каждый воркер шардированного режима)
+    с той же версией наборов собирает один и тот же набор сам, без обмена данными.
+    """
+
+    def __init__(self, day: str, catalog: DeckCatalog, quiz_types: Sequence[str] = DAILY_QUIZ_TYPES,
+                 size: int = DAILY_SIZE):
+        self.day = day
+        self.catalog_version = catalog.version
+        rng = random.Random(f"daily:{day}:{catalog.version}")
+        quiz_types = [quiz_type for quiz_type in quiz_types if catalog.deck_sizes.get(quiz_type, 0) >= DAILY_OPTIONS]
+        if not quiz_types:
+            raise ValueError("Нет наборов для вызова дня")
+        questions = []
+        used = set()
+        for index in range(size):
+            quiz_type = quiz_types[index % len(quiz_types)]
+            quiz_info = catalog.quiz_types[quiz_type]
+            symbols = catalog.symbol_lists[quiz_type]
+            # Без повторов символа в одной викторине, пока набор это позволяет
+            candidates = [symbol for symbol in symbols if (quiz_type, symbol) not in used] or list(symbols)
+            symbol = rng.choice(candidates)
+            used.add((quiz_type, symbol))
+            questions.append(self._build_question(rng, index, size, quiz_type, quiz_info, symbols, symbol))
+        self.questions: Tuple[DailyQuestion, ...] = tuple(questions)
+        self.results = DailyResults(len(self.questions))
+
+    @staticmethod
+    def _build_question(rng: random.Random, index: int, size: int, quiz_type: str, quiz_info: Dict[str, Any],
+                        symbols: Sequence[str], symbol: str) -> DailyQuestion:
+        answer = answer_of(quiz_info, symbol)
+        # Неправильные варианты - ответы других символов того же набора (разные тексты)
+        wrong = []
+        for other in rng.sample(list(symbols), len(symbols)):
+            other_answer = answer_of(quiz_info, other)
+            if other_answer != answer and other_answer not in wrong:
+                wrong.append(other_answer)
+            if len(wrong) == DAILY_OPTIONS - 1:
+                break
+        options = wrong + [answer]
+        rng.shuffle(options)
+        correct_option = options.index(answer)
+        keyboard = [
+            [InlineKeyboardButton(option, callback_data=f"daily_{index}_{option_index}")
+             for option_index, option in enumerate(options[row:row + 2], row)]
+            for row in range(0, len(options), 2)
+        ]
+        text = f"📅 Вызов дня: вопрос {index + 1}/{size} ({quiz_info['name']})\n\n{prompt_of(quiz_info, symbol)}"
+        return DailyQuestion(quiz_type, symbol, answer, correct_option, text, InlineKeyboardMarkup(keyboard))
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+
+class DailyChallenges:
+    """Отдает вызов текущего дня, собирая новый при смене даты или версии каталога
+
+    Без пересборки после /reload процесс до конца дня отдавал бы вызов по
+    старой версии, а перезапущенный воркер собрал бы по новой другой набор.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.current: Optional[DailyChallenge] = None
+
+    def today(self) -> DailyChallenge:
+        day = today()
+        catalog = self.registry.current
+        current = self.current
+        if current is not None and current.day == day and current.catalog_version == catalog.version:
+            return current
+        challenge = DailyChallenge(day, catalog)
+        if current is not None and current.day == day:
+            challenge.results.carry_over(current.results)
+            logger.info("Вызов дня %s пересобран для версии каталога %s", day, catalog.version)
+        elif current is not None:
+            results = current.results
+            logger.info(
+                "Итоги вызова дня %s: начали %s, закончили %s, средний результат %.1f",
+                current.day, results.started, results.finished, results.average()
+            )
+        self.current = challenge
+        return challenge
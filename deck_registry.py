@@ -0,0 +1,204 @@
+"""
+Версии наборов символов для викторин с перезагрузкой без перезапуска бота
+"""
+
+import asyncio
+import hashlib
+import importlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import numpy as np
+
+import japanese_data
+from symbol_index import SymbolIndex, iter_bits
+from symbol_stats import quiz_direction, stats_key
+
+logger = logging.getLogger(__name__)
+
+# Сколько предыдущих версий держать для вопросов, которые уже на экране
+KEEP_VERSIONS = 5
+# Сколько пересечений наборов викторин с пользовательскими наборами держать в кэше
+DECK_KEYS_CACHE_SIZE = 4096
+
+
+class DeckCatalog:
+    """Неизменяемый снимок QUIZ_TYPES со всеми производными индексами"""
+
+    def __init__(self, quiz_types: Dict[str, Dict[str, Any]], symbols: Optional[Dict[str, Dict[str, Any]]] = None):
+        # Каталог по умолчанию - все символы, встречающиеся в наборах с явными данными
+        if symbols is None:
+            symbols = {}
+            for quiz_info in quiz_types.values():
+                symbols.update(quiz_info.get('data', {}))
+        self.symbols = symbols
+        self.index = SymbolIndex(symbols)
+        # Наборы, заданные запросом, получают данные из общего каталога
+        self.quiz_types: Dict[str, Dict[str, Any]] = {}
+        self.deck_masks: Dict[str, int] = {}
+        for quiz_type, quiz_info in quiz_types.items():
+            if 'query' in quiz_info:
+                mask = self.index.query(quiz_info['query'])
+                quiz_info = {**quiz_info, 'data': {symbol: symbols[symbol] for symbol in self.index.symbols_of(mask)}}
+            else:
+                mask = self.index.mask_of(quiz_info['data'])
+            self.quiz_types[quiz_type] = quiz_info
+            self.deck_masks[quiz_type] = mask
+        # Тег версии - хэш содержимого: одинаковые данные дают одинаковую версию
+        content = json.dumps([self.quiz_types, list(symbols)], ensure_ascii=False, sort_keys=True)
+        self.version = hashlib.sha1(content.encode('utf-8')).hexdigest()[:10]
+        # Списки символов для выборки, чтобы не строить их на каждый вопрос
+        self.symbol_lists: Dict[str, Tuple[str, ...]] = {
+            quiz_type: tuple(quiz_info['data']) for quiz_type, quiz_info in self.quiz_types.items()
+        }
+        # Символы, из которых берутся неправильные варианты для режимов с кнопками
+        self.distractor_pools: Dict[str, Tuple[str, ...]] = {
+            quiz_type: self.symbol_lists[quiz_type]
+            for quiz_type, quiz_info in self.quiz_types.items()
+            if quiz_info['answer_type'] == "symbol"
+        }
+        # Размеры наборов для текстов меню
+        self.deck_sizes: Dict[str, int] = {
+            quiz_type: len(quiz_info['data']) for quiz_type, quiz_info in self.quiz_types.items()
+        }
+        # Направление вопроса каждой викторины (узнать символ или вспомнить его)
+        self.directions: Dict[str, int] = {
+            quiz_type: quiz_direction(quiz_info) for quiz_type, quiz_info in self.quiz_types.items()
+        }
+        self._deck_keys_cache: Dict[Tuple[str, int], np.ndarray] = {}
+        self.show_symbols: Tuple[str, ...] = tuple(sorted({
+            symbol
+            for quiz_info in self.quiz_types.values() if quiz_info['show_symbol']
+            for symbol in quiz_info['data']
+        }))
+
+    def deck_keys(self, quiz_type: str, mask: Optional[int] = None) -> np.ndarray:
+        """Ключи статистики (символ, направление) набора викторины, при mask - только попавших в маску
+
+        Результат кэшируется: выборка вопроса читает статистику по этим
+        индексам одним обращением к массиву, без строковых ключей.
+        """
+        deck_mask = self.deck_masks[quiz_type]
+        cache_key = (quiz_type, deck_mask if mask is None else mask & deck_mask)
+        keys = self._deck_keys_cache.get(cache_key)
+        if keys is None:
+            if len(self._deck_keys_cache) >= DECK_KEYS_CACHE_SIZE:
+                self._deck_keys_cache.clear()
+            if mask is None:
+                symbol_ids = [self.index.ids[symbol] for symbol in self.symbol_lists[quiz_type]]
+            else:
+                symbol_ids = list(iter_bits(cache_key[1]))
+            keys = np.array([stats_key(symbol_id, self.directions[quiz_type]) for symbol_id in symbol_ids], dtype=np.intp)
+            self._deck_keys_cache[cache_key] = keys
+        return keys
+
+    def query(self, text: str) -> Tuple[str, ...]:
+        """Символы каталога по запросу (см. SymbolIndex.query)"""
+        return tuple(self.index.symbols_of(self.index.query(text)))
+
+
+def _build_catalog_from_module() -> DeckCatalog:
+    """Перечитывает japanese_data и строит по нему новый снимок (выполняется в потоке)"""
+    module = importlib.reload(japanese_data)
+    return DeckCatalog(module.QUIZ_TYPES, module.ALL_SYMBOLS)
+
+
+class DeckRegistry:
+    """Текущая версия наборов плюс несколько предыдущих
+
+    Новая версия строится в фоне и подменяет текущую одним присваиванием,
+    поэтому обработчики всегда видят целостный снимок.
+    """
+
+    def __init__(self, catalog: Optional[DeckCatalog] = None, symbols_path: str = "data/deck_symbols.json"):
+        catalog = catalog or DeckCatalog(japanese_data.QUIZ_TYPES, japanese_data.ALL_SYMBOLS)
+        self.current = catalog
+        self.versions: "OrderedDict[str, DeckCatalog]" = OrderedDict([(catalog.version, catalog)])
+        self._reload_lock = asyncio.Lock()
+        self._source_mtime = self._get_source_mtime()
+        # Порядок символов каждой версии, которую видел бот: по нему маски пользовательских
+        # наборов переводятся на номера символов новой версии, в том числе после перезапуска
+        self.symbols_path = symbols_path
+        self.symbol_tables: Dict[str, Tuple[str, ...]] = self._load_symbol_tables()
+        self.symbol_tables[catalog.version] = catalog.index.symbols
+
+    def get(self, version: Optional[str]) -> DeckCatalog:
+        """Снимок, по которому был задан вопрос; если он уже вытеснен - текущий"""
+        if version is None:
+            return self.current
+        return self.versions.get(version, self.current)
+
+    def publish(self, catalog: DeckCatalog) -> bool:
+        """Делает снимок текущим; возвращает False, если данные не изменились"""
+        if catalog.version == self.current.version:
+            return False
+        self.versions[catalog.version] = catalog
+        self.versions.move_to_end(catalog.version)
+        self.symbol_tables[catalog.version] = catalog.index.symbols
+        while len(self.versions) > KEEP_VERSIONS:
+            self.versions.popitem(last=False)
+        self.current = catalog
+        return True
+
+    async def reload(self) -> bool:
+        """Перечитывает данные в фоне и атомарно подменяет текущую версию"""
+        async with self._reload_lock:
+            loop = asyncio.get_running_loop()
+            catalog = await loop.run_in_executor(None, _build_catalog_from_module)
+            self._source_mtime = self._get_source_mtime()
+            changed = self.publish(catalog)
+            if changed:
+                logger.info("Наборы символов обновлены до версии %s", catalog.version)
+                await loop.run_in_executor(None, self.save_symbol_tables)
+            return changed
+
+    def remap_mask(self, mask: int, version: Optional[str]) -> Optional[int]:
+        """Переводит маску символов из версии version в текущую; None, если версия неизвестна"""
+        if version is None or version == self.current.version:
+            return mask
+        symbols = self.symbol_tables.get(version)
+        if symbols is None:
+            return None
+        return self.current.index.mask_of(symbols[symbol_id] for symbol_id in iter_bits(mask) if symbol_id < len(symbols))
+
+    def _load_symbol_tables(self) -> Dict[str, Tuple[str, ...]]:
+        try:
+            with open(self.symbols_path, encoding="utf-8") as f:
+                return {version: tuple(symbols) for version, symbols in json.load(f).items()}
+        except (OSError, ValueError):
+            return {}
+
+    def save_symbol_tables(self) -> None:
+        """Сохраняет порядок символов всех версий (несколько КБ, пишется только при их смене)"""
+        os.makedirs(os.path.dirname(self.symbols_path) or ".", exist_ok=True)
+        # Подхватываем версии, записанные другими процессами
+        stored = self._load_symbol_tables()
+        if all(version in stored for version in self.symbol_tables):
+            return
+        stored.update(self.symbol_tables)
+        tmp_path = f"{self.symbols_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({version: "".join(symbols) if all(len(symbol) == 1 for symbol in symbols) else list(symbols)
+                       for version, symbols in stored.items()}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.symbols_path)
+
+    @staticmethod
+    def _get_source_mtime() -> float:
+        try:
+            return os.path.getmtime(japanese_data.__file__)
+        except OSError:
+            return 0.0
+
+    async def changes(self, interval: float) -> AsyncIterator[None]:
+        """Опрашивает файл с данными раз в interval секунд и сообщает, когда он изменился"""
+        while True:
+            await asyncio.sleep(interval)
+            mtime = self._get_source_mtime()
+            if mtime == self._source_mtime:
+                continue
+            # Запоминаем сразу: файл с ошибкой не перечитываем, пока его снова не поправят
+            self._source_mtime = mtime
+            yield
@@ -0,0 +1,165 @@
+"""
+Общая статистика ответов по символам для всех пользователей
+"""
+
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: файл пишет только один процесс
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Сила априорного среднего: сколько ответов "весит" средняя точность для редко встречающихся символов
+PRIOR_SMOOTHING = 20
+# Во сколько раз усиливать отклонение точности символа от средней при переводе в delta
+PRIOR_SCALE = 4.0
+
+
+class GlobalSymbolStats:
+    """Счетчики правильных и неправильных ответов по символам и типам викторин
+
+    Обновление из обработчика - O(1) в памяти, на диск счетчики уходят
+    периодически (run_periodic_flush) и при остановке (flush_async). Несколько
+    процессов дописывают в один файл свои приращения под блокировкой: в
+    шардированном режиме это делает каждый воркер из тех же on_startup и
+    on_shutdown, что и одиночный бот. Априорные веса воркер видит с учетом
+    чужих ответов после своего следующего сброса.
+    """
+
+    def __init__(self, path: str = "data/global_stats.json"):
+        self.path = path
+        # [правильных, неправильных] по типу викторины и символу
+        self.by_quiz_type: Dict[str, Dict[str, List[int]]] = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+        self.by_symbol: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+        # Приращения с последнего сброса на диск
+        self._pending: Dict[Tuple[str, str], List[int]] = defaultdict(lambda: [0, 0])
+        self._priors: Dict[str, Dict[str, float]] = {}
+        self._load()
+
+    def record(self, quiz_type: str, symbol: str, is_correct: bool) -> None:
+        """Учитывает один ответ"""
+        column = 0 if is_correct else 1
+        self.by_quiz_type[quiz_type][symbol][column] += 1
+        self.by_symbol[symbol][column] += 1
+        self._pending[(quiz_type, symbol)][column] += 1
+
+    def record_many(self, quiz_type: str, results: Iterable[Tuple[str, bool]]) -> None:
+        """Учитывает пачку ответов (пакетный режим)"""
+        for symbol, is_correct in results:
+            self.record(quiz_type, symbol, is_correct)
+
+    def prior_deltas(self, quiz_type: str) -> Dict[str, float]:
+        """Априорные delta для новичков: отрицательные у символов, на которых ошибаются чаще среднего"""
+        priors = self._priors.get(quiz_type)
+        if priors is None:
+            priors = self._compute_priors(quiz_type)
+            self._priors[quiz_type] = priors
+        return priors
+
+    def _compute_priors(self, quiz_type: str) -> Dict[str, float]:
+        counts = self.by_quiz_type.get(quiz_type)
+        if not counts:
+            return {}
+        total_correct = sum(correct for correct, _ in counts.values())
+        total = sum(correct + incorrect for correct, incorrect in counts.values())
+        if not total:
+            return {}
+        mean_accuracy = total_correct / total
+        priors = {}
+        for symbol, (correct, incorrect) in counts.items():
+            # Сглаживаем к средней точности, чтобы пара случайных ошибок не делала символ "трудным"
+            accuracy = (correct + PRIOR_SMOOTHING * mean_accuracy) / (correct + incorrect + PRIOR_SMOOTHING)
+            priors[symbol] = PRIOR_SCALE * (accuracy - mean_accuracy)
+        return priors
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._replace_counts(stored)
+
+    def _replace_counts(self, stored: Dict[str, Dict[str, List[int]]]) -> None:
+        self.by_quiz_type.clear()
+        self.by_symbol.clear()
+        for quiz_type, counts in stored.items():
+            for symbol, (correct, incorrect) in counts.items():
+                self.by_quiz_type[quiz_type][symbol] = [correct, incorrect]
+                self.by_symbol[symbol][0] += correct
+                self.by_symbol[symbol][1] += incorrect
+        # Счетчики, накопленные после чтения файла, не должны потеряться
+        for (quiz_type, symbol), (correct, incorrect) in self._pending.items():
+            self.by_quiz_type[quiz_type][symbol][0] += correct
+            self.by_quiz_type[quiz_type][symbol][1] += incorrect
+            self.by_symbol[symbol][0] += correct
+            self.by_symbol[symbol][1] += incorrect
+
+    def _take_pending(self) -> Dict[Tuple[str, str], List[int]]:
+        pending = self._pending
+        self._pending = defaultdict(lambda: [0, 0])
+        return pending
+
+    def _restore_pending(self, pending: Dict[Tuple[str, str], List[int]]) -> None:
+        for key, (correct, incorrect) in pending.items():
+            self._pending[key][0] += correct
+            self._pending[key][1] += incorrect
+
+    def _merge_into_file(self, pending: Dict[Tuple[str, str], List[int]]) -> Dict[str, Dict[str, List[int]]]:
+        """Дописывает приращения в файл под блокировкой и возвращает его новое содержимое"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.lock", "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    stored = json.load(f)
+            except (OSError, ValueError):
+                stored = {}
+            for (quiz_type, symbol), (correct, incorrect) in pending.items():
+                counts = stored.setdefault(quiz_type, {}).setdefault(symbol, [0, 0])
+                counts[0] += correct
+                counts[1] += incorrect
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(stored, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        return stored
+
+    def flush(self) -> None:
+        """Дописывает накопленные приращения в файл и пересчитывает априорные веса"""
+        if not self._pending:
+            return
+        stored = self._merge_into_file(self._take_pending())
+        # Подхватываем приращения других процессов
+        self._replace_counts(stored)
+        self._priors.clear()
+
+    async def flush_async(self) -> None:
+        """То же, что flush, но файловый ввод-вывод идет вне event loop"""
+        if not self._pending:
+            return
+        pending = self._take_pending()
+        try:
+            stored = await asyncio.get_running_loop().run_in_executor(None, self._merge_into_file, pending)
+        except OSError:
+            self._restore_pending(pending)
+            raise
+        self._replace_counts(stored)
+        self._priors.clear()
+
+    async def run_periodic_flush(self, interval: float) -> None:
+        """Фоновая задача: сбрасывает счетчики на диск раз в interval секунд"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush_async()
+            except OSError as e:
+                logger.error("Не удалось сохранить общую статистику: %s", e)
@@ -0,0 +1,186 @@
+"""
+Рендер японских символов в картинки с кэшем на диске и повторным использованием file_id
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Optional, Union
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:  # Pillow не установлен: викторина показывает символы текстом
+    Image = ImageDraw = ImageFont = None
+
+logger = logging.getLogger(__name__)
+
+# Меняется при изменении способа отрисовки, чтобы старые картинки не попадали в кэш
+RENDERER_VERSION = 1
+# Новые file_id копятся в памяти и пишутся на диск не чаще, чем раз в столько секунд
+FILE_IDS_SAVE_INTERVAL = 30.0
+
+# Шрифты с японскими символами, которые ищем, если путь не задан явно
+DEFAULT_FONT_PATHS = (
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/noto/NotoSansJP-Regular.ttf",
+    "/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc",
+    "C:\\Windows\\Fonts\\msgothic.ttc",
+)
+
+
+def find_font(font_path: Optional[str] = None) -> Optional[str]:
+    """Возвращает путь к шрифту с японскими символами или None"""
+    candidates = [font_path] if font_path else DEFAULT_FONT_PATHS
+    for candidate in candidates:
+        if candidate and os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def render_glyph(symbol: str, font_path: str, size: int, filepath: str) -> str:
+    """Рисует символ в PNG (выполняется в отдельном процессе)"""
+    image = Image.new("L", (size, size), color=255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.truetype(font_path, int(size * 0.7))
+    # Центрируем по реальным границам глифа, а не по метрикам шрифта
+    left, top, right, bottom = draw.textbbox((0, 0), symbol, font=font)
+    position = ((size - (right - left)) / 2 - left, (size - (bottom - top)) / 2 - top)
+    draw.text(position, symbol, font=font, fill=0)
+
+    # Пишем через временный файл, чтобы параллельный читатель не увидел половину картинки
+    tmp_path = f"{filepath}.{os.getpid()}.tmp"
+    image.save(tmp_path, format="PNG", optimize=True)
+    os.replace(tmp_path, filepath)
+    return filepath
+
+
+def read_file(filepath: str) -> bytes:
+    with open(filepath, "rb") as f:
+        return f.read()
+
+
+class GlyphRenderer:
+    """Картинки символов: рендер в пуле процессов, кэш на диске и file_id из Telegram"""
+
+    def __init__(self, cache_dir: str = "data/glyphs", font_path: Optional[str] = None,
+                 size: int = 256, max_workers: Optional[int] = None):
+        self.cache_dir = cache_dir
+        self.font_path = find_font(font_path)
+        self.size = size
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._file_ids_path = os.path.join(cache_dir, "file_ids.json")
+        self._file_ids: Dict[str, str] = self._load_file_ids()
+        self._file_ids_dirty = False
+        # Отпечаток шрифта входит в хэш: другой шрифт - другие картинки
+        self._font_fingerprint = self._fingerprint_font()
+
+    @property
+    def enabled(self) -> bool:
+        return Image is not None and self.font_path is not None
+
+    def _fingerprint_font(self) -> str:
+        if not self.font_path:
+            return ""
+        stat = os.stat(self.font_path)
+        return f"{os.path.basename(self.font_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+    def _load_file_ids(self) -> Dict[str, str]:
+        try:
+            with open(self._file_ids_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_file_ids(self, file_ids: Dict[str, str]) -> None:
+        """Пишет file_id на диск (в потоке пула): добавляет к записанным другими процессами"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        merged = {**self._load_file_ids(), **file_ids}
+        tmp_path = f"{self._file_ids_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(merged, f, ensure_ascii=False)
+        os.replace(tmp_path, self._file_ids_path)
+
+    async def save_file_ids(self) -> None:
+        """Сохраняет новые file_id, не блокируя цикл событий"""
+        if not self._file_ids_dirty:
+            return
+        self._file_ids_dirty = False
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write_file_ids, dict(self._file_ids))
+        except OSError as e:
+            self._file_ids_dirty = True
+            logger.warning("Не удалось сохранить file_id картинок: %s", e)
+
+    async def run_periodic_save(self, interval: float = FILE_IDS_SAVE_INTERVAL) -> None:
+        """Фоновая задача: раз в interval секунд сохраняет накопленные file_id"""
+        while True:
+            await asyncio.sleep(interval)
+            await self.save_file_ids()
+
+    def cache_key(self, symbol: str) -> str:
+        """Хэш всего, от чего зависит содержимое картинки"""
+        content = f"{RENDERER_VERSION}|{self._font_fingerprint}|{self.size}|{symbol}"
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()[:32]
+
+    def image_path(self, symbol: str) -> str:
+        return os.path.join(self.cache_dir, f"{self.cache_key(symbol)}.png")
+
+    async def render(self, symbol: str) -> str:
+        """Возвращает путь к картинке, рисуя ее в пуле процессов, если ее еще нет на диске"""
+        filepath = self.image_path(symbol)
+        if os.path.exists(filepath):
+            return filepath
+
+        # Одновременные запросы одного символа ждут один и тот же рендер
+        key = self.cache_key(symbol)
+        if key not in self._pending:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor, render_glyph, symbol, self.font_path, self.size, filepath)
+            self._pending[key] = future
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(self._pending[key])
+
+    async def render_all(self, symbols: Iterable[str]) -> int:
+        """Заранее рисует все символы, которых нет в кэше"""
+        missing = [symbol for symbol in set(symbols) if not os.path.exists(self.image_path(symbol))]
+        if missing:
+            await asyncio.gather(*(self.render(symbol) for symbol in missing))
+        return len(missing)
+
+    def file_id_key(self, symbol: str, bot_id: int) -> str:
+        # file_id действует только для бота, который загрузил картинку
+        return f"{bot_id}:{self.cache_key(symbol)}"
+
+    async def photo_for(self, symbol: str, bot_id: int) -> Union[str, bytes]:
+        """Отдает file_id, если картинка уже загружалась в Telegram этим ботом, иначе ее содержимое"""
+        file_id = self._file_ids.get(self.file_id_key(symbol, bot_id))
+        if file_id:
+            return file_id
+        filepath = await self.render(symbol)
+        return await asyncio.get_running_loop().run_in_executor(None, read_file, filepath)
+
+    def remember_file_id(self, symbol: str, bot_id: int, file_id: str) -> None:
+        """Запоминает file_id после первой загрузки, чтобы больше не отправлять картинку"""
+        key = self.file_id_key(symbol, bot_id)
+        if self._file_ids.get(key) == file_id:
+            return
+        self._file_ids[key] = file_id
+        # На диск - пачкой из run_periodic_save или при остановке
+        self._file_ids_dirty = True
+
+    def shutdown(self) -> None:
+        if self._file_ids_dirty:
+            self._file_ids_dirty = False
+            self._write_file_ids(dict(self._file_ids))
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
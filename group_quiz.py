@@ -0,0 +1,140 @@
+"""
+Викторина в групповом чате: один вопрос на всех, засчитывается первый правильный ответ
+"""
+
+import heapq
+import random
+import re
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Сколько участников показывать в таблице счета
+SCOREBOARD_SIZE = 10
+
+
+WORD_PATTERN = re.compile(r"\w+")
+# Разделители вариантов значения: "солнце, день"
+MEANING_SEPARATORS = re.compile(r"[,;/]")
+
+
+def answer_words(text: str) -> Tuple[str, ...]:
+    """Слова текста в нижнем регистре без знаков препинания (ё не отличается от е)"""
+    return tuple(WORD_PATTERN.findall(text.lower().replace("ё", "е")))
+
+
+def contains_words(words: Tuple[str, ...], phrase: Tuple[str, ...]) -> bool:
+    """Есть ли phrase в words целыми словами подряд"""
+    size = len(phrase)
+    return any(words[start:start + size] == phrase for start in range(len(words) - size + 1))
+
+
+def answer_matcher(quiz_info: Dict[str, Any], symbol: str) -> Callable[[str], bool]:
+    """Проверка ответа, подготовленная один раз на вопрос
+
+    Строже, чем check_answer в личной викторине: там ответ сверяется с
+    подстрокой значения, а в группе участники соревнуются, и сообщение из
+    одной буквы не должно выигрывать раунд. Значение засчитывается, если в
+    ответе целыми словами есть один из его вариантов ("солнце, день" - это
+    "солнце" или "день"). Варианты разбираются заранее, один раз на вопрос.
+    """
+    symbol_data = quiz_info['data'][symbol]
+    if quiz_info['answer_type'] == "meaning":
+        meaning = symbol_data['meaning']
+        variants = {answer_words(variant) for variant in MEANING_SEPARATORS.split(meaning)}
+        variants.add(answer_words(meaning))
+        variants.discard(())
+
+        def matches(answer: str) -> bool:
+            words = answer_words(answer)
+            return any(contains_words(words, variant) for variant in variants)
+        return matches
+    if quiz_info['answer_type'] == "romaji":
+        correct = symbol_data['romaji'].lower()
+        return lambda answer: answer == correct
+    return lambda answer: answer == symbol
+
+
+def draw_round_symbol(symbols: Sequence[str], previous: Optional[str]) -> str:
+    """Символ нового раунда, отличный от символа прошлого раунда
+
+    Следующий раунд открывается сразу после победы, и запоздавший ответ на
+    старый вопрос с тем же символом выиграл бы уже новый раунд.
+    """
+    symbol = random.choice(symbols)
+    while symbol == previous and len(symbols) > 1:
+        symbol = random.choice(symbols)
+    return symbol
+
+
+class GroupGame:
+    """Состояние викторины одного группового чата
+
+    Ответы проверяются без загрузки сессий участников и без запросов к Bot API:
+    сообщения, пришедшие после того, как раунд уже выигран, и ответы на старые
+    вопросы просто отбрасываются.
+    """
+
+    __slots__ = ('quiz_type', 'round', 'symbol', 'question_version', 'question_message_id',
+                 'is_open', '_matches', 'scores', 'names', 'late_answers')
+
+    def __init__(self, quiz_type: str):
+        self.quiz_type = quiz_type
+        self.round = 0
+        self.symbol: Optional[str] = None
+        self.question_version: Optional[str] = None
+        self.question_message_id: Optional[int] = None
+        self.is_open = False
+        self._matches: Callable[[str], bool] = lambda answer: False
+        # Участник -> число выигранных раундов
+        self.scores: Dict[int, int] = {}
+        self.names: Dict[int, str] = {}
+        self.late_answers = 0
+
+    def new_round(self, quiz_info: Dict[str, Any], symbol: str, question_version: str) -> None:
+        self.round += 1
+        self.symbol = symbol
+        self.question_version = question_version
+        self.question_message_id = None
+        self._matches = answer_matcher(quiz_info, symbol)
+        self.is_open = True
+
+    def try_answer(self, user_id: int, name: str, text: str, reply_to_message_id: Optional[int] = None) -> bool:
+        """Засчитывает ответ, если он первый правильный в открытом раунде
+
+        Между проверкой и закрытием раунда нет await, поэтому из пачки
+        одновременных ответов выигрывает ровно один.
+        """
+        if not self.is_open or (reply_to_message_id is not None and reply_to_message_id != self.question_message_id):
+            self.late_answers += 1
+            return False
+        if not self._matches(text.lower().strip()):
+            return False
+        self.is_open = False
+        self.scores[user_id] = self.scores.get(user_id, 0) + 1
+        self.names[user_id] = name
+        return True
+
+    def scoreboard(self, k: int = SCOREBOARD_SIZE) -> List[Tuple[str, int]]:
+        """Первые k участников по счету"""
+        leaders = heapq.nlargest(k, self.scores.items(), key=lambda item: item[1])
+        return [(self.names.get(user_id, str(user_id)), score) for user_id, score in leaders]
+
+
+class GroupGames:
+    """Идущие групповые викторины по chat_id"""
+
+    def __init__(self):
+        self.games: Dict[int, GroupGame] = {}
+
+    def start(self, chat_id: int, quiz_type: str) -> GroupGame:
+        """Начинает викторину заново (или меняет тип, сохраняя счет)"""
+        game = self.games.get(chat_id)
+        if game is None:
+            game = self.games[chat_id] = GroupGame(quiz_type)
+        game.quiz_type = quiz_type
+        return game
+
+    def get(self, chat_id: int) -> Optional[GroupGame]:
+        return self.games.get(chat_id)
+
+    def stop(self, chat_id: int) -> Optional[GroupGame]:
+        return self.games.pop(chat_id, None)
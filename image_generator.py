@@ -3,7 +3,8 @@
 """
 
 import os
-from japanese_data import QUIZ_TYPES
+from japanese_data import QUIZ_TYPES, ALL_SYMBOLS
+from deck_registry import DeckCatalog
 
 
 class JapaneseSymbolGenerator:
@@ -31,11 +32,14 @@ class JapaneseSymbolGenerator:
         
         return filepath
     
-    def generate_all_files(self):
-        """Генерирует файлы для всех типов символов"""
+    def generate_all_files(self, quiz_types=None):
+        """Генерирует файлы для всех типов символов (по умолчанию - из japanese_data)"""
         all_generated_files = {}
+        if quiz_types is None:
+            # Наборы, заданные запросом, получают данные только в каталоге
+            quiz_types = DeckCatalog(QUIZ_TYPES, ALL_SYMBOLS).quiz_types
         
-        for quiz_type, quiz_info in QUIZ_TYPES.items():
+        for quiz_type, quiz_info in quiz_types.items():
             generated_files = []
             data = quiz_info['data']
             folder = quiz_info['folder']
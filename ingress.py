@@ -0,0 +1,84 @@
+"""
+Отсев повторных и устаревших нажатий кнопок до обработчиков
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Кнопки, которые живут только на текущем сообщении с вопросом или результатом
+QUESTION_CALLBACK_PREFIXES = ("answer_", "next_", "batch_")
+
+
+class CallbackGate:
+    """Решает, какие нажатия кнопок обрабатывать
+
+    На медленном соединении пользователи нажимают кнопку по несколько раз:
+    каждое нажатие прогоняло бы весь обработчик с запросами к Bot API.
+    Повтор того же нажатия на тот же вопрос в пределах окна отбрасывается,
+    как и нажатие на кнопку старого вопроса.
+    """
+
+    def __init__(self, window: float = 1.0, max_entries: int = 10000):
+        self.window = window
+        self.max_entries = max_entries
+        # (пользователь, сообщение, данные кнопки, поколение вопроса) -> время нажатия, по возрастанию времени
+        self._recent: "OrderedDict[Tuple[int, Optional[int], str, Hashable], float]" = OrderedDict()
+        self.dropped: Dict[str, int] = {'duplicate': 0, 'stale': 0}
+        self._reported: Dict[str, int] = dict(self.dropped)
+
+    def is_duplicate(self, user_id: int, message_id: Optional[int], data: str,
+                     generation: Hashable = None, now: Optional[float] = None) -> bool:
+        """Было ли такое же нажатие меньше window секунд назад (тогда его отбрасываем)
+
+        generation - поколение вопроса в сообщении: сообщение правится на месте,
+        и то же нажатие на новый вопрос в нем повтором не считается.
+        """
+        now = time.monotonic() if now is None else now
+        # Старые записи лежат в начале: выкидываем их, пока не дойдем до свежих
+        while self._recent:
+            pressed_at = next(iter(self._recent.values()))
+            if now - pressed_at < self.window and len(self._recent) < self.max_entries:
+                break
+            self._recent.popitem(last=False)
+
+        key = (user_id, message_id, data, generation)
+        if key in self._recent:
+            self.dropped['duplicate'] += 1
+            return True
+        self._recent[key] = now
+        return False
+
+    def is_stale(self, session: Dict[str, Any], message_id: Optional[int], data: str) -> bool:
+        """Нажата кнопка вопроса, который уже сменился или закрыт"""
+        if not data.startswith(QUESTION_CALLBACK_PREFIXES):
+            return False
+        stale = message_id is None or message_id != session.get('current_question_message_id')
+        if not stale and data.startswith("answer_"):
+            # На этот вопрос уже ответили: кнопки с вариантами остались от него
+            stale = not session.get('waiting_for_answer') or bool(session.get('batch_symbols'))
+        if stale:
+            self.dropped['stale'] += 1
+        return stale
+
+    def take_report(self) -> Dict[str, int]:
+        """Сколько нажатий отброшено с прошлого отчета"""
+        report = {reason: count - self._reported[reason] for reason, count in self.dropped.items()}
+        self._reported = dict(self.dropped)
+        return report
+
+    async def run_periodic_report(self, interval: float) -> None:
+        """Фоновая задача: раз в interval секунд пишет в лог число отброшенных нажатий"""
+        while True:
+            await asyncio.sleep(interval)
+            report = self.take_report()
+            if any(report.values()):
+                logger.info(
+                    "Отброшено нажатий за %.0f с: повторных %s, устаревших %s (всего %s и %s)",
+                    interval, report['duplicate'], report['stale'],
+                    self.dropped['duplicate'], self.dropped['stale']
+                )
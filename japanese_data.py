@@ -2,67 +2,103 @@
 База данных японских символов для викторин
 """
 
-# Кандзи (иероглифы)
+# Кандзи (иероглифы): jlpt, strokes и radicals используются в запросах наборов (symbol_index.py)
 KANJI_DATA = {
     "水": {
         "meaning": "вода",
         "reading": "みず",
-        "romaji": "mizu"
+        "romaji": "mizu",
+        "jlpt": 5,
+        "strokes": 4,
+        "radicals": ["水"]
     },
     "火": {
         "meaning": "огонь",
         "reading": "ひ",
-        "romaji": "hi"
+        "romaji": "hi",
+        "jlpt": 5,
+        "strokes": 4,
+        "radicals": ["火"]
     },
     "木": {
         "meaning": "дерево",
         "reading": "き",
-        "romaji": "ki"
+        "romaji": "ki",
+        "jlpt": 5,
+        "strokes": 4,
+        "radicals": ["木"]
     },
     "金": {
         "meaning": "золото, металл",
         "reading": "きん",
-        "romaji": "kin"
+        "romaji": "kin",
+        "jlpt": 5,
+        "strokes": 8,
+        "radicals": ["金"]
     },
     "土": {
         "meaning": "земля",
         "reading": "つち",
-        "romaji": "tsuchi"
+        "romaji": "tsuchi",
+        "jlpt": 5,
+        "strokes": 3,
+        "radicals": ["土"]
     },
     "人": {
         "meaning": "человек",
         "reading": "ひと",
-        "romaji": "hito"
+        "romaji": "hito",
+        "jlpt": 5,
+        "strokes": 2,
+        "radicals": ["人"]
     },
     "日": {
         "meaning": "солнце, день",
         "reading": "ひ",
-        "romaji": "hi"
+        "romaji": "hi",
+        "jlpt": 5,
+        "strokes": 4,
+        "radicals": ["日"]
     },
     "月": {
         "meaning": "луна, месяц",
         "reading": "つき",
-        "romaji": "tsuki"
+        "romaji": "tsuki",
+        "jlpt": 5,
+        "strokes": 4,
+        "radicals": ["月"]
     },
     "山": {
         "meaning": "гора",
         "reading": "やま",
-        "romaji": "yama"
+        "romaji": "yama",
+        "jlpt": 5,
+        "strokes": 3,
+        "radicals": ["山"]
     },
     "川": {
         "meaning": "река",
         "reading": "かわ",
-        "romaji": "kawa"
+        "romaji": "kawa",
+        "jlpt": 5,
+        "strokes": 3,
+        "radicals": ["川"]
     },
     "大": {
         "meaning": "большой",
         "reading": "おおきい",
-        "romaji": "ookii"
+        "romaji": "ookii",
+        "jlpt": 5,
+        "strokes": 3,
+        "radicals": ["大"]
     },
     "小": {
         "meaning": "маленький",
         "reading": "ちいさい",
-        "romaji": "chiisai"
+        "romaji": "chiisai",
+        "jlpt": 5,
+        "strokes": 3,
+        "radicals": ["小"]
     }
 }
 
@@ -242,8 +278,9 @@ KATAKANA_DATA = {
     "ン": {"romaji": "n", "sound": "н"}
 }
 
-# Комбинированные наборы хираганы
-HIRAGANA_FULL_DATA = {**HIRAGANA_DATA, **HIRAGANA_DAKUTEN_DATA}
+# Общий каталог всех символов. Наборы с ключом "query" вместо "data" собираются из него
+# запросом по метаданным (см. symbol_index.py), а не копированием словарей
+ALL_SYMBOLS = {**KANJI_DATA, **HIRAGANA_DATA, **HIRAGANA_DAKUTEN_DATA, **KATAKANA_DATA}
 
 # Типы викторин
 QUIZ_TYPES = {
@@ -296,7 +333,7 @@ QUIZ_TYPES = {
     # Полная хирагана (базовая + тэнтэн + мару)
     "hiragana_full_to_romaji": {
         "name": "🈶 Полная Хирагана → Romaji",
-        "data": HIRAGANA_FULL_DATA,
+        "query": "script:hiragana",
         "folder": "data/hiragana_full",
         "question": "Как читается этот символ хираганы?",
         "answer_type": "romaji",
@@ -304,7 +341,7 @@ QUIZ_TYPES = {
     },
     "romaji_to_hiragana_full": {
         "name": "🔤 Romaji → Полная Хирагана",
-        "data": HIRAGANA_FULL_DATA,
+        "query": "script:hiragana",
         "folder": "data/hiragana_full",
         "question": "Какой символ хираганы соответствует этому чтению?",
         "answer_type": "symbol",
@@ -0,0 +1,227 @@
+"""
+Рейтинги пользователей с инкрементальным обновлением
+"""
+
+import random
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+# Минимум ответов, чтобы попасть в рейтинг по точности
+MIN_QUESTIONS_FOR_ACCURACY = 20
+
+
+class _Node:
+    __slots__ = ('key', 'forward', 'span')
+
+    def __init__(self, key: Any, level: int):
+        self.key = key
+        self.forward: List[Optional['_Node']] = [None] * level
+        # Сколько позиций рейтинга перепрыгивает ссылка на каждом уровне
+        self.span: List[int] = [0] * level
+
+
+class IndexableSkipList:
+    """Skip list с длинами ссылок: вставка, удаление и ранг ключа за O(log n)"""
+
+    MAX_LEVEL = 32
+    P = 0.25
+
+    def __init__(self):
+        self.head = _Node(None, self.MAX_LEVEL)
+        self.level = 1
+        self.length = 0
+
+    def __len__(self) -> int:
+        return self.length
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < self.P:
+            level += 1
+        return level
+
+    def insert(self, key: Any) -> None:
+        update: List[_Node] = [self.head] * self.MAX_LEVEL
+        rank = [0] * self.MAX_LEVEL
+        node = self.head
+        for i in range(self.level - 1, -1, -1):
+            rank[i] = 0 if i == self.level - 1 else rank[i + 1]
+            while node.forward[i] is not None and node.forward[i].key < key:
+                rank[i] += node.span[i]
+                node = node.forward[i]
+            update[i] = node
+
+        level = self._random_level()
+        if level > self.level:
+            for i in range(self.level, level):
+                rank[i] = 0
+                update[i] = self.head
+                self.head.span[i] = self.length
+            self.level = level
+
+        new_node = _Node(key, level)
+        for i in range(level):
+            new_node.forward[i] = update[i].forward[i]
+            update[i].forward[i] = new_node
+            new_node.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = rank[0] - rank[i] + 1
+        for i in range(level, self.level):
+            update[i].span[i] += 1
+        self.length += 1
+
+    def remove(self, key: Any) -> bool:
+        update: List[_Node] = [self.head] * self.MAX_LEVEL
+        node = self.head
+        for i in range(self.level - 1, -1, -1):
+            while node.forward[i] is not None and node.forward[i].key < key:
+                node = node.forward[i]
+            update[i] = node
+
+        target = node.forward[0]
+        if target is None or target.key != key:
+            return False
+
+        for i in range(self.level):
+            if update[i].forward[i] is target:
+                update[i].span[i] += target.span[i] - 1
+                update[i].forward[i] = target.forward[i]
+            else:
+                update[i].span[i] -= 1
+        while self.level > 1 and self.head.forward[self.level - 1] is None:
+            self.level -= 1
+        self.length -= 1
+        return True
+
+    def rank(self, key: Any) -> Optional[int]:
+        """Позиция ключа, начиная с 1, или None"""
+        rank = 0
+        node = self.head
+        for i in range(self.level - 1, -1, -1):
+            while node.forward[i] is not None and node.forward[i].key <= key:
+                rank += node.span[i]
+                node = node.forward[i]
+            if node is not self.head and node.key == key:
+                return rank
+        return None
+
+    def at_rank(self, rank: int) -> Optional[Any]:
+        """Ключ на позиции rank (с 1)"""
+        traversed = 0
+        node = self.head
+        for i in range(self.level - 1, -1, -1):
+            while node.forward[i] is not None and traversed + node.span[i] <= rank:
+                traversed += node.span[i]
+                node = node.forward[i]
+            if traversed == rank:
+                return node.key
+        return None
+
+    def iter_from(self, rank: int = 1) -> Iterator[Any]:
+        """Ключи по порядку, начиная с позиции rank"""
+        if rank < 1 or rank > self.length:
+            return
+        traversed = 0
+        node = self.head
+        for i in range(self.level - 1, -1, -1):
+            while node.forward[i] is not None and traversed + node.span[i] < rank:
+                traversed += node.span[i]
+                node = node.forward[i]
+        node = node.forward[0]
+        while node is not None:
+            yield node.key
+            node = node.forward[0]
+
+
+class Leaderboard:
+    """Один рейтинг: у каждого пользователя один ключ сортировки"""
+
+    def __init__(self):
+        self.entries = IndexableSkipList()
+        self.keys: Dict[int, Tuple] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def set(self, user_id: int, key: Optional[Tuple]) -> None:
+        """Ставит пользователю новый ключ (None убирает его из рейтинга)"""
+        old_key = self.keys.get(user_id)
+        if old_key == key:
+            return
+        if old_key is not None:
+            self.entries.remove(old_key)
+            del self.keys[user_id]
+        if key is not None:
+            self.entries.insert(key)
+            self.keys[user_id] = key
+
+    def rank(self, user_id: int) -> Optional[int]:
+        key = self.keys.get(user_id)
+        return self.entries.rank(key) if key is not None else None
+
+    def top(self, k: int) -> List[Tuple]:
+        result = []
+        for key in self.entries.iter_from(1):
+            if len(result) >= k:
+                break
+            result.append(key)
+        return result
+
+
+def score_key(user_id: int, score: int, total: int) -> Optional[Tuple]:
+    """Больше правильных ответов - выше; при равенстве выше тот, кто ошибался реже"""
+    if total == 0:
+        return None
+    return (-score, total - score, user_id)
+
+
+def accuracy_key(user_id: int, score: int, total: int) -> Optional[Tuple]:
+    """Выше точность - выше; учитываем только тех, кто ответил достаточно раз"""
+    if total < MIN_QUESTIONS_FOR_ACCURACY:
+        return None
+    return (-score / total, -total, user_id)
+
+
+class Leaderboards:
+    """Общие рейтинги и рейтинги по типам викторин по счету и точности"""
+
+    def __init__(self):
+        # Ключ: (тип викторины или None для общего рейтинга, 'score' | 'accuracy')
+        self.boards: Dict[Tuple[Optional[str], str], Leaderboard] = {}
+        self.names: Dict[int, str] = {}
+
+    def board(self, quiz_type: Optional[str], metric: str) -> Leaderboard:
+        board = self.boards.get((quiz_type, metric))
+        if board is None:
+            board = self.boards[(quiz_type, metric)] = Leaderboard()
+        return board
+
+    def update(self, user_id: int, quiz_type: Optional[str], score: int, total: int) -> None:
+        """Обновляет положение пользователя в рейтингах одного типа (None - общий)"""
+        self.board(quiz_type, 'score').set(user_id, score_key(user_id, score, total))
+        self.board(quiz_type, 'accuracy').set(user_id, accuracy_key(user_id, score, total))
+
+    def update_user(self, user_id: int, name: Optional[str], session: Dict[str, Any],
+                    quiz_type: Optional[str] = None) -> None:
+        """Обновляет общий рейтинг и рейтинг указанного типа викторины по сессии"""
+        if name:
+            self.names[user_id] = name
+            session['display_name'] = name
+        self.update(user_id, None, session['score'], session['total_questions'])
+        if quiz_type:
+            score, total = session['quiz_type_scores'].get(quiz_type, (0, 0))
+            self.update(user_id, quiz_type, score, total)
+
+    def load_session(self, user_id: int, session: Dict[str, Any]) -> None:
+        """Ставит пользователя во все рейтинги по загруженной сессии"""
+        if session.get('display_name'):
+            self.names[user_id] = session['display_name']
+        self.update(user_id, None, session['score'], session['total_questions'])
+        for quiz_type, (score, total) in session['quiz_type_scores'].items():
+            self.update(user_id, quiz_type, score, total)
+
+    def user_ids(self) -> Set[int]:
+        """Пользователи, которые есть хотя бы в одном рейтинге"""
+        return set().union(*(board.keys for board in self.boards.values()))
+
+    def reset_user(self, user_id: int) -> None:
+        for board in self.boards.values():
+            board.set(user_id, None)
@@ -0,0 +1,205 @@
+"""
+Офлайн-симуляция учеников для сравнения алгоритмов выбора вопросов
+
+Тысячи синтетических учеников проходят викторину одновременно: статистика,
+память и выбор вопросов хранятся матрицами (ученик x символ), так что один
+шаг симуляции - несколько операций numpy на всю матрицу. Для каждой кривой
+весов и модели забывания считается, за сколько вопросов ученики доходят до
+полного знания набора и сколько стоит выбор одного вопроса.
+"""
+
+import argparse
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from symbol_stats import DELTA_LIMIT, STATS_DTYPE
+
+
+def bot_weights(deltas: np.ndarray) -> np.ndarray:
+    """Текущая кривая бота (log/atan)"""
+    # Импорт здесь: bot при загрузке читает наборы и настраивает логирование
+    from bot import get_weights
+    return get_weights(deltas)
+
+
+def uniform_weights(deltas: np.ndarray) -> np.ndarray:
+    """Все символы равновероятны: нижняя граница, с которой сравниваем"""
+    return np.ones_like(deltas)
+
+
+def inverse_weights(deltas: np.ndarray) -> np.ndarray:
+    """Линейно растущий вес ошибок и 1/(1+delta) для выученных"""
+    return np.where(deltas >= 0, 1.0 / (1.0 + np.maximum(deltas, 0)), 1.0 - deltas)
+
+
+# Кривые весов, которые можно сравнивать: delta (матрица) -> веса той же формы
+SAMPLERS: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    'bot': bot_weights,
+    'uniform': uniform_weights,
+    'inverse': inverse_weights,
+}
+
+
+def exponential_retention(elapsed: np.ndarray, stability: np.ndarray) -> np.ndarray:
+    """Кривая Эббингауза: вероятность вспомнить падает экспоненциально"""
+    return np.exp(-elapsed / stability)
+
+
+def power_retention(elapsed: np.ndarray, stability: np.ndarray) -> np.ndarray:
+    """Степенное забывание (медленнее экспоненты на больших интервалах)"""
+    return 1.0 / (1.0 + elapsed / (9.0 * stability))
+
+
+def no_forgetting(elapsed: np.ndarray, stability: np.ndarray) -> np.ndarray:
+    """Увиденный символ запоминается навсегда"""
+    return np.ones_like(elapsed)
+
+
+# Модели забывания: (прошло секунд, стабильность памяти) -> вероятность вспомнить
+FORGETTING_MODELS: Dict[str, Callable[[np.ndarray, np.ndarray], np.ndarray]] = {
+    'exponential': exponential_retention,
+    'power': power_retention,
+    'none': no_forgetting,
+}
+
+
+class LearnerModel:
+    """Параметры синтетического ученика"""
+
+    def __init__(self, forgetting: str = 'exponential', initial_stability: float = 3600.0,
+                 growth: float = 3.0, lapse: float = 0.5, difficulty_spread: float = 0.3,
+                 question_time: float = 8.0, session_size: int = 20, session_gap: float = 20 * 3600.0,
+                 mastery: float = 0.9):
+        self.retention = FORGETTING_MODELS[forgetting]
+        # Стабильность памяти после первого показа символа, секунд
+        self.initial_stability = initial_stability
+        # Во сколько раз растет стабильность после правильного ответа и падает после ошибки
+        self.growth = growth
+        self.lapse = lapse
+        # Разброс трудности символов для разных учеников (логнормальный множитель роста)
+        self.difficulty_spread = difficulty_spread
+        # Время на вопрос и расписание занятий: session_size вопросов подряд, затем перерыв
+        self.question_time = question_time
+        self.session_size = session_size
+        self.session_gap = session_gap
+        # Символ считается выученным, если вероятность вспомнить его не ниже mastery
+        self.mastery = mastery
+
+
+def simulate(sampler: Callable[[np.ndarray], np.ndarray], deck_size: int, learners: int, max_questions: int,
+             model: LearnerModel, guess: float = 0.0, seed: int = 0) -> Dict[str, float]:
+    """Прогоняет learners учеников через набор из deck_size символов
+
+    Возвращает медиану и 90-й перцентиль числа вопросов до полного знания
+    набора (среди дошедших), долю дошедших и время выбора вопроса.
+    """
+    rng = np.random.default_rng(seed)
+    rows = np.arange(learners)
+    stats = np.zeros((learners, deck_size), dtype=STATS_DTYPE)
+    stability = np.full((learners, deck_size), model.initial_stability)
+    last_seen = np.full((learners, deck_size), -np.inf)
+    growth = model.growth * rng.lognormal(0.0, model.difficulty_spread, size=(learners, deck_size))
+    mastered_at = np.full(learners, -1)
+    now = 0.0
+    sampler_time = 0.0
+
+    for question in range(1, max_questions + 1):
+        # Выбор вопроса: веса по delta, затем обратная функция распределения по строкам
+        started = time.perf_counter()
+        weights = sampler(stats.astype(float))
+        cumulative = np.cumsum(weights, axis=1)
+        thresholds = rng.random(learners) * cumulative[:, -1]
+        chosen = np.minimum((cumulative < thresholds[:, None]).sum(axis=1), deck_size - 1)
+        sampler_time += time.perf_counter() - started
+
+        # Ответ ученика: вспомнил по модели забывания или угадал
+        seen = np.isfinite(last_seen[rows, chosen])
+        retention = np.where(seen, model.retention(now - np.where(seen, last_seen[rows, chosen], now),
+                                                   stability[rows, chosen]), 0.0)
+        correct = rng.random(learners) < guess + (1.0 - guess) * retention
+
+        # Статистика как в боте, память обновляется показом правильного ответа
+        stats[rows, chosen] = np.clip(stats[rows, chosen] + np.where(correct, 1, -1), -DELTA_LIMIT, DELTA_LIMIT)
+        stability[rows, chosen] = np.where(
+            correct & seen,
+            stability[rows, chosen] * growth[rows, chosen],
+            np.maximum(model.initial_stability, stability[rows, chosen] * model.lapse)
+        )
+        last_seen[rows, chosen] = now
+
+        now += model.question_time
+        if question % model.session_size == 0:
+            now += model.session_gap
+        # Знание набора проверяем в момент следующего вопроса: все символы должны вспоминаться
+        if question % model.session_size == 0 or question == max_questions:
+            active = mastered_at < 0
+            if active.any():
+                elapsed = now - last_seen[active]
+                recall = np.where(np.isfinite(elapsed), model.retention(np.nan_to_num(elapsed, posinf=0.0), stability[active]), 0.0)
+                done = (recall >= model.mastery).all(axis=1)
+                mastered_at[np.flatnonzero(active)[done]] = question
+
+    finished = mastered_at[mastered_at > 0]
+    return {
+        'median': float(np.median(finished)) if len(finished) else float('nan'),
+        'p90': float(np.percentile(finished, 90)) if len(finished) else float('nan'),
+        'mastered': len(finished) / learners,
+        'sampler_us': sampler_time / (max_questions * learners) * 1e6,
+    }
+
+
+def bot_sampler_cost(deck_size: int, repeats: int = 2000) -> float:
+    """Сколько микросекунд занимает настоящий sample_symbol бота на одного пользователя"""
+    from bot import sample_symbol
+    rng = np.random.default_rng(0)
+    stats = rng.integers(-5, 10, size=deck_size * 2).astype(STATS_DTYPE)
+    keys = np.arange(0, deck_size * 2, 2)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        sample_symbol(stats, keys)
+    return (time.perf_counter() - started) / repeats * 1e6
+
+
+def run(quiz_types: List[str], samplers: List[str], forgetting: List[str], learners: int,
+        max_questions: int, seed: int = 0, model_options: Optional[Dict[str, float]] = None) -> List[Dict[str, object]]:
+    """Сравнивает кривые весов на наборах викторин и печатает таблицу"""
+    from deck_registry import DeckCatalog
+    from japanese_data import ALL_SYMBOLS, QUIZ_TYPES
+
+    catalog = DeckCatalog(QUIZ_TYPES, ALL_SYMBOLS)
+    rows = []
+    print(f"{'викторина':<28} {'символов':>8} {'забывание':<12} {'выбор':<8} "
+          f"{'медиана':>8} {'p90':>7} {'дошли':>6} {'мкс/вопрос':>10}")
+    for quiz_type in quiz_types:
+        deck_size = catalog.deck_sizes[quiz_type]
+        # В режимах с кнопками из четырех вариантов можно угадать
+        guess = 0.25 if catalog.quiz_types[quiz_type]['answer_type'] == "symbol" else 0.0
+        for forgetting_name in forgetting:
+            model = LearnerModel(forgetting=forgetting_name, **(model_options or {}))
+            for sampler_name in samplers:
+                result = simulate(SAMPLERS[sampler_name], deck_size, learners, max_questions, model, guess, seed)
+                rows.append({'quiz_type': quiz_type, 'forgetting': forgetting_name, 'sampler': sampler_name, **result})
+                print(f"{quiz_type:<28} {deck_size:>8} {forgetting_name:<12} {sampler_name:<8} "
+                      f"{result['median']:>8.0f} {result['p90']:>7.0f} {result['mastered']:>6.0%} "
+                      f"{result['sampler_us']:>10.2f}")
+        print(f"{'':<28} sample_symbol бота на одного пользователя: {bot_sampler_cost(deck_size):.1f} мкс")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Симуляция учеников для сравнения выбора вопросов")
+    parser.add_argument("--quiz-types", nargs='+', default=['kanji', 'hiragana_to_romaji', 'hiragana_full_to_romaji'])
+    parser.add_argument("--samplers", nargs='+', default=list(SAMPLERS), choices=list(SAMPLERS))
+    parser.add_argument("--forgetting", nargs='+', default=['exponential', 'power'], choices=list(FORGETTING_MODELS))
+    parser.add_argument("--learners", type=int, default=1000)
+    parser.add_argument("--max-questions", type=int, default=4000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--session-size", type=int, default=20)
+    parser.add_argument("--session-gap-hours", type=float, default=20.0)
+    args = parser.parse_args()
+    run(
+        args.quiz_types, args.samplers, args.forgetting, args.learners, args.max_questions, args.seed,
+        {'session_size': args.session_size, 'session_gap': args.session_gap_hours * 3600.0}
+    )
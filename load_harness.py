@@ -0,0 +1,207 @@
+"""
+Офлайн-нагрузочный стенд: фейковый Bot API и синтетический трафик
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import tempfile
+import time
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from telegram.request import BaseRequest, RequestData
+
+FAKE_TOKEN = "123456:offline-load-harness"
+FAKE_BOT_USER = {"id": 123456, "is_bot": True, "first_name": "OfflineBot", "username": "offline_bot"}
+# Как в Telegram, номера сообщений идут по порядку внутри чата: в синтетическом сценарии
+# первым бот присылает меню на /start, вторым - вопрос, который дальше только редактируется
+FIRST_BOT_MESSAGE_ID = 1_000_000
+QUESTION_MESSAGE_ID = FIRST_BOT_MESSAGE_ID + 1
+# Файлы, которые бот пишет сам: переменная окружения -> имя во временном каталоге
+PERSISTED_PATHS = {
+    'GLOBAL_STATS_PATH': 'global_stats.json',
+    'DECK_SYMBOLS_PATH': 'deck_symbols.json',
+    'REMINDERS_PATH': 'reminders.json',
+    'GLYPH_CACHE_DIR': 'glyphs',
+}
+
+
+class FakeTelegramRequest(BaseRequest):
+    """Отвечает на запросы Bot API локально, не выходя в сеть"""
+
+    def __init__(self, api_latency: float = 0.0):
+        self.api_latency = api_latency
+        self.calls: Dict[str, int] = {}
+        self._message_ids: Dict[int, Iterator[int]] = {}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout=None,
+        write_timeout=None,
+        connect_timeout=None,
+        pool_timeout=None,
+    ) -> Tuple[int, bytes]:
+        api_method = url.rsplit('/', 1)[-1]
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        params = request_data.parameters if request_data else {}
+
+        if self.api_latency:
+            # Имитируем сетевую задержку до серверов Telegram
+            await asyncio.sleep(self.api_latency)
+
+        if api_method == 'getMe':
+            # id бота - первая часть токена из адреса запроса, как у настоящего Bot API
+            bot_id = url.rsplit('/', 2)[-2][len('bot'):].split(':', 1)[0]
+            result: Any = {**FAKE_BOT_USER, "id": int(bot_id)}
+        elif api_method in ('sendMessage', 'editMessageText', 'sendPhoto', 'editMessageMedia', 'editMessageCaption'):
+            chat_id = int(params.get('chat_id', 0))
+            message_id = params.get('message_id')
+            if not message_id:
+                if chat_id not in self._message_ids:
+                    self._message_ids[chat_id] = itertools.count(FIRST_BOT_MESSAGE_ID)
+                message_id = next(self._message_ids[chat_id])
+            result = {
+                "message_id": int(message_id),
+                "date": int(time.time()),
+                # У групповых чатов в Telegram отрицательные id
+                "chat": {"id": chat_id, "type": "group" if chat_id < 0 else "private"},
+                "from": FAKE_BOT_USER,
+                "text": params.get('text', ''),
+            }
+            if api_method in ('sendPhoto', 'editMessageMedia'):
+                file_id = f"fake-photo-{result['message_id']}"
+                result["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 256, "height": 256}]
+        else:
+            result = True
+
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def _user(user_id: int) -> Dict[str, Any]:
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+
+def make_message_update(update_id: int, user_id: int, message_id: int, text: str) -> Dict[str, Any]:
+    """Собирает JSON обновления с текстовым сообщением пользователя"""
+    message = {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id),
+        "text": text,
+    }
+    if text.startswith('/'):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+
+def make_group_message_update(update_id: int, chat_id: int, user_id: int, message_id: int, text: str,
+                              reply_to_message_id: Optional[int] = None) -> Dict[str, Any]:
+    """Собирает JSON обновления с сообщением участника группового чата"""
+    update = make_message_update(update_id, user_id, message_id, text)
+    message = update["message"]
+    message["chat"] = {"id": chat_id, "type": "group", "title": f"group{chat_id}"}
+    if reply_to_message_id is not None:
+        message["reply_to_message"] = {
+            "message_id": reply_to_message_id,
+            "date": message["date"],
+            "chat": message["chat"],
+            "from": FAKE_BOT_USER,
+            "text": "question",
+        }
+    return update
+
+
+def make_callback_update(update_id: int, user_id: int, message_id: int, data: str) -> Dict[str, Any]:
+    """Собирает JSON обновления с нажатием на инлайн-кнопку"""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": FAKE_BOT_USER,
+                "text": "question",
+            },
+        },
+    }
+
+
+def synthetic_updates(users: int, questions_per_user: int, quiz_type: str = "hiragana_to_romaji") -> Iterator[Dict[str, Any]]:
+    """Генерирует типичный сценарий: /start, выбор викторины, ответы и «следующий вопрос»"""
+    update_ids = itertools.count(1)
+    message_id = 1
+    # Перемешиваем пользователей по шагам, как в реальном трафике
+    yield from (make_message_update(next(update_ids), 1000 + user, message_id, "/start") for user in range(users))
+    yield from (make_callback_update(next(update_ids), 1000 + user, message_id, f"quiz_{quiz_type}") for user in range(users))
+    for step in range(questions_per_user):
+        for user in range(users):
+            yield make_message_update(next(update_ids), 1000 + user, message_id + step + 1, "ka")
+        for user in range(users):
+            yield make_callback_update(next(update_ids), 1000 + user, QUESTION_MESSAGE_ID, f"next_{quiz_type}")
+
+
+def isolate_persisted_files() -> str:
+    """Переносит все файлы, которые пишет бот, во временный каталог (вызывать до импорта bot)
+
+    Синтетическим и записанным пользователям не место в data/: их ответы
+    сдвинули бы общую статистику, то есть априорные веса настоящих пользователей.
+    """
+    folder = tempfile.mkdtemp(prefix='jpbot-harness-')
+    for variable, name in PERSISTED_PATHS.items():
+        os.environ[variable] = os.path.join(folder, name)
+    os.environ.pop('PROGRESS_SNAPSHOT', None)
+    return folder
+
+
+def run_sharded_benchmark(worker_counts: List[int], users: int, questions_per_user: int, batch_size: int = 100) -> Dict[int, float]:
+    """Прогоняет синтетический трафик через ShardRouter и возвращает обновлений в секунду"""
+    from sharding import ShardRouter
+
+    # Воркеры читают окружение при запуске и пишут статистику, напоминания и прогресс
+    isolate_persisted_files()
+    updates = list(synthetic_updates(users, questions_per_user))
+    results = {}
+    for workers in worker_counts:
+        router = ShardRouter(FAKE_TOKEN, workers, offline=True)
+        router.wait_ready()
+
+        started = time.perf_counter()
+        for offset in range(0, len(updates), batch_size):
+            router.route_many(updates[offset:offset + batch_size])
+        processed = router.stop()
+        elapsed = time.perf_counter() - started
+
+        results[workers] = processed / elapsed
+        print(f"Воркеров: {workers}, обновлений: {processed}, время: {elapsed:.2f} с, {results[workers]:.0f} обн/с")
+
+    base = results[worker_counts[0]] / worker_counts[0]
+    for workers, throughput in results.items():
+        print(f"Масштабирование x{workers}: {throughput / base / workers:.0%} от линейного")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Офлайн-нагрузочный стенд шардированного бота")
+    parser.add_argument("--workers", type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args()
+    run_sharded_benchmark(args.workers, args.users, args.questions, args.batch)
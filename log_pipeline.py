@@ -0,0 +1,181 @@
+"""
+Логирование без блокировки цикла событий: очередь, форматирование в отдельном потоке,
+поля текущего обновления и прореживание частых записей
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from typing import Any, Dict, Optional
+
+DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Поля обновления, которые добавляются к каждой записи, сделанной во время его обработки
+UPDATE_FIELDS = ('bot', 'user', 'route', 'latency_ms')
+
+# Поля обрабатываемого обновления: задаются обертками обработчиков, видны во всех вложенных вызовах
+update_fields: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar('update_fields', default=None)
+
+
+def parse_sample_rates(text: str) -> Dict[str, float]:
+    """'httpx=0.01,updates=0.05' -> {'httpx': 0.01, 'updates': 0.05}"""
+    rates = {}
+    for item in text.split(','):
+        name, separator, rate = item.strip().partition('=')
+        if separator:
+            rates[name] = float(rate)
+    return rates
+
+
+class UpdateFieldsFilter(logging.Filter):
+    """Переносит поля текущего обновления в запись (пока мы еще в потоке обработчика)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        fields = update_fields.get()
+        for name in UPDATE_FIELDS:
+            if not hasattr(record, name):
+                setattr(record, name, fields.get(name) if fields else None)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только каждую N-ю запись уровня ниже WARNING от частых логгеров
+
+    rates - доля записей, которую оставить, по имени логгера (и его потомков).
+    Счетчик вместо случайных чисел: дешевле и равномерно.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.every = {name: max(1, round(1 / rate)) if rate > 0 else 0 for name, rate in rates.items()}
+        self._counters: Dict[str, int] = {}
+        self.dropped = 0
+
+    def _rule_for(self, logger_name: str) -> Optional[str]:
+        name = logger_name
+        while name:
+            if name in self.every:
+                return name
+            name = name.rpartition('.')[0]
+        return None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.every:
+            return True
+        rule = self._rule_for(record.name)
+        if rule is None:
+            return True
+        every = self.every[rule]
+        count = self._counters.get(rule, 0)
+        self._counters[rule] = count + 1
+        if every and count % every == 0:
+            return True
+        self.dropped += 1
+        return False
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Кладет запись в ограниченную очередь, не форматируя ее
+
+    Стандартный QueueHandler форматирует сообщение прямо в вызывающем потоке;
+    здесь это делает поток QueueListener. Если вывод не успевает и очередь
+    полна, запись отбрасывается (с подсчетом), а не ждет места.
+    Аргументы записи форматируются позже, поэтому в лог не стоит передавать
+    объекты, которые меняются сразу после вызова.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class ContextFormatter(logging.Formatter):
+    """Текстовый формат: к сообщению дописываются поля обновления, если они есть"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = [f"{name}={getattr(record, name)}" for name in UPDATE_FIELDS if getattr(record, name, None) is not None]
+        return f"{text} [{' '.join(fields)}]" if fields else text
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись - для сборщиков логов"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for name in UPDATE_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+_pipeline: Dict[str, Any] = {}
+
+
+def setup_logging(level: int = logging.INFO, fmt: str = DEFAULT_FORMAT, json_format: bool = False,
+                  sample_rates: Optional[Dict[str, float]] = None, queue_size: int = 10000,
+                  log_file: Optional[str] = None) -> None:
+    """Настраивает корневой логгер: очередь в памяти и вывод из отдельного потока"""
+    if _pipeline:
+        return
+    formatter = JsonFormatter() if json_format else ContextFormatter(fmt)
+    sinks = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        sinks.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for sink in sinks:
+        sink.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    handler = NonBlockingQueueHandler(log_queue)
+    sampling = SamplingFilter(sample_rates or {})
+    handler.addFilter(sampling)
+    handler.addFilter(UpdateFieldsFilter())
+    listener = logging.handlers.QueueListener(log_queue, *sinks, respect_handler_level=True)
+    listener.start()
+    # При выходе дописываем то, что осталось в очереди
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+    _pipeline.update(handler=handler, listener=listener, sampling=sampling)
+
+
+def setup_logging_from_env() -> None:
+    """Настройки из переменных окружения: LOG_LEVEL, LOG_FORMAT=json, LOG_SAMPLE, LOG_FILE, LOG_QUEUE_SIZE"""
+    setup_logging(
+        level=getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper(), logging.INFO),
+        json_format=os.getenv('LOG_FORMAT') == 'json',
+        # Строка на каждый запрос к Bot API и на каждое обновление - прореживаем
+        sample_rates=parse_sample_rates(os.getenv('LOG_SAMPLE', 'httpx=0.01,updates=0.01')),
+        queue_size=int(os.getenv('LOG_QUEUE_SIZE', '10000')),
+        log_file=os.getenv('LOG_FILE'),
+    )
+
+
+def dropped_records() -> Dict[str, int]:
+    """Сколько записей отброшено прореживанием и из-за переполненной очереди"""
+    if not _pipeline:
+        return {'sampled': 0, 'queue_full': 0}
+    return {'sampled': _pipeline['sampling'].dropped, 'queue_full': _pipeline['handler'].dropped}
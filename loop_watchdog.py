@@ -0,0 +1,114 @@
+"""
+Задержка цикла событий и поиск вызовов, которые его блокируют
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних замеров задержки хранить для перцентилей
+LAG_SAMPLES = 1024
+# Сколько кадров стека показывать в отчете о блокировке
+STACK_LIMIT = 12
+# Сколько последних блокировок держать для просмотра
+RECENT_STALLS = 20
+
+
+class LoopWatchdog:
+    """Следит за циклом событий, в котором работают обработчики
+
+    Задача в цикле засыпает на interval и измеряет, насколько позже
+    просыпается: это задержка, которую видит каждое обновление. Замеры
+    лежат в кольцевом буфере, по нему считаются перцентили.
+
+    Поток-сторож смотрит, когда задача отмечалась последний раз. Если цикл
+    занят дольше stall_threshold, сторож снимает стек потока цикла прямо во
+    время блокировки: в нем видно, какой синхронный код держит всех
+    пользователей.
+    """
+
+    def __init__(self, interval: float = 0.1, stall_threshold: float = 0.1, samples: int = LAG_SAMPLES):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self._lags = np.zeros(samples, dtype=np.float32)
+        self._position = 0
+        self._count = 0
+        # Время последней отметки задачи в цикле (perf_counter); читается потоком-сторожем
+        self._beat: Optional[float] = None
+        self._loop_thread_id: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop: Optional[threading.Event] = None
+        self.stalls = 0
+        # (длительность на момент снимка, стек) последних блокировок
+        self.recent_stalls: Deque[Tuple[float, str]] = deque(maxlen=RECENT_STALLS)
+
+    def _record(self, lag: float) -> None:
+        self._lags[self._position] = lag
+        self._position = (self._position + 1) % len(self._lags)
+        self._count = min(self._count + 1, len(self._lags))
+
+    async def run(self) -> None:
+        """Фоновая задача: замеры задержки, пока ее не отменят"""
+        self._loop_thread_id = threading.get_ident()
+        self.start_thread()
+        try:
+            while True:
+                self._beat = time.perf_counter()
+                await asyncio.sleep(self.interval)
+                self._record(max(0.0, time.perf_counter() - self._beat - self.interval))
+        finally:
+            self.stop()
+
+    def start_thread(self) -> None:
+        if self._thread is not None:
+            return
+        # У каждого потока свой флаг остановки: перезапуск не подхватит старый поток
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch, args=(self._stop,), name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._stop is not None:
+            self._stop.set()
+        self._thread = None
+
+    def _watch(self, stop: threading.Event) -> None:
+        reported_beat = None
+        check_every = min(self.interval, self.stall_threshold) / 2
+        while not stop.wait(check_every):
+            beat = self._beat
+            if beat is None or beat == reported_beat:
+                continue
+            blocked = time.perf_counter() - beat - self.interval
+            if blocked < self.stall_threshold:
+                continue
+            # Одна блокировка - один отчет, даже если она длится долго
+            reported_beat = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame, limit=STACK_LIMIT)) if frame is not None else ""
+            self.stalls += 1
+            self.recent_stalls.append((blocked, stack))
+            logger.warning("Цикл событий заблокирован уже %.0f мс, стек:\n%s", blocked * 1000, stack)
+
+    def report(self) -> Dict[str, float]:
+        """Перцентили задержки цикла по последним замерам, в миллисекундах"""
+        if not self._count:
+            return {'lag_p50_ms': 0.0, 'lag_p90_ms': 0.0, 'lag_p99_ms': 0.0, 'lag_max_ms': 0.0, 'stalls': self.stalls}
+        lags = self._lags[:self._count] * 1000
+        p50, p90, p99 = np.percentile(lags, (50, 90, 99))
+        return {
+            'lag_p50_ms': round(float(p50), 1),
+            'lag_p90_ms': round(float(p90), 1),
+            'lag_p99_ms': round(float(p99), 1),
+            'lag_max_ms': round(float(lags.max()), 1),
+            'stalls': self.stalls,
+        }
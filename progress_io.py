@@ -0,0 +1,257 @@
+"""
+Потоковая выгрузка и загрузка прогресса учеников
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Callable, ContextManager, Dict, IO, Iterator, Optional, Tuple
+
+from answer_times import AnswerTimes
+from session_store import SessionStore, InMemorySessionStore, create_session_store, new_session
+from symbol_stats import DIRECTIONS, stats_from_json, stats_to_json
+
+# Версия формата: первая строка файла - заголовок с ней
+FORMAT_VERSION = 2
+# Версии, которые умеем читать (1 - статистика по символам без направления)
+READABLE_VERSIONS = (1, 2)
+# Сколько записей отправлять в хранилище одной командой
+IMPORT_BATCH_SIZE = 1000
+# Раз во сколько пачек дожидаться подтверждения записей, чтобы не копить их в памяти
+FLUSH_EVERY_BATCHES = 20
+
+
+def session_to_record(user_id: int, session: Dict[str, Any]) -> Dict[str, Any]:
+    """Оставляет от сессии только прогресс (без ID сообщений и состояния вопроса)"""
+    record = {
+        'u': user_id,
+        's': session['score'],
+        't': session['total_questions'],
+        'q': session.get('quiz_type_scores', {}),
+        'st': stats_to_json(session['symbols_stats']),
+        'cv': session['catalog_version'],
+    }
+    if session.get('display_name'):
+        record['n'] = session['display_name']
+    if session.get('custom_decks'):
+        # Маски в hex: длинные целые в JSON не все читатели понимают
+        record['d'] = {name: format(mask, 'x') for name, mask in session['custom_decks'].items()}
+    if session.get('reminder_interval'):
+        record['r'] = session['reminder_interval']
+    if session.get('answer_times') is not None:
+        record['at'] = session['answer_times'].to_json()
+    return record
+
+
+def record_to_session(record: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+    """Собирает новую сессию из записи выгрузки"""
+    session = new_session()
+    session['score'] = record['s']
+    session['total_questions'] = record['t']
+    session['quiz_type_scores'] = record.get('q', {})
+    # Версия 1 хранила статистику по самим символам: ее переведет sync_session
+    session['symbols_stats'] = stats_from_json(record.get('st', {}))
+    session['catalog_version'] = record.get('cv')
+    if 'n' in record:
+        session['display_name'] = record['n']
+    if 'd' in record:
+        session['custom_decks'] = {name: int(mask, 16) for name, mask in record['d'].items()}
+    session['reminder_interval'] = record.get('r')
+    if 'at' in record:
+        session['answer_times'] = AnswerTimes.from_json(record['at'])
+    return record['u'], session
+
+
+def _open_file(path: str, mode: str, compressed: bool) -> IO[str]:
+    if compressed:
+        return gzip.open(path, mode + 't', encoding='utf-8', compresslevel=3)
+    return open(path, mode, encoding='utf-8')
+
+
+def open_progress_file(path: str, mode: str) -> ContextManager[IO[str]]:
+    """Открывает файл выгрузки, сжимая его gzip, если имя заканчивается на .gz
+
+    '-' - stdout или stdin: with их не закрывает, иначе после выгрузки из
+    командной строки упал бы любой следующий print.
+    """
+    if path == '-':
+        return contextlib.nullcontext(sys.stdout if 'w' in mode else sys.stdin)
+    return _open_file(path, mode, path.endswith('.gz'))
+
+
+@contextlib.contextmanager
+def write_progress_file(path: str) -> Iterator[IO[str]]:
+    """Открывает выгрузку на запись: файл path заменяется только полностью записанным
+
+    Пишем во временный файл рядом и переименовываем, как напоминания и
+    file_id картинок: остановка посреди записи не оставит обрезанный gzip
+    на месте единственной резервной копии.
+    """
+    if path == '-':
+        yield sys.stdout
+        return
+    tmp_path = f"{path}.tmp"
+    try:
+        with _open_file(tmp_path, 'w', path.endswith('.gz')) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+def write_header(f: IO[str]) -> None:
+    f.write(json.dumps({'format': 'jpbot-progress', 'version': FORMAT_VERSION}) + '\n')
+
+
+def write_record(f: IO[str], user_id: int, session: Dict[str, Any]) -> None:
+    f.write(json.dumps(session_to_record(user_id, session), ensure_ascii=False, separators=(',', ':')))
+    f.write('\n')
+
+
+def read_records(f: IO[str]) -> Iterator[Dict[str, Any]]:
+    """Читает записи по одной строке, проверяя заголовок"""
+    header = json.loads(f.readline() or '{}')
+    if header.get('format') != 'jpbot-progress' or header.get('version') not in READABLE_VERSIONS:
+        raise ValueError(f"Неподдерживаемый формат выгрузки: {header}")
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+async def export_progress(store: SessionStore, path: str,
+                          keep: Optional[Callable[[int], bool]] = None) -> int:
+    """Выгружает прогресс всех пользователей (или только тех, для кого keep истинно), держа в памяти одну пачку"""
+    exported = 0
+    with write_progress_file(path) as f:
+        write_header(f)
+        async for user_ids in store.iter_user_ids(IMPORT_BATCH_SIZE):
+            if keep is not None:
+                user_ids = [user_id for user_id in user_ids if keep(user_id)]
+            sessions = await store.load_many(user_ids)
+            for user_id, session in sessions.items():
+                write_record(f, user_id, session)
+            exported += len(sessions)
+    return exported
+
+
+async def import_progress(store: SessionStore, path: str,
+                          on_session: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+                          keep: Optional[Callable[[int], bool]] = None) -> int:
+    """Загружает прогресс в хранилище пачками; on_session вызывается для каждой сессии
+
+    keep отбирает пользователей: записи остальных пропускаются (воркер берет только своих).
+    """
+    imported = 0
+    batches = 0
+    batch: Dict[int, Dict[str, Any]] = {}
+    with open_progress_file(path, 'r') as f:
+        for record in read_records(f):
+            if keep is not None and not keep(record['u']):
+                continue
+            user_id, session = record_to_session(record)
+            batch[user_id] = session
+            if on_session is not None:
+                on_session(user_id, session)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                store.save_many(batch)
+                imported += len(batch)
+                batch = {}
+                batches += 1
+                if batches % FLUSH_EVERY_BATCHES == 0:
+                    await store.flush()
+    if batch:
+        store.save_many(batch)
+        imported += len(batch)
+    await store.flush()
+    return imported
+
+
+def synthetic_session(rng: random.Random, symbol_count: int) -> Dict[str, Any]:
+    """Правдоподобная сессия для замеров"""
+    session = new_session()
+    total = rng.randint(1, 500)
+    session['total_questions'] = total
+    session['score'] = rng.randint(0, total)
+    session['quiz_type_scores'] = {'hiragana_to_romaji': [session['score'], total]}
+    keys = rng.sample(range(symbol_count * DIRECTIONS), rng.randint(1, min(40, symbol_count * DIRECTIONS)))
+    session['symbols_stats'] = {key: rng.randint(-5, 10) for key in keys}
+    return session
+
+
+def benchmark(users: int, path: Optional[str] = None) -> None:
+    """Замеряет скорость выгрузки и загрузки в записях в секунду"""
+    from japanese_data import ALL_SYMBOLS
+
+    rng = random.Random(42)
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+
+    started = time.perf_counter()
+    with write_progress_file(path) as f:
+        write_header(f)
+        for user_id in range(users):
+            write_record(f, user_id, synthetic_session(rng, len(ALL_SYMBOLS)))
+    elapsed = time.perf_counter() - started
+    size_mb = os.path.getsize(path) / 1024 / 1024
+    print(f"Выгрузка: {users} записей за {elapsed:.2f} с, {users / elapsed:.0f} записей/с, {size_mb:.1f} МБ")
+
+    started = time.perf_counter()
+    with open_progress_file(path, 'r') as f:
+        parsed = sum(1 for record in read_records(f) if record_to_session(record))
+    elapsed = time.perf_counter() - started
+    print(f"Разбор: {parsed} записей за {elapsed:.2f} с, {parsed / elapsed:.0f} записей/с")
+
+    store = InMemorySessionStore()
+    started = time.perf_counter()
+    imported = asyncio.run(import_progress(store, path))
+    elapsed = time.perf_counter() - started
+    print(f"Загрузка в память: {imported} записей за {elapsed:.2f} с, {imported / elapsed:.0f} записей/с")
+
+    os.remove(path)
+
+
+async def _run(command: str, store_url: Optional[str], path: str) -> None:
+    store = create_session_store(store_url)
+    if store.is_local:
+        raise SystemExit(
+            "Сессии в памяти живут только внутри процесса бота. Укажите общее хранилище "
+            "(--store redis://...) или используйте PROGRESS_SNAPSHOT при запуске бота."
+        )
+    try:
+        started = time.perf_counter()
+        if command == 'export':
+            count = await export_progress(store, path)
+        else:
+            count = await import_progress(store, path)
+        elapsed = time.perf_counter() - started
+        print(f"{count} записей за {elapsed:.2f} с ({count / max(elapsed, 1e-9):.0f} записей/с)", file=sys.stderr)
+    finally:
+        await store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Выгрузка и загрузка прогресса учеников")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for command in ('export', 'import'):
+        subparser = subparsers.add_parser(command)
+        subparser.add_argument('path', help="Файл .jsonl или .jsonl.gz, '-' для stdout/stdin")
+        subparser.add_argument('--store', default=os.getenv('SESSION_STORE_URL'))
+    bench_parser = subparsers.add_parser('bench')
+    bench_parser.add_argument('--users', type=int, default=100_000)
+    bench_parser.add_argument('--path')
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        benchmark(args.users, args.path)
+    else:
+        asyncio.run(_run(args.command, args.store, args.path))
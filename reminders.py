@@ -0,0 +1,164 @@
+"""
+Напоминания о повторении: расписание по корзинам времени и рассылка с ограничением скорости
+"""
+
+import asyncio
+import heapq
+import json
+import logging
+import math
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from telegram.error import Forbidden, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Telegram разрешает боту около 30 сообщений в секунду разным пользователям
+DEFAULT_SEND_RATE = 25.0
+
+
+class ReminderSchedule:
+    """Кому и когда напомнить, с точностью до resolution секунд
+
+    Пользователи лежат в корзинах по номеру интервала, в котором наступает
+    срок; номера непустых корзин - в куче. Перенос срока после каждого ответа -
+    перекладывание между множествами, а проверка по таймеру смотрит только
+    на корзины, срок которых уже наступил, а не на всех пользователей.
+    """
+
+    def __init__(self, resolution: float = 60.0):
+        self.resolution = resolution
+        self._buckets: Dict[int, Set[int]] = {}
+        # Номера корзин; номер удаленной корзины может остаться и пропускается при извлечении
+        self._bucket_heap: List[int] = []
+        self._user_bucket: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._user_bucket)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._user_bucket
+
+    def _bucket_of(self, due: float) -> int:
+        # Округляем вверх, чтобы не напомнить раньше срока
+        return math.ceil(due / self.resolution)
+
+    def schedule(self, user_id: int, due: float) -> None:
+        """Назначает (или переносит) напоминание пользователю на время due"""
+        bucket = self._bucket_of(due)
+        old_bucket = self._user_bucket.get(user_id)
+        if old_bucket == bucket:
+            return
+        if old_bucket is not None:
+            self._discard(user_id, old_bucket)
+        users = self._buckets.get(bucket)
+        if users is None:
+            users = self._buckets[bucket] = set()
+            heapq.heappush(self._bucket_heap, bucket)
+        users.add(user_id)
+        self._user_bucket[user_id] = bucket
+
+    def cancel(self, user_id: int) -> None:
+        bucket = self._user_bucket.pop(user_id, None)
+        if bucket is not None:
+            self._discard(user_id, bucket)
+
+    def take(self, predicate: Callable[[int], bool]) -> Dict[int, float]:
+        """Убирает из расписания пользователей, для которых predicate истинно, и возвращает их сроки"""
+        taken = {user_id: bucket * self.resolution for user_id, bucket in self._user_bucket.items() if predicate(user_id)}
+        for user_id in taken:
+            self.cancel(user_id)
+        return taken
+
+    def _discard(self, user_id: int, bucket: int) -> None:
+        users = self._buckets[bucket]
+        users.discard(user_id)
+        if not users:
+            del self._buckets[bucket]
+
+    def pop_expired(self, now: Optional[float] = None) -> List[int]:
+        """Забирает всех пользователей, срок напоминания которых наступил"""
+        now = time.time() if now is None else now
+        expired = []
+        heap = self._bucket_heap
+        while heap and heap[0] * self.resolution <= now:
+            users = self._buckets.pop(heapq.heappop(heap), None)
+            if users is None:
+                continue
+            for user_id in users:
+                del self._user_bucket[user_id]
+            expired.extend(users)
+        return expired
+
+    def save(self, path: str) -> None:
+        """Сохраняет расписание (пользователь -> срок), чтобы пережить перезапуск"""
+        stored = {str(user_id): bucket * self.resolution for user_id, bucket in self._user_bucket.items()}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(stored, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def load(self, path: str, keep: Optional[Callable[[int], bool]] = None) -> int:
+        """Добавляет сохраненное расписание; keep отбирает пользователей, остальные пропускаются"""
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path, encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Не удалось прочитать расписание напоминаний %s: %s", path, e)
+            return 0
+        loaded = 0
+        for user_id, due in stored.items():
+            if keep is None or keep(int(user_id)):
+                self.schedule(int(user_id), due)
+                loaded += 1
+        return loaded
+
+
+class RateLimitedSender:
+    """Рассылает пачки сообщений не быстрее rate сообщений в секунду
+
+    Сообщения отправляются по одному с паузой между ними; если Telegram все же
+    просит подождать (RetryAfter), ждем сколько сказано и повторяем.
+    """
+
+    def __init__(self, rate: float = DEFAULT_SEND_RATE):
+        self.interval = 1.0 / rate
+        self._next_send = 0.0
+        self.sent = 0
+        self.failed = 0
+
+    async def _wait_turn(self) -> None:
+        now = time.monotonic()
+        if self._next_send > now:
+            await asyncio.sleep(self._next_send - now)
+            now = self._next_send
+        self._next_send = now + self.interval
+
+    async def send_batch(self, bot: Any, messages: Iterable[Tuple[int, str, Any]]) -> List[int]:
+        """Отправляет (chat_id, текст, клавиатура) и возвращает чаты, где бот заблокирован"""
+        blocked = []
+        for chat_id, text, reply_markup in messages:
+            for _ in range(2):
+                await self._wait_turn()
+                try:
+                    await bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup)
+                    self.sent += 1
+                    break
+                except RetryAfter as e:
+                    logger.warning("Telegram просит подождать %s с перед рассылкой", e.retry_after)
+                    self._next_send = time.monotonic() + e.retry_after
+                except Forbidden:
+                    blocked.append(chat_id)
+                    break
+                except Exception as e:
+                    self.failed += 1
+                    logger.debug("Не удалось отправить напоминание %s: %s", chat_id, e)
+                    break
+            else:
+                self.failed += 1
+        return blocked
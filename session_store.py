@@ -0,0 +1,503 @@
+"""
+Хранилища сессий пользователей: в памяти процесса и общее по протоколу Redis
+"""
+
+import abc
+import argparse
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import Dict, Any, AsyncIterator, Deque, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+from answer_times import AnswerTimes
+from symbol_stats import empty_stats, stats_from_json, stats_to_json
+
+logger = logging.getLogger(__name__)
+
+
+def new_session() -> Dict[str, Any]:
+    """Создает сессию пользователя со значениями по умолчанию"""
+    return {
+        'current_symbol': None,
+        # Ключ статистики (символ, направление) текущего вопроса
+        'current_key': None,
+        'current_quiz_type': None,
+        # Версия наборов символов, из которой задан текущий вопрос
+        'question_version': None,
+        # Когда показан текущий вопрос (time.time()), чтобы измерить время ответа
+        'question_shown_at': None,
+        'score': 0,
+        'total_questions': 0,
+        'waiting_for_answer': False,
+        'quiz_started': False,
+        # Символы текущего пакета вопросов (пакетный режим)
+        'batch_symbols': None,
+        'batch_keys': None,
+        'current_question_message_id': None,
+        # Сообщение с вопросом - картинка символа (результат пишется в подпись)
+        'question_is_photo': False,
+        'user_answer_message_id': None,
+        'stats_message_id': None,
+        'main_menu_message_id': None,
+        'submenu_message_id': None,
+        # Списки для хранения всех ID сообщений
+        'all_question_message_ids': [],
+        'all_user_answer_message_ids': [],
+        'all_stats_message_ids': [],
+        'all_main_menu_message_ids': [],
+        'all_submenu_message_ids': [],
+        # История ответов по (символ, направление): массив delta по ключам stats_key()
+        'symbols_stats': empty_stats(),
+        # Время последних ответов по ключам статистики (AnswerTimes, создается при первом ответе)
+        'answer_times': None,
+        # [правильных, всего] по каждому типу викторины
+        'quiz_type_scores': {},
+        # Имя для рейтингов
+        'display_name': None,
+        # Свои наборы: название -> битовая маска номеров символов
+        'custom_decks': {},
+        # Версия каталога, в номерах символов которой записаны статистика и свои наборы
+        'catalog_version': None,
+        # Набор, которым ограничены вопросы викторин
+        'active_deck': None,
+        # Через сколько секунд без занятий напомнить о повторении (None - не напоминать)
+        'reminder_interval': None,
+        # Позиция в вызове дня: {'day', 'cursor', 'correct', 'version'}
+        'daily': None,
+        # Растет при каждом изменении статистики, чтобы отбрасывать устаревшие заготовки вопросов
+        'stats_version': 0,
+        # Растет с каждым новым вопросом: сообщение с вопросом правится на месте, его номер не меняется
+        'question_serial': 0
+    }
+
+
+def serialize_session(session: Dict[str, Any]) -> bytes:
+    """Сериализует сессию в компактный JSON"""
+    stored = dict(session)
+    # Нулевые счетчики не отличаются от отсутствующих, не тратим на них место
+    stored['symbols_stats'] = stats_to_json(session['symbols_stats'])
+    if session['answer_times'] is not None:
+        stored['answer_times'] = session['answer_times'].to_json()
+    return json.dumps(stored, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def deserialize_session(payload: bytes) -> Dict[str, Any]:
+    """Восстанавливает сессию, дополняя ее полями, которых не было при сохранении"""
+    session = new_session()
+    stored = json.loads(payload)
+    # Плотный массив соберет sync_session, когда будет известен каталог
+    session['symbols_stats'] = stats_from_json(stored.pop('symbols_stats', {}))
+    answer_times = stored.pop('answer_times', None)
+    if answer_times is not None:
+        session['answer_times'] = AnswerTimes.from_json(answer_times)
+    session.update(stored)
+    return session
+
+
+class SessionStore(abc.ABC):
+    """Интерфейс хранилища сессий
+
+    Обработчик загружает сессию одним вызовом load() в начале и отдает ее
+    в save() в конце, поэтому удаленное хранилище стоит не больше одного
+    сетевого обращения на обработчик.
+    """
+
+    # Сессии живут в памяти процесса и не требуют загрузки и сохранения
+    is_local = False
+
+    @abc.abstractmethod
+    async def load(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Загружает сессию пользователя или возвращает None"""
+
+    @abc.abstractmethod
+    async def load_many(self, user_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """Загружает несколько сессий одним запросом"""
+
+    @abc.abstractmethod
+    def save(self, user_id: int, session: Dict[str, Any]) -> None:
+        """Ставит сессию на запись, не дожидаясь ответа хранилища"""
+
+    @abc.abstractmethod
+    def iter_user_ids(self, batch_size: int = 1000) -> AsyncIterator[List[int]]:
+        """Перебирает id всех пользователей пачками, не загружая их разом"""
+
+    @abc.abstractmethod
+    def save_many(self, sessions: Dict[int, Dict[str, Any]]) -> None:
+        """Ставит на запись несколько сессий одной командой"""
+
+    async def flush(self) -> None:
+        """Дожидается подтверждения всех отложенных записей"""
+
+    async def close(self) -> None:
+        """Закрывает соединения хранилища"""
+
+
+class InMemorySessionStore(SessionStore):
+    """Сессии в словаре внутри процесса (поведение по умолчанию)"""
+
+    is_local = True
+
+    def __init__(self):
+        self.sessions: Dict[int, Dict[str, Any]] = {}
+
+    async def load(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return self.sessions.get(user_id)
+
+    async def load_many(self, user_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        return {user_id: self.sessions[user_id] for user_id in user_ids if user_id in self.sessions}
+
+    def save(self, user_id: int, session: Dict[str, Any]) -> None:
+        self.sessions[user_id] = session
+
+    def save_many(self, sessions: Dict[int, Dict[str, Any]]) -> None:
+        self.sessions.update(sessions)
+
+    async def iter_user_ids(self, batch_size: int = 1000) -> AsyncIterator[List[int]]:
+        # Снимок ключей: словарь может меняться, пока мы отдаем управление
+        user_ids = list(self.sessions)
+        for offset in range(0, len(user_ids), batch_size):
+            yield user_ids[offset:offset + batch_size]
+
+
+class RespError(Exception):
+    """Ошибка, которую вернул сервер по протоколу RESP"""
+
+
+def encode_command(*args: Any) -> bytes:
+    """Кодирует команду в формат RESP"""
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if isinstance(arg, bytes):
+            data = arg
+        else:
+            data = str(arg).encode('utf-8')
+        parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+    return b''.join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    """Читает один ответ в формате RESP"""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Соединение с хранилищем закрыто")
+    prefix, body = line[:1], line[1:-2]
+    if prefix == b'+':
+        return body.decode('utf-8')
+    if prefix == b'-':
+        return RespError(body.decode('utf-8'))
+    if prefix == b':':
+        return int(body)
+    if prefix == b'$':
+        length = int(body)
+        if length == -1:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if prefix == b'*':
+        length = int(body)
+        if length == -1:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise RespError(f"Неизвестный ответ: {line!r}")
+
+
+class RespConnection:
+    """Соединение с конвейерной отправкой команд
+
+    Команды пишутся в сокет сразу, ответы разбирает одна фоновая задача по
+    порядку отправки. Записи без ожидания ответа уходят в том же потоке и
+    не добавляют сетевых обращений.
+    """
+
+    def __init__(self, host: str, port: int, db: int = 0, password: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._waiters: Deque[Optional[asyncio.Future]] = deque()
+        self._reader_task: Optional[asyncio.Task] = None
+        self._connect_lock = asyncio.Lock()
+        # Записи, отправленные до подключения: держим ссылки, чтобы задачи не собрал сборщик мусора
+        self._background: Set[asyncio.Task] = set()
+
+    async def _ensure_connected(self) -> None:
+        if self._writer is not None:
+            return
+        async with self._connect_lock:
+            if self._writer is not None:
+                return
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+            self._reader, self._writer = reader, writer
+            self._reader_task = asyncio.create_task(self._read_replies())
+            setup = []
+            if self.password:
+                setup.append(('AUTH', self.password))
+            if self.db:
+                setup.append(('SELECT', self.db))
+            if setup:
+                await self._execute_connected(setup)
+
+    async def _read_replies(self) -> None:
+        """Раздает ответы ожидающим в порядке отправки команд"""
+        try:
+            while True:
+                reply = await read_reply(self._reader)
+                waiter = self._waiters.popleft()
+                if waiter is None:
+                    if isinstance(reply, RespError):
+                        logger.error("Отложенная запись в хранилище не удалась: %s", reply)
+                    continue
+                if not waiter.done():
+                    waiter.set_result(reply)
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            self._fail_pending(e)
+        except asyncio.CancelledError:
+            self._fail_pending(ConnectionError("Соединение закрыто"))
+            raise
+
+    def _fail_pending(self, error: Exception) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if waiter is not None and not waiter.done():
+                waiter.set_exception(error)
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _execute_connected(self, commands: List[Tuple[Any, ...]]) -> List[Any]:
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in commands]
+        self._writer.write(b''.join(encode_command(*command) for command in commands))
+        self._waiters.extend(futures)
+        await self._writer.drain()
+        replies = await asyncio.gather(*futures)
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    async def execute(self, *commands: Tuple[Any, ...]) -> List[Any]:
+        """Отправляет команды одним пакетом и ждет ответы (одно сетевое обращение)"""
+        await self._ensure_connected()
+        return await self._execute_connected(list(commands))
+
+    def send_nowait(self, *commands: Tuple[Any, ...]) -> None:
+        """Пишет команды в конвейер, не дожидаясь ответа"""
+        if self._writer is None:
+            # Соединения еще нет: выполним запись в фоне после подключения
+            task = asyncio.get_running_loop().create_task(self.execute(*commands))
+            self._background.add(task)
+            task.add_done_callback(self._background_done)
+            return
+        self._writer.write(b''.join(encode_command(*command) for command in commands))
+        self._waiters.extend([None] * len(commands))
+
+    def _background_done(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Отложенная запись в хранилище не удалась: %s", task.exception())
+
+    async def wait_background(self) -> None:
+        """Дожидается записей, отправленных в фоне до подключения (ошибки уже записаны в лог)"""
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+
+    async def close(self) -> None:
+        await self.wait_background()
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+class RedisSessionStore(SessionStore):
+    """Общее хранилище сессий для нескольких экземпляров бота"""
+
+    def __init__(self, connection: RespConnection, prefix: str = 'jpbot:session:'):
+        self.connection = connection
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, prefix: str = 'jpbot:session:') -> 'RedisSessionStore':
+        """Создает хранилище из адреса вида redis://:password@host:port/db"""
+        parsed = urlparse(url)
+        db = int(parsed.path.lstrip('/') or 0)
+        connection = RespConnection(parsed.hostname or 'localhost', parsed.port or 6379, db, parsed.password)
+        return cls(connection, prefix)
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.prefix}{user_id}"
+
+    async def load(self, user_id: int) -> Optional[Dict[str, Any]]:
+        [payload] = await self.connection.execute(('GET', self._key(user_id)))
+        return deserialize_session(payload) if payload is not None else None
+
+    async def load_many(self, user_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        [payloads] = await self.connection.execute(('MGET', *(self._key(user_id) for user_id in user_ids)))
+        return {
+            user_id: deserialize_session(payload)
+            for user_id, payload in zip(user_ids, payloads)
+            if payload is not None
+        }
+
+    def save(self, user_id: int, session: Dict[str, Any]) -> None:
+        self.connection.send_nowait(('SET', self._key(user_id), serialize_session(session)))
+
+    def save_many(self, sessions: Dict[int, Dict[str, Any]]) -> None:
+        if not sessions:
+            return
+        args = []
+        for user_id, session in sessions.items():
+            args.extend((self._key(user_id), serialize_session(session)))
+        self.connection.send_nowait(('MSET', *args))
+
+    async def iter_user_ids(self, batch_size: int = 1000) -> AsyncIterator[List[int]]:
+        cursor = b'0'
+        prefix_length = len(self.prefix)
+        while True:
+            [(cursor, keys)] = await self.connection.execute(
+                ('SCAN', cursor, 'MATCH', f"{self.prefix}*", 'COUNT', batch_size)
+            )
+            if keys:
+                yield [int(key[prefix_length:]) for key in keys]
+            if cursor == b'0':
+                break
+
+    async def flush(self) -> None:
+        await self.connection.wait_background()
+        # Ответ на PING придет после ответов на все ранее отправленные записи
+        await self.connection.execute(('PING',))
+
+    async def close(self) -> None:
+        await self.connection.close()
+
+
+def create_session_store(url: Optional[str], prefix: str = 'jpbot:session:') -> SessionStore:
+    """Выбирает хранилище по адресу из конфигурации (prefix - ключи сессий одного бота в Redis)"""
+    if not url or url == 'memory://':
+        return InMemorySessionStore()
+    if url.startswith('redis://'):
+        return RedisSessionStore.from_url(url, prefix)
+    raise ValueError(f"Неизвестное хранилище сессий: {url}")
+
+
+class LocalRespServer:
+    """Локальная замена Redis для проверок: подмножество команд поверх словаря"""
+
+    def __init__(self):
+        self.data: Dict[bytes, bytes] = {}
+        self.commands_processed = 0
+        self._scan_snapshot: Optional[List[bytes]] = None
+        self._clients: set = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> int:
+        """Запускает сервер и возвращает порт"""
+        self._server = await asyncio.start_server(self._handle_client, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # Будим обработчики клиентов концом потока, чтобы они завершились сами
+            for reader in list(self._clients):
+                reader.feed_eof()
+            await asyncio.sleep(0)
+            await self._server.wait_closed()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._clients.add(reader)
+        try:
+            while True:
+                command = await read_reply(reader)
+                writer.write(self._dispatch(command))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._clients.discard(reader)
+            writer.close()
+
+    def _dispatch(self, command: List[bytes]) -> bytes:
+        self.commands_processed += 1
+        name, args = command[0].upper(), command[1:]
+        if name == b'PING':
+            return b'+PONG\r\n'
+        if name in (b'SELECT', b'AUTH'):
+            return b'+OK\r\n'
+        if name == b'GET':
+            return self._bulk(self.data.get(args[0]))
+        if name == b'SET':
+            self.data[args[0]] = args[1]
+            return b'+OK\r\n'
+        if name == b'MGET':
+            return b'*%d\r\n' % len(args) + b''.join(self._bulk(self.data.get(key)) for key in args)
+        if name == b'MSET':
+            for index in range(0, len(args), 2):
+                self.data[args[index]] = args[index + 1]
+            return b'+OK\r\n'
+        if name == b'DEL':
+            removed = sum(self.data.pop(key, None) is not None for key in args)
+            return b':%d\r\n' % removed
+        if name == b'SCAN':
+            return self._scan(args)
+        if name == b'DBSIZE':
+            return b':%d\r\n' % len(self.data)
+        if name == b'FLUSHDB':
+            self.data.clear()
+            return b'+OK\r\n'
+        return b'-ERR unknown command\r\n'
+
+    def _scan(self, args: List[bytes]) -> bytes:
+        # Курсор - позиция в снимке ключей, сделанном в начале обхода; для замены Redis этого достаточно
+        cursor = int(args[0])
+        options = {args[index].upper(): args[index + 1] for index in range(1, len(args) - 1, 2)}
+        count = int(options.get(b'COUNT', 10))
+        pattern = options.get(b'MATCH', b'*')
+        prefix = pattern[:-1] if pattern.endswith(b'*') else None
+        if cursor == 0 or self._scan_snapshot is None:
+            self._scan_snapshot = list(self.data)
+        keys = self._scan_snapshot
+        chunk = keys[cursor:cursor + count]
+        if prefix is not None:
+            chunk = [key for key in chunk if key.startswith(prefix)]
+        else:
+            chunk = [key for key in chunk if key == pattern]
+        next_cursor = cursor + count if cursor + count < len(keys) else 0
+        return (
+            b'*2\r\n' + self._bulk(str(next_cursor).encode())
+            + b'*%d\r\n' % len(chunk) + b''.join(self._bulk(key) for key in chunk)
+        )
+
+    @staticmethod
+    def _bulk(value: Optional[bytes]) -> bytes:
+        if value is None:
+            return b'$-1\r\n'
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+async def _serve_stand_in(host: str, port: int) -> None:
+    server = LocalRespServer()
+    port = await server.start(host, port)
+    print(f"Локальное хранилище сессий слушает redis://{host}:{port}/0")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальная замена Redis для хранилища сессий")
+    parser.add_argument("--host", default='127.0.0.1')
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    asyncio.run(_serve_stand_in(args.host, args.port))
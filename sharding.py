@@ -0,0 +1,479 @@
+"""
+Шардированный запуск бота: фронт-процесс принимает вебхуки и раздает
+обновления воркерам по хэшу user_id
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import multiprocessing as mp
+import os
+import threading
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Больше воркеров, чем ядер, только мешают друг другу: запрос ребалансировки выше предела отклоняется
+MAX_SHARD_WORKERS = int(os.getenv('SHARD_MAX_WORKERS', str(2 * (os.cpu_count() or 1))))
+
+# Ключи обновлений, в которых лежит объект с полем 'from'
+UPDATE_USER_KEYS = (
+    'message',
+    'edited_message',
+    'callback_query',
+    'inline_query',
+    'chosen_inline_result',
+    'shipping_query',
+    'pre_checkout_query',
+    'my_chat_member',
+    'chat_member',
+    'chat_join_request',
+)
+
+
+def extract_user_id(update_data: Dict[str, Any]) -> int:
+    """Достает user_id из сырого JSON обновления без построения объектов telegram"""
+    for key in UPDATE_USER_KEYS:
+        payload = update_data.get(key)
+        if payload and 'from' in payload:
+            return payload['from']['id']
+    poll_answer = update_data.get('poll_answer')
+    if poll_answer and 'user' in poll_answer:
+        return poll_answer['user']['id']
+    return 0
+
+
+def extract_route_key(update_data: Dict[str, Any]) -> int:
+    """Ключ маршрутизации: chat_id для групповых чатов (их викторина - одна на всех), иначе user_id"""
+    message = update_data.get('message')
+    if message:
+        chat = message.get('chat', {})
+        if chat.get('type') in ('group', 'supergroup'):
+            return chat['id']
+    return extract_user_id(update_data)
+
+
+def is_reload_command(update_data: Dict[str, Any]) -> bool:
+    """Команда /reload (или /reload@имя_бота) в сообщении"""
+    text = (update_data.get('message') or {}).get('text') or ''
+    if not text.startswith('/reload'):
+        return False
+    return text.split(maxsplit=1)[0].split('@', 1)[0] == '/reload'
+
+
+def shard_for(user_id: int, shard_count: int) -> int:
+    """Выбирает воркер по rendezvous-хэшу: при изменении числа воркеров переезжает минимум пользователей"""
+    best_shard = 0
+    best_score = -1
+    for shard in range(shard_count):
+        digest = hashlib.blake2b(f"{user_id}:{shard}".encode(), digest_size=8).digest()
+        score = int.from_bytes(digest, 'big')
+        if score > best_score:
+            best_shard = shard
+            best_score = score
+    return best_shard
+
+
+def _worker_main(index: int, inbox: mp.Queue, outbox: mp.Queue, token: str, offline: bool,
+                 shard_count: int, restore_saved: bool) -> None:
+    """Точка входа процесса-воркера"""
+    asyncio.run(_run_worker(index, inbox, outbox, token, offline, shard_count, restore_saved))
+
+
+async def _run_worker(index: int, inbox: mp.Queue, outbox: mp.Queue, token: str, offline: bool,
+                      shard_count: int, restore_saved: bool = True) -> None:
+    """Крутит обычные обработчики бота над обновлениями из своей очереди"""
+    # Импортируем здесь, чтобы фронт-процесс не тянул обработчики и данные
+    from telegram import Update
+    import bot
+    from session_store import create_session_store
+
+    instance = bot.default_bot
+    # Прогресс, напоминания и рейтинги воркер загружает и сохраняет только для своих пользователей
+    instance.shard = (index, shard_count)
+    instance.restore_saved = restore_saved
+    # С общим хранилищем сессии не привязаны к воркеру и ребалансировка ничего не переносит
+    instance.state.use_store(create_session_store(os.getenv('SESSION_STORE_URL')))
+
+    request = None
+    if offline:
+        from load_harness import FakeTelegramRequest
+        request = FakeTelegramRequest()
+
+    application = bot.build_application(token, request=request, with_updater=False)
+    loop = asyncio.get_running_loop()
+    processed = 0
+
+    async with application:
+        # post_init и post_shutdown вызывает только run_polling/run_webhook: здесь вызываем сами
+        # в том же порядке - фоновые задачи, загрузка прогресса и напоминаний, сохранение при остановке
+        await bot.on_startup(application)
+        # Очереди обновлений приложения у воркера нет: перегрузку оцениваем по остатку пачки
+        pending = [0]
+        bot.admission.queue_depth = lambda: pending[0]
+        await application.start()
+        while True:
+            kind, payload = await loop.run_in_executor(None, inbox.get)
+            if kind == 'updates':
+                # Обрабатываем по порядку, чтобы ответы одного пользователя не перемешивались
+                pending[0] = len(payload)
+                for update_data in payload:
+                    pending[0] -= 1
+                    await application.process_update(Update.de_json(update_data, application.bot))
+                processed += len(payload)
+            elif kind == 'rebalance':
+                instance.shard = (index, payload)
+                # Отдаем сессии пользователей, которые больше не принадлежат этому воркеру
+                moved = {
+                    user_id: session
+                    for user_id, session in instance.state.user_sessions.items()
+                    if not instance.owns(user_id)
+                }
+                for user_id in moved:
+                    del instance.state.user_sessions[user_id]
+                # Групповые викторины не переносим: в чате, уехавшем на другой воркер, ее начинают заново
+                for chat_id in [chat_id for chat_id in instance.group_games.games if not instance.owns(chat_id)]:
+                    instance.group_games.stop(chat_id)
+                # Рейтинги воркера - по его пользователям: уехавшие попадут в рейтинги нового воркера
+                for user_id in [user_id for user_id in instance.leaderboards.user_ids() if not instance.owns(user_id)]:
+                    instance.leaderboards.reset_user(user_id)
+                # Напоминания рассылает воркер пользователя: уехавшие забирают свои сроки с собой
+                moved_reminders = instance.reminders.take(lambda user_id: not instance.owns(user_id))
+                outbox.put(('sessions', (moved, moved_reminders)))
+            elif kind == 'import':
+                sessions, reminders = payload
+                instance.state.user_sessions.update(sessions)
+                for user_id, session in sessions.items():
+                    instance.leaderboards.load_session(user_id, session)
+                for user_id, due in reminders.items():
+                    instance.reminders.schedule(user_id, due)
+            elif kind == 'reload':
+                # /reload обработал воркер администратора, остальные перечитывают наборы следом за ним
+                if payload in bot.ADMIN_IDS:
+                    try:
+                        await bot.reload_decks()
+                    except Exception as e:
+                        logger.error("Воркер %s не перезагрузил наборы символов: %s", index, e)
+            elif kind == 'ping':
+                outbox.put(('pong', index))
+            elif kind == 'stop':
+                break
+        # Бесконечные фоновые задачи останавливаем до application.stop()
+        await bot.stop_background_tasks()
+        await application.stop()
+        await bot.on_shutdown(application)
+
+    outbox.put(('done', processed))
+
+
+class ShardRouter:
+    """Держит пул воркеров и маршрутизирует обновления по user_id"""
+
+    def __init__(self, token: str, shard_count: int, offline: bool = False):
+        self.token = token
+        self.offline = offline
+        self.shard_count = 0
+        # Обновления, обработанные уже остановленными при ребалансировке воркерами
+        self.retired_processed = 0
+        self.workers: List[mp.Process] = []
+        self.inboxes: List[mp.Queue] = []
+        self.outboxes: List[mp.Queue] = []
+        self._context = mp.get_context('spawn')
+        # Короткая блокировка таблицы воркеров: маршрутизация берет ее на одно обновление,
+        # ребалансировка - только на смену таблицы, но не на время переноса сессий
+        self._lock = threading.Lock()
+        # Две ребалансировки сразу не запускаем
+        self._resize_lock = threading.Lock()
+        # На время переноса: новое число воркеров и придержанные обновления переезжающих пользователей
+        self._target_count: Optional[int] = None
+        self._held: List[Dict[str, Any]] = []
+        self._spawn_workers(shard_count, restore_saved=True)
+        self.shard_count = shard_count
+
+    def _spawn_workers(self, shard_count: int, restore_saved: bool = False) -> None:
+        """Дозапускает воркеры до нужного количества (restore_saved - первые при запуске, читают сохраненное)"""
+        for index in range(len(self.workers), shard_count):
+            inbox = self._context.Queue()
+            outbox = self._context.Queue()
+            process = self._context.Process(
+                target=_worker_main,
+                args=(index, inbox, outbox, self.token, self.offline, shard_count, restore_saved),
+                name=f"shard-{index}",
+                daemon=True
+            )
+            process.start()
+            self.workers.append(process)
+            self.inboxes.append(inbox)
+            self.outboxes.append(outbox)
+            logger.info("Запущен воркер %s (pid %s)", index, process.pid)
+
+    def wait_ready(self) -> None:
+        """Ждет, пока все воркеры поднимут приложение"""
+        for inbox in self.inboxes:
+            inbox.put(('ping', None))
+        for outbox in self.outboxes:
+            outbox.get()
+
+    def _shard_or_hold(self, update_data: Dict[str, Any]) -> Optional[int]:
+        """Воркер для обновления; None - пользователь сейчас переезжает, обновление придержано
+
+        Вызывается под self._lock.
+        """
+        route_key = extract_route_key(update_data)
+        shard = shard_for(route_key, self.shard_count)
+        if self._target_count is not None and shard_for(route_key, self._target_count) != shard:
+            # Его сессия в пути: старый воркер ее уже отдал, новый еще не получил
+            self._held.append(update_data)
+            return None
+        return shard
+
+    def _broadcast_reload(self, update_data: Dict[str, Any], shard: int) -> None:
+        """Наборы символов у каждого воркера свои: /reload передаем и остальным (под self._lock)"""
+        user_id = extract_user_id(update_data)
+        for index in range(self.shard_count):
+            if index != shard:
+                self.inboxes[index].put(('reload', user_id))
+
+    def route(self, update_data: Dict[str, Any]) -> Optional[int]:
+        """Отправляет обновление воркеру, которому принадлежит пользователь (или групповой чат)"""
+        with self._lock:
+            shard = self._shard_or_hold(update_data)
+            if shard is not None:
+                # put не ждет воркер: данные уходят в фоновый поток очереди
+                self.inboxes[shard].put(('updates', [update_data]))
+                if is_reload_command(update_data):
+                    self._broadcast_reload(update_data, shard)
+        return shard
+
+    def route_many(self, updates: List[Dict[str, Any]]) -> None:
+        """Раскладывает пачку обновлений по воркерам одним сообщением на воркер"""
+        with self._lock:
+            self._dispatch(updates)
+
+    def _dispatch(self, updates: List[Dict[str, Any]]) -> None:
+        """Тело route_many (под self._lock)"""
+        batches: List[List[Dict[str, Any]]] = [[] for _ in range(self.shard_count)]
+        reloads = []
+        for update_data in updates:
+            shard = self._shard_or_hold(update_data)
+            if shard is not None:
+                batches[shard].append(update_data)
+                if is_reload_command(update_data):
+                    reloads.append((update_data, shard))
+        for shard, batch in enumerate(batches):
+            if batch:
+                self.inboxes[shard].put(('updates', batch))
+        for update_data, shard in reloads:
+            self._broadcast_reload(update_data, shard)
+
+    def resize(self, new_count: int) -> int:
+        """Меняет число воркеров и переносит сессии переехавших пользователей
+
+        Обновления пользователей, которые остаются на своем воркере, идут как обычно;
+        обновления переезжающих придерживаются, пока их сессии не доедут до нового воркера.
+        """
+        if new_count < 1:
+            raise ValueError("Нужен хотя бы один воркер")
+        with self._resize_lock:
+            old_count = self.shard_count
+            if new_count == old_count:
+                return 0
+            # Новые воркеры еще не в таблице маршрутизации: запускаем без блокировки
+            self._spawn_workers(new_count)
+
+            with self._lock:
+                self._target_count = new_count
+                # Воркеры обрабатывают очередь по порядку, поэтому все уже отправленные
+                # им обновления будут применены до выгрузки сессий
+                for index in range(old_count):
+                    self.inboxes[index].put(('rebalance', new_count))
+
+            moved_total = 0
+            imports: List[Dict[int, Any]] = [{} for _ in range(new_count)]
+            reminder_imports: List[Dict[int, float]] = [{} for _ in range(new_count)]
+            for index in range(old_count):
+                kind, (moved, moved_reminders) = self.outboxes[index].get()
+                for user_id, session in moved.items():
+                    imports[shard_for(user_id, new_count)][user_id] = session
+                for user_id, due in moved_reminders.items():
+                    reminder_imports[shard_for(user_id, new_count)][user_id] = due
+                moved_total += len(moved)
+
+            # Сессии уходят в очереди раньше придержанных обновлений, поэтому применятся первыми
+            for index, (sessions, reminders) in enumerate(zip(imports, reminder_imports)):
+                if sessions or reminders:
+                    self.inboxes[index].put(('import', (sessions, reminders)))
+
+            with self._lock:
+                retired = list(zip(self.workers[new_count:], self.inboxes[new_count:], self.outboxes[new_count:]))
+                del self.workers[new_count:]
+                del self.inboxes[new_count:]
+                del self.outboxes[new_count:]
+                self.shard_count = new_count
+                self._target_count = None
+                held, self._held = self._held, []
+                # Придержанные обновления уходят в очереди раньше, чем кто-то успеет
+                # отправить новое обновление того же пользователя: порядок не нарушается
+                self._dispatch(held)
+
+            # Лишние воркеры уже отдали все сессии и новых обновлений не получают
+            for process, inbox, outbox in retired:
+                self.retired_processed += self._stop_worker(process, inbox, outbox)
+
+            logger.info("Ребалансировка %s -> %s: перенесено %s сессий, придержано обновлений %s",
+                        old_count, new_count, moved_total, len(held))
+            return moved_total
+
+    @staticmethod
+    def _stop_worker(process: mp.Process, inbox: mp.Queue, outbox: mp.Queue) -> int:
+        """Останавливает воркер и возвращает число обработанных им обновлений"""
+        inbox.put(('stop', None))
+        processed = 0
+        while True:
+            kind, payload = outbox.get()
+            if kind == 'done':
+                processed = payload
+                break
+        process.join()
+        return processed
+
+    def stop(self) -> int:
+        """Останавливает все воркеры и возвращает общее число обработанных обновлений"""
+        with self._resize_lock, self._lock:
+            processed = self.retired_processed
+            processed += sum(
+                self._stop_worker(process, inbox, outbox)
+                for process, inbox, outbox in zip(self.workers, self.inboxes, self.outboxes)
+            )
+            self.workers.clear()
+            self.inboxes.clear()
+            self.outboxes.clear()
+            self.shard_count = 0
+        return processed
+
+
+def token_matches(value: str, expected: str) -> bool:
+    """Сравнивает секрет из заголовка за постоянное время (заголовки декодированы как latin-1)"""
+    return hmac.compare_digest(value.encode('latin-1', 'replace'), expected.encode('utf-8'))
+
+
+class WebhookFront:
+    """Минимальный HTTP-приемник вебхуков Telegram на asyncio без лишних зависимостей
+
+    Команда ребалансировки POST /admin/resize/<N> принимается только с заголовком
+    X-Admin-Token; если admin_token не задан, ее просто нет (404).
+    """
+
+    def __init__(self, router: ShardRouter, secret_token: Optional[str] = None, path: str = '/telegram',
+                 admin_token: Optional[str] = None):
+        self.router = router
+        self.secret_token = secret_token
+        self.path = path
+        self.admin_token = admin_token
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Обрабатывает keep-alive соединение с несколькими запросами подряд"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', '0')))
+
+                status = await self.handle_request(method, target, headers, body)
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Length: 0\r\n\r\n".encode())
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            # Битый HTTP: соединение закрываем, разбирать дальше нечего
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, method: str, target: str, headers: Dict[str, str], body: bytes) -> str:
+        """Разбирает один запрос: вебхук или команду ребалансировки"""
+        if method != 'POST':
+            return "405 Method Not Allowed"
+
+        if target.startswith('/admin/'):
+            return await self.handle_admin(target, headers)
+
+        if target != self.path:
+            return "404 Not Found"
+        if self.secret_token and not token_matches(headers.get('x-telegram-bot-api-secret-token', ''),
+                                                   self.secret_token):
+            return "403 Forbidden"
+        try:
+            update_data = json.loads(body)
+        except ValueError:
+            return "400 Bad Request"
+        if not isinstance(update_data, dict):
+            return "400 Bad Request"
+        self.router.route(update_data)
+        return "200 OK"
+
+    async def handle_admin(self, target: str, headers: Dict[str, str]) -> str:
+        """Команды управления: только со своим токеном, секрета вебхука для них недостаточно"""
+        if not self.admin_token:
+            return "404 Not Found"
+        if not token_matches(headers.get('x-admin-token', ''), self.admin_token):
+            return "403 Forbidden"
+
+        prefix = '/admin/resize/'
+        if not target.startswith(prefix):
+            return "404 Not Found"
+        text = target[len(prefix):]
+        if not (text.isascii() and text.isdigit()) or not 1 <= int(text) <= MAX_SHARD_WORKERS:
+            return "400 Bad Request"
+        # Ребалансировка блокирующая, уводим ее из event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.router.resize, int(text))
+        return "200 OK"
+
+
+async def _serve(token: str, router: ShardRouter) -> None:
+    """Поднимает вебхук-приемник и регистрирует его в Telegram"""
+    from telegram import Bot, Update
+
+    host = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+    port = int(os.getenv('WEBHOOK_PORT', '8443'))
+    webhook_url = os.getenv('WEBHOOK_URL')
+    secret_token = os.getenv('WEBHOOK_SECRET')
+
+    front = WebhookFront(router, secret_token=secret_token, admin_token=os.getenv('SHARD_ADMIN_TOKEN'))
+    server = await asyncio.start_server(front.handle_connection, host, port)
+
+    if webhook_url:
+        async with Bot(token) as bot:
+            await bot.set_webhook(
+                url=webhook_url,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES
+            )
+        logger.info("Вебхук зарегистрирован: %s", webhook_url)
+
+    logger.info("Фронт слушает %s:%s, воркеров: %s", host, port, router.shard_count)
+    async with server:
+        await server.serve_forever()
+
+
+def run_sharded(token: str, shard_count: int) -> None:
+    """Запускает фронт-процесс с пулом воркеров"""
+    router = ShardRouter(token, shard_count)
+    try:
+        asyncio.run(_serve(token, router))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        processed = router.stop()
+        logger.info("Воркеры остановлены, обработано обновлений: %s", processed)
@@ -0,0 +1,156 @@
+"""
+Метаданные символов и битовые индексы для сборки наборов запросами
+"""
+
+import sys
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+# Комбинирующие знаки, на которые раскладываются символы с тэнтэн и мару
+DAKUTEN_MARK = "゙"
+HANDAKUTEN_MARK = "゚"
+
+
+def iter_bits(mask: int) -> Iterator[int]:
+    """Номера установленных битов маски по возрастанию"""
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length() - 1
+        mask ^= lowest
+
+
+class DeckQueryError(ValueError):
+    """Ошибка в тексте запроса набора"""
+
+
+def symbol_script(symbol: str) -> str:
+    """Письменность символа по имени в Unicode: kanji, hiragana или katakana"""
+    name = unicodedata.name(symbol[0], "")
+    if name.startswith("HIRAGANA"):
+        return "hiragana"
+    if name.startswith("KATAKANA"):
+        return "katakana"
+    if name.startswith("CJK"):
+        return "kanji"
+    return "other"
+
+
+def symbol_voicing(symbol: str) -> str:
+    """dakuten (が), handakuten (ぱ) или none"""
+    decomposed = unicodedata.normalize("NFD", symbol)
+    if DAKUTEN_MARK in decomposed:
+        return "dakuten"
+    if HANDAKUTEN_MARK in decomposed:
+        return "handakuten"
+    return "none"
+
+
+def symbol_metadata(symbol: str, symbol_data: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Значения полей, по которым можно искать символ (у поля может быть несколько значений)"""
+    metadata = {
+        "script": [symbol_script(symbol)],
+        "voicing": [symbol_voicing(symbol)],
+    }
+    if "jlpt" in symbol_data:
+        metadata["jlpt"] = [f"N{symbol_data['jlpt']}"]
+    if "strokes" in symbol_data:
+        metadata["strokes"] = [str(symbol_data["strokes"])]
+    if symbol_data.get("radicals"):
+        metadata["radical"] = list(symbol_data["radicals"])
+    return metadata
+
+
+class SymbolIndex:
+    """Битовые индексы по метаданным символов общего каталога
+
+    Символ получает номер (id) по порядку в каталоге, набор символов - это
+    целое число с установленными битами этих номеров. Запрос собирается
+    из индексов операциями & | ~ над числами, без копирования словарей.
+    """
+
+    def __init__(self, symbols: Dict[str, Dict[str, Any]]):
+        self.symbols: Tuple[str, ...] = tuple(symbols)
+        self.ids: Dict[str, int] = {symbol: symbol_id for symbol_id, symbol in enumerate(self.symbols)}
+        self.all_mask = (1 << len(self.symbols)) - 1
+        # Поле -> значение -> битовая маска символов
+        self.bitmaps: Dict[str, Dict[str, int]] = defaultdict(dict)
+        for symbol_id, symbol in enumerate(self.symbols):
+            for field, values in symbol_metadata(symbol, symbols[symbol]).items():
+                field_bitmaps = self.bitmaps[field]
+                for value in values:
+                    field_bitmaps[value] = field_bitmaps.get(value, 0) | (1 << symbol_id)
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def mask_of(self, symbols: Iterable[str]) -> int:
+        """Маска набора по списку символов (неизвестные символы пропускаются)"""
+        mask = 0
+        for symbol in symbols:
+            symbol_id = self.ids.get(symbol)
+            if symbol_id is not None:
+                mask |= 1 << symbol_id
+        return mask
+
+    def symbols_of(self, mask: int) -> List[str]:
+        """Символы маски в порядке каталога"""
+        symbols = self.symbols
+        return [symbols[symbol_id] for symbol_id in iter_bits(mask)]
+
+    def field_mask(self, field: str, values: str) -> int:
+        """Маска условия field:v1,v2 (значения через запятую объединяются)"""
+        field_bitmaps = self.bitmaps.get(field)
+        if field_bitmaps is None:
+            raise DeckQueryError(f"Неизвестное поле: {field}")
+        mask = 0
+        for value in values.split(","):
+            if field == "jlpt" and not value.upper().startswith("N"):
+                value = f"N{value}"
+            if field == "strokes" and "-" in value:
+                # Диапазон числа черт: strokes:1-4
+                low, high = value.split("-", 1)
+                try:
+                    wanted = range(int(low), int(high) + 1)
+                except ValueError:
+                    raise DeckQueryError(f"Неверный диапазон: {value}") from None
+                for strokes, strokes_mask in field_bitmaps.items():
+                    if int(strokes) in wanted:
+                        mask |= strokes_mask
+                continue
+            mask |= field_bitmaps.get(value.upper() if field == "jlpt" else value, 0)
+        return mask
+
+    def query(self, text: str) -> int:
+        """Маска символов по запросу вида "script:kanji jlpt:N4 radical:氵 -strokes:1-3"
+
+        Условия через пробел пересекаются, значения через запятую объединяются,
+        минус перед условием исключает подходящие символы.
+        """
+        mask = self.all_mask
+        for term in text.split():
+            negate = term.startswith("-")
+            if negate:
+                term = term[1:]
+            field, separator, values = term.partition(":")
+            if not separator or not values:
+                raise DeckQueryError(f"Ожидается поле:значение, получено: {term}")
+            term_mask = self.field_mask(field, values)
+            mask &= ~term_mask if negate else term_mask
+        return mask & self.all_mask
+
+
+if __name__ == "__main__":
+    from japanese_data import ALL_SYMBOLS
+
+    query = " ".join(sys.argv[1:]) or "script:katakana voicing:dakuten,handakuten"
+    index = SymbolIndex(ALL_SYMBOLS)
+    repeats = 10_000
+    started = time.perf_counter()
+    for _ in range(repeats):
+        mask = index.query(query)
+    elapsed = time.perf_counter() - started
+    found = index.symbols_of(mask)
+    print(f"{query}: {len(found)} из {len(index)} символов, {elapsed / repeats * 1e6:.1f} мкс на запрос")
+    print(" ".join(found))
@@ -0,0 +1,134 @@
+"""
+Самые трудные и самые выученные символы пользователя с инкрементальным обновлением
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from deck_registry import DeckCatalog
+from leaderboard import IndexableSkipList
+from symbol_stats import DIRECTIONS
+
+# Сколько пользователей держать в памяти (остальные пересоберутся при просмотре статистики)
+RANKINGS_CACHE_SIZE = 10000
+
+
+class SymbolRanking:
+    """Символы одной викторины, упорядоченные по delta
+
+    Хранятся только ненулевые счетчики: нулевой ничего не говорит о символе.
+    Изменение одного счетчика - удаление и вставка в skip list за O(log n),
+    а начало и конец списка читаются за O(log n + k) без сортировки.
+    """
+
+    __slots__ = ('direction', 'deck_mask', 'entries', 'values')
+
+    def __init__(self, catalog: DeckCatalog, quiz_type: str, stats: np.ndarray):
+        self.direction = catalog.directions[quiz_type]
+        self.deck_mask = catalog.deck_masks[quiz_type]
+        self.entries = IndexableSkipList()
+        self.values: Dict[int, int] = {}
+        keys = catalog.deck_keys(quiz_type)
+        deltas = stats[keys]
+        for index in np.flatnonzero(deltas):
+            self.set(int(keys[index]), int(deltas[index]))
+
+    def __contains__(self, key: int) -> bool:
+        return key % DIRECTIONS == self.direction and bool((self.deck_mask >> (key // DIRECTIONS)) & 1)
+
+    def set(self, key: int, delta: int) -> None:
+        old = self.values.get(key, 0)
+        if old == delta:
+            return
+        if old:
+            self.entries.remove((old, key))
+            del self.values[key]
+        if delta:
+            self.entries.insert((delta, key))
+            self.values[key] = delta
+
+    def weakest(self, k: int) -> List[Tuple[int, int]]:
+        """До k ключей с перевесом ошибок, самые трудные первыми: [(ключ, delta)]"""
+        result = []
+        for delta, key in self.entries.iter_from(1):
+            if delta >= 0 or len(result) >= k:
+                break
+            result.append((key, delta))
+        return result
+
+    def strongest(self, k: int) -> List[Tuple[int, int]]:
+        """До k ключей с перевесом правильных ответов, самые выученные первыми"""
+        tail = list(self.entries.iter_from(max(1, len(self.entries) - k + 1)))
+        return [(key, delta) for delta, key in reversed(tail) if delta > 0]
+
+
+class UserRankings:
+    """Рейтинги символов одного пользователя по викторинам, собранные по запросу"""
+
+    __slots__ = ('catalog_version', 'stats_version', 'rankings')
+
+    def __init__(self, catalog_version: str, stats_version: int):
+        self.catalog_version = catalog_version
+        # Версия статистики сессии, которой соответствуют рейтинги
+        self.stats_version = stats_version
+        self.rankings: Dict[str, SymbolRanking] = {}
+
+
+class SymbolRankings:
+    """Рейтинги символов пользователей, живущие только в памяти процесса
+
+    Рейтинг викторины собирается из статистики при первом просмотре, а потом
+    обновляется на каждом ответе. Если статистика менялась в обход этого
+    объекта (другим процессом, сбросом, перезагрузкой наборов), версии не
+    сойдутся и рейтинги соберутся заново.
+    """
+
+    def __init__(self, size: int = RANKINGS_CACHE_SIZE):
+        self.size = size
+        self.users: "OrderedDict[int, UserRankings]" = OrderedDict()
+
+    def _current(self, user_id: int, session: Dict[str, Any], catalog: DeckCatalog) -> Optional[UserRankings]:
+        entry = self.users.get(user_id)
+        if entry is None:
+            return None
+        if entry.catalog_version != catalog.version or entry.stats_version != session['stats_version']:
+            del self.users[user_id]
+            return None
+        self.users.move_to_end(user_id)
+        return entry
+
+    def ranking(self, user_id: int, session: Dict[str, Any], catalog: DeckCatalog, quiz_type: str) -> SymbolRanking:
+        entry = self._current(user_id, session, catalog)
+        if entry is None:
+            entry = self.users[user_id] = UserRankings(catalog.version, session['stats_version'])
+            while len(self.users) > self.size:
+                self.users.popitem(last=False)
+        ranking = entry.rankings.get(quiz_type)
+        if ranking is None:
+            ranking = entry.rankings[quiz_type] = SymbolRanking(catalog, quiz_type, session['symbols_stats'])
+        return ranking
+
+    def update(self, user_id: int, session: Dict[str, Any], catalog: DeckCatalog, keys: Iterable[int],
+               previous_version: int) -> None:
+        """Переносит в рейтинги новые значения счетчиков keys
+
+        previous_version - версия статистики до изменения: если рейтинги
+        собраны по другой, они устарели и просто отбрасываются.
+        """
+        entry = self.users.get(user_id)
+        if entry is None:
+            return
+        if entry.catalog_version != catalog.version or entry.stats_version != previous_version:
+            del self.users[user_id]
+            return
+        stats = session['symbols_stats']
+        for key in keys:
+            for ranking in entry.rankings.values():
+                if key in ranking:
+                    ranking.set(key, int(stats[key]))
+        entry.stats_version = session['stats_version']
+
+    def drop(self, user_id: int) -> None:
+        self.users.pop(user_id, None)
@@ -0,0 +1,126 @@
+"""
+Статистика пользователя по символам с учетом направления вопроса
+"""
+
+import logging
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Направления: узнать символ (символ -> чтение или значение) и вспомнить его (чтение -> символ)
+RECOGNITION = 0
+RECALL = 1
+DIRECTIONS = 2
+
+# delta хранится в int16: ограничиваем, чтобы не переполнить
+STATS_DTYPE = np.int16
+DELTA_LIMIT = 10000
+
+# Плотный массив в памяти или разреженный словарь сразу после загрузки сессии
+SymbolStats = Union[np.ndarray, Dict[Any, int]]
+
+
+def quiz_direction(quiz_info: Dict[str, Any]) -> int:
+    """Направление викторины: режимы с кнопками-символами тренируют вспоминание"""
+    return RECALL if quiz_info['answer_type'] == "symbol" else RECOGNITION
+
+
+def stats_key(symbol_id: int, direction: int) -> int:
+    """Целочисленный ключ (символ, направление) - индекс в массиве статистики"""
+    return symbol_id * DIRECTIONS + direction
+
+
+def empty_stats(symbol_count: int = 0) -> np.ndarray:
+    return np.zeros(symbol_count * DIRECTIONS, dtype=STATS_DTYPE)
+
+
+def add_delta(stats: np.ndarray, key: int, delta: int) -> None:
+    stats[key] = max(-DELTA_LIMIT, min(DELTA_LIMIT, int(stats[key]) + delta))
+
+
+def weak_count(stats: SymbolStats) -> int:
+    """Сколько счетчиков с перевесом ошибок - столько символов ждут повторения"""
+    if isinstance(stats, np.ndarray):
+        return int((stats < 0).sum())
+    return sum(1 for value in stats.values() if value < 0)
+
+
+def stats_to_json(stats: SymbolStats) -> Dict[str, int]:
+    """Только ненулевые счетчики: нулевой не отличается от отсутствующего"""
+    if isinstance(stats, np.ndarray):
+        keys = np.flatnonzero(stats)
+        return {str(key): int(stats[key]) for key in keys}
+    return {str(key): int(value) for key, value in stats.items() if value}
+
+
+def stats_from_json(stored: Dict[str, int]) -> Dict[Any, int]:
+    """Разреженная статистика из JSON; ключи старого формата (сами символы) остаются строками"""
+    return {int(key) if key.isdigit() else key: value for key, value in stored.items()}
+
+
+def _remap_stats(stats: SymbolStats, registry, version: Optional[str], symbol_count: int) -> np.ndarray:
+    """Переводит статистику в номера символов текущей версии каталога
+
+    Счетчики версии, порядок символов которой неизвестен, отбрасываются:
+    тот же номер в текущей версии может означать совсем другой символ.
+    """
+    index = registry.current.index
+    result = empty_stats(symbol_count)
+    items = stats.items() if isinstance(stats, dict) else ((key, stats[key]) for key in np.flatnonzero(stats))
+    same_version = version == registry.current.version
+    old_symbols = None if same_version else registry.symbol_tables.get(version)
+    dropped = 0
+    for key, value in items:
+        if isinstance(key, str):
+            # Старый формат: один счетчик на символ без направления - достается обоим направлениям
+            symbol_id = index.ids.get(key)
+            if symbol_id is not None:
+                for direction in range(DIRECTIONS):
+                    result[stats_key(symbol_id, direction)] = value
+            continue
+        key = int(key)
+        if not same_version:
+            if old_symbols is None or key // DIRECTIONS >= len(old_symbols):
+                dropped += 1
+                continue
+            symbol_id = index.ids.get(old_symbols[key // DIRECTIONS])
+            if symbol_id is None:
+                # Символ убран из каталога
+                continue
+            key = stats_key(symbol_id, key % DIRECTIONS)
+        if key < len(result):
+            result[key] = value
+    if dropped:
+        logger.warning("Статистика версии каталога %s не переведена: нет порядка ее символов, отброшено счетчиков %s",
+                       version, dropped)
+    return result
+
+
+def sync_session(session: Dict[str, Any], registry) -> None:
+    """Приводит номера символов в сессии к текущей версии каталога
+
+    Статистика и свои наборы хранят номера символов, поэтому записаны вместе
+    с версией каталога. После перезагрузки данных они один раз переводятся
+    на новые номера; в остальное время здесь только сравнение версий.
+    """
+    catalog = registry.current
+    version = session['catalog_version']
+    stats = session['symbols_stats']
+    symbol_count = len(catalog.index)
+    if version == catalog.version and isinstance(stats, np.ndarray) and len(stats) == symbol_count * DIRECTIONS:
+        return
+    session['symbols_stats'] = _remap_stats(stats, registry, version, symbol_count)
+    if version != catalog.version:
+        # Время ответов - недавняя история, ее проще начать заново, чем переводить
+        session['answer_times'] = None
+    if session['custom_decks'] and version != catalog.version:
+        remapped = {}
+        for name, mask in session['custom_decks'].items():
+            new_mask = registry.remap_mask(mask, version)
+            # Порядок символов старой версии неизвестен: старые номера могут означать другие символы,
+            # поэтому набор остается под своим именем, но пустым - его можно собрать заново
+            remapped[name] = 0 if new_mask is None else new_mask
+        session['custom_decks'] = remapped
+    session['catalog_version'] = catalog.version
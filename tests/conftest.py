@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Модули бота лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load_harness import isolate_persisted_files  # noqa: E402
+
+# Тесты, которые импортируют bot, не должны писать в data/
+isolate_persisted_files()
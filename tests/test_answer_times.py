@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from answer_times import MAX_ANSWER_MS, AnswerTimes, slowness_factors
+
+
+def test_record_rejects_out_of_range():
+    times = AnswerTimes(size=4)
+    assert times.record(1, 2.5)
+    assert not times.record(1, -0.1)
+    assert not times.record(1, MAX_ANSWER_MS / 1000 + 1)
+    assert len(times) == 1
+    assert times.median(1) == 2.5
+
+
+def test_ring_buffer_wraparound():
+    times = AnswerTimes(size=4)
+    for second in range(1, 7):
+        times.record(second, float(second))
+    # Поместились последние четыре ответа, новые легли на место самых старых
+    assert len(times) == 4
+    assert times.position == 2
+    assert sorted(times.keys.tolist()) == [3, 4, 5, 6]
+    assert times.median(1) is None
+    assert times.median() == 4.5
+    # В JSON - от старых ответов к новым
+    assert times.to_json() == [[3, 4, 5, 6], [3000, 4000, 5000, 6000]]
+
+
+def test_json_roundtrip_after_wraparound():
+    times = AnswerTimes()
+    size = len(times.keys)
+    for key in range(size + 10):
+        times.record(key, 1.0)
+    restored = AnswerTimes.from_json(times.to_json())
+    assert restored.to_json() == times.to_json()
+    # Дальше пишем поверх самого старого ответа, как и в исходном буфере
+    times.record(-5, 7.0)
+    restored.record(-5, 7.0)
+    assert restored.to_json() == times.to_json()
+    assert times.to_json()[0][0] == 11 and times.to_json()[0][-1] == -5
+
+
+def test_from_json_keeps_newest_when_buffer_shrank():
+    restored = AnswerTimes.from_json([list(range(300)), [1000] * 300])
+    assert len(restored) == len(restored.keys)
+    assert restored.to_json()[0][-1] == 299
+
+
+def test_key_medians():
+    times = AnswerTimes(size=8)
+    for key, seconds in ((5, 1.0), (2, 4.0), (5, 3.0), (2, 2.0), (2, 9.0)):
+        times.record(key, seconds)
+    keys, medians, counts = times.key_medians()
+    assert keys.tolist() == [2, 5]
+    assert medians.tolist() == [4.0, 2.0]
+    assert counts.tolist() == [3, 2]
+
+
+def filled(pairs, size=64):
+    times = AnswerTimes(size=size)
+    for key, seconds in pairs:
+        times.record(key, seconds)
+    return times
+
+
+def test_slowness_factors():
+    # Обычно 2 с, над ключом 7 думают 6 с, над ключом 8 - 20 с
+    times = filled([(1, 2.0)] * 20 + [(7, 6.0)] * 3 + [(8, 20.0)] * 3)
+    factors = slowness_factors(times, np.array([1, 7, 8, 9]), min_answers=20)
+    assert factors.tolist() == pytest.approx([1.0, 3.0, 3.0, 1.0])
+    factors = slowness_factors(times, np.array([7, 8]), min_answers=20, limit=5.0)
+    assert factors.tolist() == pytest.approx([3.0, 5.0])
+
+
+def test_slowness_factors_without_signal():
+    assert slowness_factors(None, np.array([1])) is None
+    # Мало ответов
+    assert slowness_factors(filled([(1, 2.0), (7, 9.0)]), np.array([7]), min_answers=20) is None
+    # Все отвечают одинаково быстро
+    assert slowness_factors(filled([(1, 2.0)] * 30), np.array([1]), min_answers=20) is None
+    # Медленные символы есть, но не среди запрошенных ключей
+    times = filled([(1, 2.0)] * 20 + [(7, 6.0)] * 3)
+    assert slowness_factors(times, np.array([1, 2, 3]), min_answers=20) is None
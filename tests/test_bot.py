@@ -0,0 +1,98 @@
+import copy
+
+import pytest
+
+import bot
+from bot import split_batch_answers
+from symbol_stats import sync_session
+
+MEANING = {'answer_type': 'meaning'}
+ROMAJI = {'answer_type': 'romaji'}
+SYMBOL = {'answer_type': 'symbol'}
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("ka ki ku", ['ka', 'ki', 'ku']),
+    ("  KA   Ki\tku ", ['ka', 'ki', 'ku']),
+    ("ka\nki\nku", ['ka', 'ki', 'ku']),
+    ("ka;ki; ku", ['ka', 'ki', 'ku']),
+])
+def test_separators(text, expected):
+    assert split_batch_answers(text, ROMAJI, 3) == expected
+
+
+def test_newline_and_semicolon_keep_phrases():
+    # Значение может быть из нескольких слов: пробел внутри ответа не разделяет
+    assert split_batch_answers("большой дом\nвода", MEANING, 2) == ['большой дом', 'вода']
+    assert split_batch_answers("большой дом; вода", MEANING, 2) == ['большой дом', 'вода']
+    # Перевод строки главнее: точка с запятой внутри строки остается в ответе
+    assert split_batch_answers("a;b\nc", MEANING, 2) == ['a;b', 'c']
+
+
+def test_empty_parts_are_dropped():
+    assert split_batch_answers("ka\n\n  \nki\n", ROMAJI, 2) == ['ka', 'ki']
+    assert split_batch_answers("ka;;ki;", ROMAJI, 2) == ['ka', 'ki']
+    assert split_batch_answers("   ", ROMAJI, 2) == []
+
+
+def test_kana_written_together():
+    assert split_batch_answers("あかさ", SYMBOL, 3) == ['あ', 'か', 'さ']
+    assert split_batch_answers("あ か さ", SYMBOL, 3) == ['あ', 'か', 'さ']
+
+
+def test_count_mismatch_is_not_guessed():
+    # Слитный ответ другой длины не режется: лишние и недостающие ответы разбирает вызывающий
+    assert split_batch_answers("あか", SYMBOL, 3) == ['あか']
+    assert split_batch_answers("あかさた", SYMBOL, 3) == ['あかさた']
+    # Для чтений слитный текст - одно слово
+    assert split_batch_answers("kaki", ROMAJI, 4) == ['kaki']
+    assert split_batch_answers("ka ki ku ke", ROMAJI, 2) == ['ka', 'ki', 'ku', 'ke']
+    assert split_batch_answers("ka", ROMAJI, 3) == ['ka']
+
+
+@pytest.fixture
+def prefetch_state():
+    state = bot.JapaneseBotState()
+    session = bot.new_session()
+    sync_session(session, bot.decks)
+    return state, session
+
+
+def test_prefetched_question_is_taken_once(prefetch_state):
+    state, session = prefetch_state
+    question = bot.build_question(session, 'hiragana_to_romaji')
+    state.store_prefetched_question(1, question)
+    assert state.take_prefetched_question(1, session, 'hiragana_to_romaji') is question
+    assert state.take_prefetched_question(1, session, 'hiragana_to_romaji') is None
+
+
+def test_prefetch_dropped_when_quiz_type_changes(prefetch_state):
+    state, session = prefetch_state
+    state.store_prefetched_question(1, bot.build_question(session, 'hiragana_to_romaji'))
+    assert state.take_prefetched_question(1, session, 'katakana_to_romaji') is None
+    # Устаревшая заготовка не остается в кэше
+    assert 1 not in state.prefetched_questions
+
+
+def test_prefetch_dropped_when_stats_change(prefetch_state):
+    state, session = prefetch_state
+    state.store_prefetched_question(1, bot.build_question(session, 'hiragana_to_romaji'))
+    bot.bump_stats_version(session)
+    assert state.take_prefetched_question(1, session, 'hiragana_to_romaji') is None
+
+
+def test_prefetch_dropped_when_catalog_changes(prefetch_state, monkeypatch):
+    state, session = prefetch_state
+    state.store_prefetched_question(1, bot.build_question(session, 'hiragana_to_romaji'))
+    reloaded = copy.copy(bot.decks.current)
+    reloaded.version = 'reloaded'
+    monkeypatch.setattr(bot.decks, 'current', reloaded)
+    assert state.take_prefetched_question(1, session, 'hiragana_to_romaji') is None
+
+
+def test_prefetch_cache_is_bounded(prefetch_state, monkeypatch):
+    state, session = prefetch_state
+    monkeypatch.setattr(bot, 'PREFETCH_CACHE_SIZE', 2)
+    for user_id in (1, 2, 3):
+        state.store_prefetched_question(user_id, bot.build_question(session, 'hiragana_to_romaji'))
+    assert list(state.prefetched_questions) == [2, 3]
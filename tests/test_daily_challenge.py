@@ -0,0 +1,102 @@
+import copy
+
+import pytest
+
+import daily_challenge
+from daily_challenge import DAILY_OPTIONS, DailyChallenge, DailyChallenges, DailyResults
+from deck_registry import DeckCatalog
+from japanese_data import ALL_SYMBOLS, QUIZ_TYPES
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return DeckCatalog(QUIZ_TYPES, ALL_SYMBOLS)
+
+
+def with_version(catalog, version):
+    other = copy.copy(catalog)
+    other.version = version
+    return other
+
+
+def contents(challenge):
+    return [(q.quiz_type, q.symbol, q.correct_option, q.text) for q in challenge.questions]
+
+
+def test_same_day_and_version_give_same_questions(catalog):
+    # Так воркеры собирают один и тот же вызов без обмена данными
+    assert contents(DailyChallenge('2026-10-19', catalog)) == contents(DailyChallenge('2026-10-19', catalog))
+
+
+def test_day_and_version_change_questions(catalog):
+    today = contents(DailyChallenge('2026-10-19', catalog))
+    assert contents(DailyChallenge('2026-10-20', catalog)) != today
+    assert contents(DailyChallenge('2026-10-19', with_version(catalog, 'other'))) != today
+
+
+def test_questions_are_well_formed(catalog):
+    challenge = DailyChallenge('2026-10-19', catalog)
+    assert len(challenge) == daily_challenge.DAILY_SIZE
+    for index, question in enumerate(challenge.questions):
+        options = [button.text for row in question.markup.inline_keyboard for button in row]
+        assert len(options) == DAILY_OPTIONS == len(set(options))
+        assert options[question.correct_option] == question.answer
+        callbacks = [button.callback_data for row in question.markup.inline_keyboard for button in row]
+        assert callbacks == [f"daily_{index}_{option}" for option in range(DAILY_OPTIONS)]
+
+
+def test_results():
+    results = DailyResults(3)
+    results.record_answer(0, True)
+    results.record_answer(0, False)
+    results.record_answer(1, True)
+    results.record_finish(1)
+    results.record_finish(3)
+    results.record_finish(3)
+    assert results.finished == 3
+    assert results.average() == pytest.approx(7 / 3)
+    assert results.beaten_share(3) == pytest.approx(1 / 3)
+    assert results.hardest() == (0, 0.5)
+
+
+class Registry:
+    def __init__(self, current):
+        self.current = current
+
+
+def test_rebuilt_when_day_changes(catalog, monkeypatch):
+    registry = Registry(catalog)
+    challenges = DailyChallenges(registry)
+    monkeypatch.setattr(daily_challenge, 'today', lambda: '2026-10-19')
+    first = challenges.today()
+    first.results.started = 5
+    assert challenges.today() is first
+    monkeypatch.setattr(daily_challenge, 'today', lambda: '2026-10-20')
+    second = challenges.today()
+    assert second.day == '2026-10-20'
+    # Итоги нового дня начинаются с нуля
+    assert second.results.started == 0
+
+
+def test_rebuilt_with_results_when_catalog_changes(catalog, monkeypatch):
+    registry = Registry(catalog)
+    challenges = DailyChallenges(registry)
+    monkeypatch.setattr(daily_challenge, 'today', lambda: '2026-10-19')
+    first = challenges.today()
+    first.results.started = 4
+    first.results.record_answer(0, True)
+    first.results.record_finish(7)
+
+    registry.current = with_version(catalog, 'reloaded')
+    second = challenges.today()
+    assert second is not first
+    assert second.catalog_version == 'reloaded'
+    assert contents(second) == contents(DailyChallenge('2026-10-19', registry.current))
+    # Кто начал и закончил, остаются в итогах дня; счетчики по вопросам - уже о других вопросах
+    assert second.results.started == 4
+    assert second.results.histogram[7] == 1
+    assert second.results.answers[0] == [0, 0]
+    # Копия, а не общий список: новые итоги не меняют старые
+    second.results.record_finish(2)
+    assert first.results.finished == 1
+    assert challenges.today() is second
@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+from group_quiz import GroupGame, answer_matcher, answer_words, draw_round_symbol
+
+MEANING_QUIZ = {
+    'answer_type': 'meaning',
+    'data': {
+        '日': {'meaning': 'солнце, день'},
+        '水': {'meaning': 'вода'},
+        '金': {'meaning': 'золото, металл'},
+        '青': {'meaning': 'синий; зелёный'},
+        '今': {'meaning': 'сейчас / теперь'},
+        '木': {'meaning': 'дерево'},
+    },
+}
+ROMAJI_QUIZ = {'answer_type': 'romaji', 'data': {'か': {'romaji': 'ka'}}}
+SYMBOL_QUIZ = {'answer_type': 'symbol', 'data': {'か': {'romaji': 'ka'}}}
+
+
+def test_answer_words():
+    assert answer_words("  Солнце,  ДЕНЬ! ") == ('солнце', 'день')
+    assert answer_words("ЗЕЛЁНЫЙ") == ('зеленый',)
+    assert answer_words("...") == ()
+
+
+@pytest.mark.parametrize('symbol, answer', [
+    ('水', 'вода'),
+    ('水', 'это вода!'),
+    ('日', 'день'),
+    ('日', 'солнце'),
+    ('日', 'солнце, день'),
+    ('金', 'металл'),
+    ('青', 'зеленый'),
+    ('今', 'теперь'),
+])
+def test_meaning_accepts_variants(symbol, answer):
+    assert answer_matcher(MEANING_QUIZ, symbol)(answer)
+
+
+@pytest.mark.parametrize('symbol, answer', [
+    # Одна буква или кусок слова раньше выигрывали раунд как подстрока значения
+    ('水', 'в'),
+    ('水', 'о'),
+    ('水', 'вод'),
+    ('日', 'д'),
+    ('木', 'дерево'[:3]),
+    ('水', ''),
+    ('水', '   '),
+    # И наоборот: значение внутри другого слова не считается
+    ('水', 'водами'),
+    ('日', 'понедельник'),
+])
+def test_meaning_rejects_fragments(symbol, answer):
+    assert not answer_matcher(MEANING_QUIZ, symbol)(answer)
+
+
+def test_romaji_and_symbol_are_exact():
+    assert answer_matcher(ROMAJI_QUIZ, 'か')('ka')
+    assert not answer_matcher(ROMAJI_QUIZ, 'か')('k')
+    assert not answer_matcher(ROMAJI_QUIZ, 'か')('kaa')
+    assert answer_matcher(SYMBOL_QUIZ, 'か')('か')
+    assert not answer_matcher(SYMBOL_QUIZ, 'か')('ka')
+
+
+def test_first_correct_answer_wins_round():
+    game = GroupGame('kanji')
+    game.new_round(MEANING_QUIZ, '水', 'v1')
+    game.question_message_id = 10
+    assert not game.try_answer(1, 'Аня', 'в')
+    assert not game.try_answer(2, 'Боря', 'огонь')
+    assert game.try_answer(3, 'Вера', ' Вода ')
+    assert not game.try_answer(1, 'Аня', 'вода')
+    assert game.scores == {3: 1}
+    assert game.late_answers == 1
+
+
+def test_reply_to_old_question_is_late():
+    game = GroupGame('kanji')
+    game.new_round(MEANING_QUIZ, '水', 'v1')
+    game.question_message_id = 10
+    assert not game.try_answer(1, 'Аня', 'вода', reply_to_message_id=9)
+    assert game.try_answer(1, 'Аня', 'вода', reply_to_message_id=10)
+
+
+def test_new_round_never_repeats_previous_symbol():
+    random.seed(0)
+    symbols = ('あ', 'い')
+    previous = None
+    for _ in range(200):
+        symbol = draw_round_symbol(symbols, previous)
+        assert symbol != previous
+        previous = symbol
+
+
+def test_single_symbol_deck_can_repeat():
+    assert draw_round_symbol(('あ',), 'あ') == 'あ'
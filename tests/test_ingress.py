@@ -0,0 +1,69 @@
+from ingress import CallbackGate
+
+
+def test_duplicate_within_window():
+    gate = CallbackGate(window=1.0)
+    assert not gate.is_duplicate(1, 10, 'answer_あ', now=100.0)
+    assert gate.is_duplicate(1, 10, 'answer_あ', now=100.5)
+    # Окно считается от первого нажатия: повтор его не продлевает
+    assert not gate.is_duplicate(1, 10, 'answer_あ', now=101.0)
+    assert gate.dropped == {'duplicate': 1, 'stale': 0}
+
+
+def test_different_presses_are_not_duplicates():
+    gate = CallbackGate(window=1.0)
+    assert not gate.is_duplicate(1, 10, 'answer_あ', now=0.0)
+    assert not gate.is_duplicate(2, 10, 'answer_あ', now=0.1)
+    assert not gate.is_duplicate(1, 11, 'answer_あ', now=0.2)
+    assert not gate.is_duplicate(1, 10, 'answer_い', now=0.3)
+
+
+def test_zero_window_disables_dedup():
+    gate = CallbackGate(window=0)
+    assert not gate.is_duplicate(1, 10, 'next_kanji', now=0.0)
+    assert not gate.is_duplicate(1, 10, 'next_kanji', now=0.0)
+
+
+def test_recent_presses_are_bounded():
+    gate = CallbackGate(window=60.0, max_entries=3)
+    for message_id in range(10):
+        gate.is_duplicate(1, message_id, 'next_kanji', now=0.0)
+    assert len(gate._recent) <= 3
+
+
+def test_stale_question_buttons():
+    gate = CallbackGate()
+    session = {'current_question_message_id': 5, 'waiting_for_answer': True, 'batch_symbols': None}
+    assert not gate.is_stale(session, 5, 'answer_あ')
+    assert gate.is_stale(session, 4, 'answer_あ')
+    assert gate.is_stale(session, None, 'next_kanji')
+    # Меню и прочие кнопки не привязаны к вопросу
+    assert not gate.is_stale(session, 4, 'back_to_menu')
+    assert gate.dropped['stale'] == 2
+
+
+def test_answer_after_question_is_closed():
+    gate = CallbackGate()
+    answered = {'current_question_message_id': 5, 'waiting_for_answer': False}
+    assert gate.is_stale(answered, 5, 'answer_あ')
+    # Кнопка "следующий вопрос" на том же сообщении остается живой
+    assert not gate.is_stale(answered, 5, 'next_kanji')
+    batch = {'current_question_message_id': 5, 'waiting_for_answer': True, 'batch_symbols': ['あ']}
+    assert gate.is_stale(batch, 5, 'answer_あ')
+
+
+def test_take_report_returns_increments():
+    gate = CallbackGate(window=1.0)
+    gate.is_duplicate(1, 1, 'x', now=0.0)
+    gate.is_duplicate(1, 1, 'x', now=0.1)
+    assert gate.take_report() == {'duplicate': 1, 'stale': 0}
+    assert gate.take_report() == {'duplicate': 0, 'stale': 0}
+
+
+def test_same_button_on_new_question_is_not_duplicate():
+    gate = CallbackGate(window=1.0)
+    # Сообщение с вопросом правится на месте: номер тот же, поколение вопроса новое
+    assert not gate.is_duplicate(1, 10, 'next_kanji', (1, 0), now=0.0)
+    assert not gate.is_duplicate(1, 10, 'next_kanji', (2, 1), now=0.2)
+    assert gate.is_duplicate(1, 10, 'next_kanji', (2, 1), now=0.3)
+    assert gate.dropped['duplicate'] == 1
@@ -0,0 +1,84 @@
+import random
+
+import pytest
+
+from leaderboard import (
+    IndexableSkipList, Leaderboard, Leaderboards, MIN_QUESTIONS_FOR_ACCURACY, accuracy_key, score_key,
+)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_skip_list_matches_sorted_list(seed):
+    rng = random.Random(seed)
+    random.seed(seed)
+    skip_list = IndexableSkipList()
+    expected = []
+    for _ in range(2000):
+        key = rng.randrange(500)
+        if key in expected and rng.random() < 0.5:
+            assert skip_list.remove(key)
+            expected.remove(key)
+        elif key not in expected:
+            skip_list.insert(key)
+            expected.append(key)
+            expected.sort()
+    assert len(skip_list) == len(expected)
+    assert list(skip_list.iter_from(1)) == expected
+    for position, key in enumerate(expected, 1):
+        assert skip_list.rank(key) == position
+        assert skip_list.at_rank(position) == key
+
+
+def test_skip_list_ranges():
+    skip_list = IndexableSkipList()
+    for key in range(10, 0, -1):
+        skip_list.insert(key)
+    assert list(skip_list.iter_from(4)) == [4, 5, 6, 7, 8, 9, 10]
+    assert list(skip_list.iter_from(10)) == [10]
+    assert list(skip_list.iter_from(0)) == []
+    assert list(skip_list.iter_from(11)) == []
+    assert skip_list.at_rank(0) is None
+    assert skip_list.at_rank(11) is None
+
+
+def test_skip_list_missing_keys():
+    skip_list = IndexableSkipList()
+    assert skip_list.rank(1) is None
+    assert not skip_list.remove(1)
+    skip_list.insert(2)
+    assert skip_list.rank(1) is None
+    assert skip_list.rank(3) is None
+    assert not skip_list.remove(3)
+    assert skip_list.remove(2)
+    assert len(skip_list) == 0
+    assert skip_list.level == 1
+
+
+def test_leaderboard_moves_user_on_update():
+    board = Leaderboard()
+    board.set(1, score_key(1, 5, 10))
+    board.set(2, score_key(2, 7, 10))
+    board.set(3, score_key(3, 7, 8))
+    # Равный счет: выше тот, кто ошибался реже
+    assert [key[2] for key in board.top(3)] == [3, 2, 1]
+    board.set(1, score_key(1, 9, 10))
+    assert board.rank(1) == 1
+    assert len(board) == 3
+    board.set(2, None)
+    assert board.rank(2) is None
+    assert [key[2] for key in board.top(10)] == [1, 3]
+
+
+def test_accuracy_needs_enough_answers():
+    assert accuracy_key(1, 5, MIN_QUESTIONS_FOR_ACCURACY - 1) is None
+    assert accuracy_key(1, 5, MIN_QUESTIONS_FOR_ACCURACY) is not None
+    assert score_key(1, 0, 0) is None
+
+
+def test_leaderboards_user_ids_and_reset():
+    boards = Leaderboards()
+    boards.update(1, None, 3, 4)
+    boards.update(2, 'kanji', 1, 1)
+    assert boards.user_ids() == {1, 2}
+    boards.reset_user(2)
+    assert boards.user_ids() == {1}
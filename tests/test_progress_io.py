@@ -0,0 +1,49 @@
+import asyncio
+import gzip
+import sys
+
+import pytest
+
+from progress_io import export_progress, import_progress, open_progress_file, write_progress_file
+from session_store import InMemorySessionStore, new_session
+
+
+def store_with(users):
+    store = InMemorySessionStore()
+    for user_id in users:
+        session = new_session()
+        session['score'] = user_id
+        store.save(user_id, session)
+    return store
+
+
+def test_export_import_roundtrip(tmp_path):
+    path = str(tmp_path / 'progress.jsonl.gz')
+    assert asyncio.run(export_progress(store_with([1, 2, 3]), path)) == 3
+    restored = InMemorySessionStore()
+    assert asyncio.run(import_progress(restored, path, keep=lambda user_id: user_id != 2)) == 2
+    sessions = asyncio.run(restored.load_many([1, 2, 3]))
+    assert {user_id: session['score'] for user_id, session in sessions.items()} == {1: 1, 3: 3}
+
+
+def test_stdout_is_not_closed(capsys):
+    with open_progress_file('-', 'w') as f:
+        assert f is sys.stdout
+    with write_progress_file('-') as f:
+        f.write('x\n')
+    assert not sys.stdout.closed
+    print('still open')
+    assert capsys.readouterr().out == 'x\nstill open\n'
+
+
+def test_failed_export_keeps_previous_file(tmp_path):
+    path = str(tmp_path / 'progress.jsonl.gz')
+    asyncio.run(export_progress(store_with([1]), path))
+    with pytest.raises(RuntimeError):
+        with write_progress_file(path) as f:
+            f.write('partial')
+            raise RuntimeError("остановлен посреди записи")
+    # Старая копия цела, временный файл убран
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        assert len(f.readlines()) == 2
+    assert [p.name for p in tmp_path.iterdir()] == ['progress.jsonl.gz']
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from telegram.error import Forbidden, RetryAfter
+
+from reminders import RateLimitedSender, ReminderSchedule
+
+
+def test_pop_expired_by_bucket():
+    schedule = ReminderSchedule(resolution=60)
+    schedule.schedule(1, 100)   # корзина 2: срок 120
+    schedule.schedule(2, 119)   # та же корзина
+    schedule.schedule(3, 121)   # корзина 3: срок 180
+    assert len(schedule) == 3
+    # Срок округляется вверх: раньше назначенного никто не получает напоминание
+    assert schedule.pop_expired(100) == []
+    assert sorted(schedule.pop_expired(120)) == [1, 2]
+    assert schedule.pop_expired(179) == []
+    assert schedule.pop_expired(10_000) == [3]
+    assert len(schedule) == 0
+
+
+def test_reschedule_moves_user_between_buckets():
+    schedule = ReminderSchedule(resolution=10)
+    schedule.schedule(1, 5)
+    schedule.schedule(1, 50)
+    assert schedule.pop_expired(40) == []
+    assert 1 in schedule
+    assert schedule.pop_expired(50) == [1]
+    assert 1 not in schedule
+
+
+def test_cancel_and_reuse_of_emptied_bucket():
+    schedule = ReminderSchedule(resolution=10)
+    schedule.schedule(1, 5)
+    schedule.cancel(1)
+    schedule.cancel(1)
+    # Номер пустой корзины остался в куче; новая корзина с тем же номером не дублирует пользователя
+    schedule.schedule(2, 5)
+    assert schedule.pop_expired(10) == [2]
+    assert schedule.pop_expired(10) == []
+
+
+def test_take_removes_matching_users():
+    schedule = ReminderSchedule(resolution=10)
+    for user_id in range(6):
+        schedule.schedule(user_id, 100 + user_id)
+    taken = schedule.take(lambda user_id: user_id % 2 == 0)
+    assert taken == {0: 100, 2: 110, 4: 110}
+    assert sorted(schedule.pop_expired(1000)) == [1, 3, 5]
+
+
+def test_save_and_load_with_filter(tmp_path):
+    path = str(tmp_path / "reminders.json")
+    schedule = ReminderSchedule(resolution=10)
+    schedule.schedule(1, 15)
+    schedule.schedule(2, 25)
+    schedule.save(path)
+
+    restored = ReminderSchedule(resolution=10)
+    assert restored.load(path, keep=lambda user_id: user_id == 2) == 1
+    assert 2 in restored and 1 not in restored
+    assert restored.pop_expired(30) == [2]
+    assert ReminderSchedule().load(str(tmp_path / "missing.json")) == 0
+
+
+class FakeBot:
+    def __init__(self, failures):
+        self.failures = failures
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        failure = self.failures.pop(chat_id, None)
+        if failure is not None:
+            raise failure
+        self.sent.append(chat_id)
+
+
+def test_sender_retries_after_flood_control_and_reports_blocked():
+    bot = FakeBot({2: RetryAfter(0), 3: Forbidden("blocked")})
+    sender = RateLimitedSender(rate=1000)
+    messages = [(user_id, "повтори", None) for user_id in (1, 2, 3)]
+    blocked = asyncio.run(sender.send_batch(bot, messages))
+    assert bot.sent == [1, 2]
+    assert blocked == [3]
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+
+import pytest
+
+from session_store import (
+    InMemorySessionStore, LocalRespServer, RespConnection, RespError, SessionStore, encode_command, read_reply,
+)
+
+
+def parse(data: bytes):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await read_reply(reader)
+    return asyncio.run(run())
+
+
+def test_encode_command():
+    assert encode_command('SET', 'key', 42) == b'*3\r\n$3\r\nSET\r\n$3\r\nkey\r\n$2\r\n42\r\n'
+
+
+def test_encode_command_bytes_and_unicode():
+    # Длина - в байтах, а не в символах
+    assert encode_command(b'\x00\r\n', 'あ') == b'*2\r\n$3\r\n\x00\r\n\r\n$3\r\n\xe3\x81\x82\r\n'
+
+
+def test_encoded_command_reads_back():
+    assert parse(encode_command('MSET', 'a', b'1')) == [b'MSET', b'a', b'1']
+
+
+@pytest.mark.parametrize('data, expected', [
+    (b'+OK\r\n', 'OK'),
+    (b':-7\r\n', -7),
+    (b'$5\r\nhe\r\no\r\n', b'he\r\no'),
+    (b'$-1\r\n', None),
+    (b'*-1\r\n', None),
+    (b'*2\r\n$1\r\na\r\n*1\r\n:1\r\n', [b'a', [1]]),
+])
+def test_read_reply(data, expected):
+    assert parse(data) == expected
+
+
+def test_read_reply_error_is_returned_not_raised():
+    reply = parse(b'-ERR wrong type\r\n')
+    assert isinstance(reply, RespError)
+    assert str(reply) == 'ERR wrong type'
+
+
+def test_read_reply_closed_connection():
+    with pytest.raises(ConnectionError):
+        parse(b'')
+
+
+def test_session_store_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore()
+    assert InMemorySessionStore().is_local
+
+
+def test_pipelined_commands_against_local_server():
+    async def run():
+        server = LocalRespServer()
+        port = await server.start()
+        connection = RespConnection('127.0.0.1', port)
+        try:
+            # Запись без ожидания до подключения уходит фоновой задачей и не теряется
+            connection.send_nowait(('SET', 'a', '1'))
+            await connection.wait_background()
+            connection.send_nowait(('SET', 'b', '2'), ('DEL', 'missing'))
+            replies = await connection.execute(('MGET', 'a', 'b', 'c'), ('PING',))
+            with pytest.raises(RespError):
+                await connection.execute(('NOSUCH',))
+            return replies
+        finally:
+            await connection.close()
+            await server.stop()
+
+    assert asyncio.run(run()) == [[b'1', b'2', None], 'PONG']
+
+
+def test_background_write_failure_is_logged(caplog):
+    async def run():
+        server = LocalRespServer()
+        port = await server.start()
+        await server.stop()
+        connection = RespConnection('127.0.0.1', port)
+        connection.send_nowait(('SET', 'a', '1'))
+        await connection.wait_background()
+        return connection
+
+    with caplog.at_level(logging.ERROR, logger='session_store'):
+        connection = asyncio.run(run())
+    assert not connection._background
+    assert "Отложенная запись в хранилище не удалась" in caplog.text
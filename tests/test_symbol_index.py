@@ -0,0 +1,65 @@
+import pytest
+
+from symbol_index import DeckQueryError, SymbolIndex, iter_bits, symbol_script, symbol_voicing
+
+SYMBOLS = {
+    'あ': {},
+    'が': {},
+    'ぱ': {},
+    'カ': {},
+    'ガ': {},
+    '水': {'jlpt': 5, 'strokes': 4, 'radicals': ['水']},
+    '海': {'jlpt': 4, 'strokes': 9, 'radicals': ['氵', '毎']},
+    '泳': {'jlpt': 3, 'strokes': 8, 'radicals': ['氵']},
+    '日': {'jlpt': 5, 'strokes': 4, 'radicals': ['日']},
+}
+
+
+@pytest.fixture
+def index():
+    return SymbolIndex(SYMBOLS)
+
+
+def test_iter_bits():
+    assert list(iter_bits(0)) == []
+    assert list(iter_bits(0b101001)) == [0, 3, 5]
+    assert list(iter_bits(1 << 200)) == [200]
+
+
+def test_metadata_helpers():
+    assert [symbol_script(s) for s in 'あカ水a'] == ['hiragana', 'katakana', 'kanji', 'other']
+    assert [symbol_voicing(s) for s in 'がぱあ'] == ['dakuten', 'handakuten', 'none']
+
+
+def test_mask_round_trip(index):
+    mask = index.mask_of(['海', 'あ', 'нет такого'])
+    assert index.symbols_of(mask) == ['あ', '海']
+    assert index.symbols_of(index.all_mask) == list(SYMBOLS)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('', list(SYMBOLS)),
+    ('script:kanji', ['水', '海', '泳', '日']),
+    ('script:hiragana,katakana voicing:dakuten', ['が', 'ガ']),
+    ('voicing:handakuten', ['ぱ']),
+    ('jlpt:N5', ['水', '日']),
+    ('jlpt:5,n4', ['水', '海', '日']),
+    ('radical:氵', ['海', '泳']),
+    ('script:kanji -radical:氵', ['水', '日']),
+    ('strokes:4-8', ['水', '泳', '日']),
+    ('script:kanji -strokes:1-4', ['海', '泳']),
+    ('-script:kanji -voicing:none', ['が', 'ぱ', 'ガ']),
+    ('jlpt:N1', []),
+])
+def test_query(index, text, expected):
+    assert index.symbols_of(index.query(text)) == expected
+
+
+def test_negation_stays_inside_catalog(index):
+    assert index.query('-jlpt:N1') == index.all_mask
+
+
+@pytest.mark.parametrize('text', ['script', 'script:', 'color:red', 'strokes:a-b'])
+def test_query_errors(index, text):
+    with pytest.raises(DeckQueryError):
+        index.query(text)
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from deck_registry import DeckCatalog
+from japanese_data import ALL_SYMBOLS, QUIZ_TYPES
+from symbol_rankings import SymbolRanking, SymbolRankings
+from symbol_stats import DIRECTIONS, STATS_DTYPE
+
+QUIZ = 'hiragana_to_romaji'
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return DeckCatalog(QUIZ_TYPES, ALL_SYMBOLS)
+
+
+@pytest.fixture
+def stats(catalog):
+    return np.zeros(len(catalog.index) * DIRECTIONS, dtype=STATS_DTYPE)
+
+
+def test_built_from_nonzero_stats(catalog, stats):
+    a, b, c, d = (int(key) for key in catalog.deck_keys(QUIZ)[:4])
+    stats[[a, b, c]] = [-3, 5, -1]
+    ranking = SymbolRanking(catalog, QUIZ, stats)
+    assert ranking.values == {a: -3, b: 5, c: -1}
+    assert ranking.weakest(5) == [(a, -3), (c, -1)]
+    assert ranking.strongest(5) == [(b, 5)]
+    assert d not in ranking.values
+
+
+def test_insert_move_and_remove(catalog, stats):
+    a, b, c = (int(key) for key in catalog.deck_keys(QUIZ)[:3])
+    ranking = SymbolRanking(catalog, QUIZ, stats)
+    ranking.set(a, -2)
+    ranking.set(b, -4)
+    ranking.set(c, 1)
+    assert ranking.weakest(1) == [(b, -4)]
+    assert ranking.weakest(10) == [(b, -4), (a, -2)]
+    # Символ выучили: переходит из трудных в выученные
+    ranking.set(b, 6)
+    assert ranking.weakest(10) == [(a, -2)]
+    assert ranking.strongest(10) == [(b, 6), (c, 1)]
+    # Нулевой счетчик ничего не говорит о символе и уходит из списка
+    ranking.set(c, 0)
+    assert ranking.strongest(10) == [(b, 6)]
+    assert len(ranking.entries) == 2
+    # Повтор того же значения ничего не меняет
+    ranking.set(a, -2)
+    assert len(ranking.entries) == 2
+
+
+def test_ties_and_limits(catalog, stats):
+    keys = [int(key) for key in catalog.deck_keys(QUIZ)[:6]]
+    ranking = SymbolRanking(catalog, QUIZ, stats)
+    for key in keys:
+        ranking.set(key, -1)
+    # Равные delta упорядочены по ключу, k ограничивает выдачу
+    assert ranking.weakest(3) == [(key, -1) for key in sorted(keys)[:3]]
+    assert ranking.strongest(3) == []
+
+
+def test_membership(catalog):
+    ranking = SymbolRanking(catalog, QUIZ, np.zeros(len(catalog.index) * DIRECTIONS, dtype=STATS_DTYPE))
+    key = int(catalog.deck_keys(QUIZ)[0])
+    assert key in ranking
+    # Тот же символ в другом направлении и символ другого набора - не из этого рейтинга
+    assert int(catalog.deck_keys('romaji_to_hiragana')[0]) not in ranking
+    assert int(catalog.deck_keys('kanji')[0]) not in ranking
+
+
+def test_rankings_follow_answers(catalog, stats):
+    rankings = SymbolRankings()
+    session = {'symbols_stats': stats, 'stats_version': 0}
+    key = int(catalog.deck_keys(QUIZ)[0])
+    ranking = rankings.ranking(1, session, catalog, QUIZ)
+    assert ranking.weakest(5) == []
+
+    stats[key] = -1
+    session['stats_version'] = 1
+    rankings.update(1, session, catalog, [key], previous_version=0)
+    assert rankings.ranking(1, session, catalog, QUIZ) is ranking
+    assert ranking.weakest(5) == [(key, -1)]
+
+
+def test_rankings_rebuilt_after_outside_change(catalog, stats):
+    rankings = SymbolRankings()
+    session = {'symbols_stats': stats, 'stats_version': 0}
+    key = int(catalog.deck_keys(QUIZ)[0])
+    ranking = rankings.ranking(1, session, catalog, QUIZ)
+    # Статистику поменяли в обход рейтингов: версия разошлась, обновление отбрасывается
+    stats[key] = 3
+    session['stats_version'] = 2
+    rankings.update(1, session, catalog, [key], previous_version=1)
+    assert 1 not in rankings.users
+    rebuilt = rankings.ranking(1, session, catalog, QUIZ)
+    assert rebuilt is not ranking
+    assert rebuilt.strongest(5) == [(key, 3)]
+
+
+def test_rankings_cache_is_bounded(catalog, stats):
+    rankings = SymbolRankings(size=2)
+    session = {'symbols_stats': stats, 'stats_version': 0}
+    for user_id in (1, 2, 3):
+        rankings.ranking(user_id, session, catalog, QUIZ)
+    assert list(rankings.users) == [2, 3]
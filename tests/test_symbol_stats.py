@@ -0,0 +1,87 @@
+import logging
+from types import SimpleNamespace
+
+import numpy as np
+
+from symbol_index import SymbolIndex
+from symbol_stats import DIRECTIONS, RECALL, RECOGNITION, _remap_stats, empty_stats, stats_key, sync_session
+
+OLD_SYMBOLS = ('あ', 'い', 'う')
+# В новой версии い убран, а え добавлен в начало
+NEW_SYMBOLS = ('え', 'あ', 'う')
+
+
+def registry(tables=None):
+    index = SymbolIndex({symbol: {} for symbol in NEW_SYMBOLS})
+    symbol_tables = {'old': OLD_SYMBOLS, 'new': NEW_SYMBOLS} if tables is None else tables
+    catalog = SimpleNamespace(index=index, version='new')
+
+    def remap_mask(mask, version):
+        if version is None or version == 'new':
+            return mask
+        symbols = symbol_tables.get(version)
+        if symbols is None:
+            return None
+        return index.mask_of(symbols[bit] for bit in range(len(symbols)) if mask >> bit & 1)
+
+    return SimpleNamespace(current=catalog, symbol_tables=symbol_tables, remap_mask=remap_mask)
+
+
+def test_remap_from_known_version():
+    stats = {stats_key(0, RECOGNITION): 3, stats_key(1, RECALL): -2, stats_key(2, RECALL): 5}
+    result = _remap_stats(stats, registry(), 'old', len(NEW_SYMBOLS))
+    expected = empty_stats(len(NEW_SYMBOLS))
+    expected[stats_key(1, RECOGNITION)] = 3  # あ переехал с 0 на 1
+    expected[stats_key(2, RECALL)] = 5  # う остался на 2, い пропал
+    assert result.dtype == expected.dtype
+    assert np.array_equal(result, expected)
+
+
+def test_remap_from_dense_array():
+    stats = empty_stats(len(OLD_SYMBOLS))
+    stats[stats_key(2, RECOGNITION)] = 7
+    result = _remap_stats(stats, registry(), 'old', len(NEW_SYMBOLS))
+    assert result[stats_key(2, RECOGNITION)] == 7
+    assert np.count_nonzero(result) == 1
+
+
+def test_current_version_keeps_keys():
+    stats = {stats_key(0, RECALL): 4, 99: 1}
+    result = _remap_stats(stats, registry(), 'new', len(NEW_SYMBOLS))
+    assert result[stats_key(0, RECALL)] == 4
+    assert np.count_nonzero(result) == 1
+
+
+def test_unknown_version_drops_numeric_keys(caplog):
+    stats = {stats_key(0, RECOGNITION): 3, stats_key(1, RECALL): -2}
+    with caplog.at_level(logging.WARNING, logger='symbol_stats'):
+        result = _remap_stats(stats, registry({'new': NEW_SYMBOLS}), 'lost', len(NEW_SYMBOLS))
+    assert not result.any()
+    assert "отброшено счетчиков 2" in caplog.text
+
+
+def test_unknown_version_still_reads_symbol_keys():
+    # Формат версии 1: счетчик по самому символу достается обоим направлениям
+    result = _remap_stats({'う': 2, 'ん': 1, 0: 9}, registry({}), None, len(NEW_SYMBOLS))
+    assert result[stats_key(2, RECOGNITION)] == 2 and result[stats_key(2, RECALL)] == 2
+    assert np.count_nonzero(result) == DIRECTIONS
+
+
+def test_sync_session_remaps_stats_and_decks():
+    session = {
+        'catalog_version': 'old',
+        'symbols_stats': {stats_key(0, RECALL): 1},
+        'answer_times': object(),
+        'custom_decks': {'known': 0b101},
+    }
+    sync_session(session, registry())
+    assert session['catalog_version'] == 'new'
+    assert session['symbols_stats'][stats_key(1, RECALL)] == 1
+    assert session['answer_times'] is None
+    assert session['custom_decks'] == {'known': 0b110}
+
+
+def test_sync_session_empties_decks_of_unknown_version():
+    session = {'catalog_version': 'lost', 'symbols_stats': {}, 'answer_times': None, 'custom_decks': {'d': 0b11}}
+    sync_session(session, registry({'new': NEW_SYMBOLS}))
+    assert session['custom_decks'] == {'d': 0}
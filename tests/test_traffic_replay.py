@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+from telegram import Update
+
+from load_harness import make_callback_update, make_group_message_update, make_message_update
+from traffic_replay import FLUSH_BYTES, UpdateRecorder, read_records
+
+GROUP = -100500
+
+
+def recorder(tmp_path):
+    return UpdateRecorder(str(tmp_path / 'updates.rec'), salt=b'salt')
+
+
+def record(recorder, data):
+    recorder.record(Update.de_json(data, None))
+
+
+def test_record_only_buffers_until_flush(tmp_path):
+    rec = recorder(tmp_path)
+    record(rec, make_message_update(1, 42, 7, "/start"))
+    record(rec, make_callback_update(2, 42, 8, "quiz_kanji"))
+    assert rec.recorded == 2
+    assert (tmp_path / 'updates.rec').read_bytes() == b''
+    rec.close()
+    records = read_records(rec.path)
+    assert [record[1] for record in records] == ["m", "c"]
+    assert [record[5] for record in records] == ["/start", "quiz_kanji"]
+    # Псевдоним стабилен и не равен настоящему id
+    assert records[0][2] == records[1][2] != 42
+
+
+def test_group_chatter_is_hashed(tmp_path):
+    rec = recorder(tmp_path)
+    record(rec, make_group_message_update(1, GROUP, 42, 10, "привет всем"))
+    record(rec, make_group_message_update(2, GROUP, 43, 11, "привет всем"))
+    record(rec, make_group_message_update(3, GROUP, 42, 12, "/group_quiz kanji"))
+    record(rec, make_group_message_update(4, GROUP, 42, 13, "вода", reply_to_message_id=9))
+    record(rec, make_message_update(5, 42, 14, "вода"))
+    rec.close()
+    payloads = [record[5] for record in read_records(rec.path)]
+    assert payloads[0] == payloads[1] == rec.text_alias("привет всем")
+    assert "привет" not in (tmp_path / 'updates.rec').read_text(encoding='utf-8')
+    assert payloads[2:] == ["/group_quiz kanji", "вода", "вода"]
+    assert json.loads((tmp_path / 'updates.rec').read_text(encoding='utf-8').splitlines()[3])[6] == 9
+
+
+def test_periodic_flush_writes_in_background(tmp_path):
+    rec = recorder(tmp_path)
+
+    async def scenario():
+        task = asyncio.create_task(rec.run_periodic_flush(interval=60))
+        await asyncio.sleep(0)
+        # Переполненный буфер будит запись, не дожидаясь интервала
+        update_id = 0
+        while rec._size < FLUSH_BYTES:
+            update_id += 1
+            record(rec, make_callback_update(update_id, 42, 8, "x" * 60))
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if len(read_records(rec.path)) == update_id:
+                break
+        task.cancel()
+        return update_id
+
+    written = asyncio.run(scenario())
+    assert len(read_records(rec.path)) == written
+    rec.close()
+    assert len(read_records(rec.path)) == written
@@ -0,0 +1,316 @@
+"""
+Запись входящих обновлений с анонимизацией и их прогон через обработчики бота офлайн
+
+Синтетический трафик нажимает кнопки ровно по сценарию, а настоящие
+пользователи нажимают дважды, отвечают на старые вопросы и приходят волнами.
+Записанный трафик прогоняется через те же обработчики с фейковым Bot API
+в реальном темпе, ускоренно или на пределе, и показывает пропускную
+способность и задержку обработки на настоящей форме нагрузки.
+"""
+
+import argparse
+import asyncio
+import atexit
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# Текст сообщения обрезается: для нагрузки важен маршрут, а не то, что написал пользователь
+MAX_TEXT_LENGTH = 32
+# Сколько накопить в памяти, прежде чем досрочно разбудить фоновую запись
+FLUSH_BYTES = 64 * 1024
+# И как долго самое большее держать записи в памяти
+FLUSH_INTERVAL = 5.0
+# Паузы в записи длиннее этой при прогоне сокращаются (ночь без трафика ничего не проверяет)
+MAX_GAP = 10.0
+
+
+class UpdateRecorder:
+    """Дописывает обновления в файл строками [время мс, вид, пользователь, чат, сообщение, текст]
+
+    Вид "m" - текстовое сообщение (текст обрезан до MAX_TEXT_LENGTH),
+    "c" - нажатие кнопки (данные кнопки). Шестым полем может идти номер
+    сообщения бота, на которое ответили в группе. Имена не пишутся, id
+    пользователей и чатов заменяются ключевым хэшем: без соли из файла их
+    не восстановить, а один пользователь остается одним и тем же. Из
+    группового чата текст пишется, только если это команда или ответ на
+    сообщение бота; остальная переписка участников заменяется ключевым хэшем.
+
+    record только копит строки в памяти. На диск их дописывает фоновая
+    задача run_periodic_flush одним write в пуле потоков, так что цикл
+    событий не ждет диска, а записи нескольких процессов не перемешиваются
+    внутри строки. Остаток дописывает close при остановке.
+    """
+
+    def __init__(self, path: str, salt: Optional[bytes] = None, sample: float = 1.0):
+        self.path = path
+        # Без заданной соли псевдонимы меняются при каждом перезапуске процесса
+        self.salt = salt or os.urandom(16)
+        self.sample = sample
+        self._lines: List[bytes] = []
+        self._size = 0
+        # Буфер перерос FLUSH_BYTES: фоновая запись не ждет конца интервала
+        self._full = asyncio.Event()
+        # write из пула потоков не должен встретиться с close уже закрытого файла
+        self._write_lock = threading.Lock()
+        self.recorded = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._fd: Optional[int] = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls) -> Optional['UpdateRecorder']:
+        """RECORD_UPDATES=путь включает запись; RECORD_UPDATES_SALT, RECORD_UPDATES_SAMPLE=доля чатов"""
+        path = os.getenv('RECORD_UPDATES')
+        if not path:
+            return None
+        salt = os.getenv('RECORD_UPDATES_SALT')
+        return cls(path, salt.encode('utf-8') if salt else None, float(os.getenv('RECORD_UPDATES_SAMPLE', '1')))
+
+    def pseudonym(self, real_id: int, scope: str = "") -> int:
+        """Стабильный псевдоним id (знак сохраняется: у групповых чатов id отрицательные)"""
+        digest = hmac.new(self.salt, f"{scope}:{abs(real_id)}".encode(), hashlib.sha256).digest()
+        # 6 байт: влезает в id Telegram и в число JSON без потери точности
+        value = int.from_bytes(digest[:6], 'big') or 1
+        return -value if real_id < 0 else value
+
+    def text_alias(self, text: str) -> str:
+        """Ключевой хэш текста: одинаковые ответы остаются одинаковыми, но сам текст не восстановить"""
+        return "#" + hmac.new(self.salt, text.encode('utf-8'), hashlib.sha256).hexdigest()[:12]
+
+    def record(self, update: Update, scope: str = "") -> None:
+        query = update.callback_query
+        reply_to = None
+        if query is not None:
+            if query.message is None:
+                return
+            kind, user, chat = "c", query.from_user.id, query.message.chat.id
+            message_id, payload = query.message.message_id, query.data or ""
+        else:
+            message = update.message
+            if message is None or message.text is None or message.from_user is None:
+                return
+            kind, user, chat = "m", message.from_user.id, message.chat.id
+            message_id, payload = message.message_id, message.text[:MAX_TEXT_LENGTH]
+            reply = message.reply_to_message
+            if reply is not None and reply.from_user is not None and reply.from_user.is_bot:
+                reply_to = reply.message_id
+            # Личный чат - разговор с ботом, а в группе пишется только обращенное к боту
+            if chat < 0 and reply_to is None and not message.text.startswith('/'):
+                payload = self.text_alias(message.text)
+
+        chat_alias = self.pseudonym(chat, scope)
+        # Выборка по чатам: записанный чат попадает в файл целиком
+        if self.sample < 1.0 and abs(chat_alias) % 10000 >= self.sample * 10000:
+            return
+        record = [int(time.time() * 1000), kind, self.pseudonym(user, scope), chat_alias, message_id, payload]
+        if reply_to is not None:
+            record.append(reply_to)
+        line = (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+        self._lines.append(line)
+        self._size += len(line)
+        self.recorded += 1
+        if self._size >= FLUSH_BYTES:
+            self._full.set()
+
+    def _take_lines(self) -> bytes:
+        data = b''.join(self._lines)
+        self._lines.clear()
+        self._size = 0
+        return data
+
+    def _write(self, data: bytes) -> None:
+        with self._write_lock:
+            if self._fd is not None:
+                os.write(self._fd, data)
+
+    def flush(self) -> None:
+        """Дописывает накопленное синхронно (для остановки, когда цикла событий уже нет)"""
+        data = self._take_lines()
+        if data:
+            self._write(data)
+
+    async def flush_async(self) -> None:
+        """То же, что flush, но запись идет в пуле потоков, вне цикла событий"""
+        self._full.clear()
+        data = self._take_lines()
+        if data:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+
+    async def run_periodic_flush(self, interval: float = FLUSH_INTERVAL) -> None:
+        """Фоновая задача: дописывает записи раз в interval секунд или как только буфер переполнится"""
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush_async()
+            except OSError as e:
+                logger.error("Не удалось дописать запись трафика в %s: %s", self.path, e)
+
+    def close(self) -> None:
+        if self._fd is None:
+            return
+        self.flush()
+        with self._write_lock:
+            os.close(self._fd)
+            self._fd = None
+
+
+def read_records(path: str) -> List[list]:
+    """Записи файла по времени (несколько процессов дописывают пачками, не строго по порядку)"""
+    records = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Недописанная строка после аварийной остановки
+                continue
+    records.sort(key=lambda record: record[0])
+    return records
+
+
+def record_to_update(record: list, update_id: int, bot_message_id: Callable[[int, int], int]) -> Dict[str, Any]:
+    """JSON обновления для записи; номера сообщений бота переводятся в номера фейкового API"""
+    from load_harness import make_callback_update, make_group_message_update, make_message_update
+
+    _, kind, user, chat, message_id, payload = record[:6]
+    if kind == "c":
+        update = make_callback_update(update_id, user, bot_message_id(chat, message_id), payload)
+        update["callback_query"]["message"]["chat"] = {"id": chat, "type": "private" if chat > 0 else "group"}
+        return update
+    if chat < 0:
+        reply_to = record[6] if len(record) > 6 else None
+        return make_group_message_update(update_id, chat, user, message_id, payload,
+                                         None if reply_to is None else bot_message_id(chat, reply_to))
+    return make_message_update(update_id, user, message_id, payload)
+
+
+def schedule(records: List[list], speed: Optional[float], max_gap: float = MAX_GAP) -> np.ndarray:
+    """Когда (в секундах от начала прогона) подать каждую запись; None - без пауз"""
+    if speed is None or not records:
+        return np.zeros(len(records))
+    gaps = np.diff(np.array([record[0] for record in records], dtype=float) / 1000, prepend=records[0][0] / 1000)
+    return np.cumsum(np.minimum(gaps, max_gap)) / speed
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    values = np.array(latencies) * 1000
+    p50, p90, p99 = np.percentile(values, (50, 90, 99))
+    return {
+        'count': len(values),
+        'p50_ms': round(float(p50), 2),
+        'p90_ms': round(float(p90), 2),
+        'p99_ms': round(float(p99), 2),
+        'max_ms': round(float(values.max()), 2),
+    }
+
+
+async def replay(path: str, speed: Optional[float] = None, limit: Optional[int] = None,
+                 max_gap: float = MAX_GAP, api_latency: float = 0.0) -> Dict[str, Any]:
+    """Прогоняет записанные обновления через обработчики бота с фейковым Bot API
+
+    Задержка считается от момента, когда обновление должно было прийти по
+    расписанию, до конца обработки: если бот не успевает за темпом записи,
+    очередь копится и задержка растет, как у настоящих пользователей.
+    """
+    from load_harness import FAKE_TOKEN, FakeTelegramRequest, isolate_persisted_files
+
+    # Прогон не должен сам себя записывать и трогать файлы в data/ (пути читаются при импорте bot)
+    os.environ.pop('RECORD_UPDATES', None)
+    isolate_persisted_files()
+    import bot
+
+    records = read_records(path)[:limit]
+    arrivals = schedule(records, speed, max_gap)
+    request = FakeTelegramRequest(api_latency=api_latency)
+    application = bot.build_application(FAKE_TOKEN, request=request, with_updater=False)
+    sessions = bot.default_bot.state.user_sessions
+    mapped: Dict[Tuple[int, int], int] = {}
+
+    def bot_message_id(chat: int, recorded_id: int) -> int:
+        # Записанное сообщение бота при первом нажатии считаем текущим вопросом чата:
+        # повторные нажатия на него же и на более старые останутся устаревшими
+        key = (chat, recorded_id)
+        if key not in mapped:
+            if chat > 0:
+                current = (sessions.get(chat) or {}).get('current_question_message_id')
+            else:
+                game = bot.group_games.get(chat)
+                current = game.question_message_id if game is not None else None
+            mapped[key] = current or recorded_id
+        return mapped[key]
+
+    latencies: List[float] = []
+    by_route: Dict[str, List[float]] = {}
+    async with application:
+        started = time.perf_counter()
+        for update_id, (record, arrival) in enumerate(zip(records, arrivals), start=1):
+            # Без пауз обновление приходит тогда, когда бот готов его взять
+            due = started + arrival if speed is not None else time.perf_counter()
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            update = Update.de_json(record_to_update(record, update_id, bot_message_id), application.bot)
+            await application.process_update(update)
+            latency = time.perf_counter() - due
+            latencies.append(latency)
+            by_route.setdefault(bot.update_route(update), []).append(latency)
+        elapsed = time.perf_counter() - started
+
+    return {
+        'updates': len(records),
+        'elapsed_s': round(elapsed, 2),
+        'updates_per_s': round(len(records) / elapsed, 1) if elapsed else 0.0,
+        'latency': latency_summary(latencies) if latencies else {},
+        'routes': {route: latency_summary(values) for route, values in sorted(by_route.items())},
+        'dropped_callbacks': dict(bot.default_bot.callback_gate.dropped),
+        'api_calls': dict(request.calls),
+    }
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    print(f"Обновлений: {result['updates']}, время: {result['elapsed_s']} с, {result['updates_per_s']} обн/с")
+    if result['latency']:
+        latency = result['latency']
+        print(f"Задержка: p50 {latency['p50_ms']} мс, p90 {latency['p90_ms']} мс, "
+              f"p99 {latency['p99_ms']} мс, max {latency['max_ms']} мс")
+    print(f"{'маршрут':<20} {'обновлений':>10} {'p50, мс':>9} {'p99, мс':>9} {'max, мс':>9}")
+    for route, summary in result['routes'].items():
+        print(f"{route:<20} {summary['count']:>10} {summary['p50_ms']:>9} {summary['p99_ms']:>9} {summary['max_ms']:>9}")
+    print(f"Отброшено нажатий: {result['dropped_callbacks']}")
+
+
+def parse_speed(text: str) -> Optional[float]:
+    """'1', '10' - во сколько раз быстрее записи; 'max' - без пауз"""
+    return None if text == 'max' else float(text)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Прогон записанного трафика через обработчики бота")
+    parser.add_argument("path", help="Файл, записанный с RECORD_UPDATES")
+    parser.add_argument("--speed", type=parse_speed, default=None, help="1, 10 или max (по умолчанию max)")
+    parser.add_argument("--limit", type=int, help="Прогнать только первые N обновлений")
+    parser.add_argument("--max-gap", type=float, default=MAX_GAP, help="Паузы длиннее, с, сокращаются до этой")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="Задержка фейкового Bot API")
+    parser.add_argument("--json", action="store_true", help="Отчет одной строкой JSON")
+    args = parser.parse_args()
+
+    # Записанные повторные нажатия отбрасываются как в проде (CALLBACK_DEDUP_WINDOW не трогаем)
+    result = asyncio.run(replay(args.path, args.speed, args.limit, args.max_gap, args.api_latency_ms / 1000))
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+    else:
+        print_report(result)